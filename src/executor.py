@@ -12,6 +12,7 @@ import multiprocessing
 
 from form.MainFrame import MainFrame
 from module.MOptions import MOptions
+from mmd.PmxReader import PmxReader
 from utils.MLogger import MLogger
 from utils import MFileUtils
 from service.SizingService import SizingService
@@ -27,6 +28,8 @@ multiprocessing.freeze_support()
 
 if __name__ == '__main__':
     mydir_path = MFileUtils.get_mydir_path(sys.argv[0])
+    # 解析済みモデルのキャッシュは実行ファイルと同じ場所に保存する
+    PmxReader.cache_dir_path = os.path.join(mydir_path, "cache")
 
     if len(sys.argv) > 3 and "--motion_path" in sys.argv:
         if os.name == "nt":
@@ -301,7 +301,7 @@ class BaseFilePickerCtrl():
             elif input_ext.lower() == ".vpd":
                 reader = VpdReader(file_path)
             elif input_ext.lower() == ".pmx":
-                reader = PmxReader(file_path, is_check=is_check)
+                reader = PmxReader(file_path, is_check=is_check, is_vertex_array=True)
             else:
                 logger.error("%s%s 读取失败（扩展名错误）: %s", display_set_no, self.title, os.path.basename(file_path), decoration=MLogger.DECORATION_BOX)
                 return False
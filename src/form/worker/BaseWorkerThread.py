@@ -92,6 +92,7 @@ def task_takes_time(acallable):
                 for th in threading.enumerate():
                     if th.ident != threading.current_thread().ident:
                         th._kwargs["is_killed"] = True
+                MLogger.kill()
                 break
         
         return t.result()
@@ -203,7 +203,8 @@ class SizingWorkerThread(BaseWorkerThread):
                 now_process=0, \
                 total_process_ctrl=self.frame.file_panel_ctrl.total_process_ctrl, \
                 now_process_ctrl=self.frame.file_panel_ctrl.now_process_ctrl, \
-                tree_process_dict=self.frame.file_panel_ctrl.tree_process_dict)
+                tree_process_dict=self.frame.file_panel_ctrl.tree_process_dict, \
+                is_multi_process=(not self.is_exec_saving and len(data_set_list) > 1))
             
             self.result = SizingService(self.options).execute() and self.result
 
@@ -211,6 +212,9 @@ class SizingWorkerThread(BaseWorkerThread):
         except Exception as e:
             logger.critical("VMD尺寸处理以意外错误结束。", e, decoration=MLogger.DECORATION_BOX)
         finally:
+            # バッファに溜まっているログをファイルに書き込む
+            MLogger.flush()
+
             try:
                 logger.debug("★★★result: %s, is_killed: %s", self.result, self.is_killed)
                 if self.is_out_log or (not self.result and not self.is_killed):
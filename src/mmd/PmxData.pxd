@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 #
+import numpy as np
+cimport numpy as np
 
 from module.MMath cimport MRect, MVector2D, MVector3D, MVector4D, MQuaternion, MMatrix4x4 # noqa
 from module.MParams cimport BoneLinks
@@ -145,6 +147,18 @@ cdef class PmxModel:
     cdef public dict materials
     cdef public dict material_indices
     cdef public dict material_vertices
+    cdef public np.ndarray vertex_positions
+    cdef public np.ndarray vertex_normals
+    cdef public np.ndarray vertex_uvs
+    cdef public np.ndarray vertex_extended_uvs
+    cdef public np.ndarray vertex_deform_types
+    cdef public np.ndarray vertex_bone_indices
+    cdef public np.ndarray vertex_weights
+    cdef public np.ndarray vertex_sdef_params
+    cdef public np.ndarray vertex_edge_factors
+    cdef public np.ndarray face_indices
+    cdef public dict bone_vertex_indices
+    cdef public dict material_vertex_indices
     cdef public dict bones
     cdef public dict bone_indexes
     cdef public dict morphs
@@ -168,3 +182,31 @@ cdef class PmxModel:
     cdef public dict wrist_entity_vertex
     cdef public dict elbow_entity_vertex
     cdef public dict elbow_middle_entity_vertex
+    cdef public dict bone_vertex_positions
+
+cdef int c_find_multi_target_down_front(np.ndarray[np.float64_t, ndim=2] v_positions, double y, double z)
+
+cdef np.ndarray c_transform_points(np.ndarray matrixes, np.ndarray points)
+
+cdef np.ndarray c_calc_lengths(np.ndarray vs)
+
+cdef np.ndarray c_effective_points(np.ndarray vs)
+
+cdef np.ndarray c_calc_clip_acos(np.ndarray vs)
+
+cdef c_shrink_collision_vecs(np.ndarray rep_collision_vecs, np.ndarray distances, np.ndarray root_global_poses, np.ndarray inv_matrixes, np.ndarray local_points, \
+                             double max_length, double min_ratio)
+
+cdef tuple c_calc_collision_vecs(np.ndarray collisions, np.ndarray near_collisions, np.ndarray hit_idxs, np.ndarray local_points, list new_locals, \
+                                 np.ndarray matrixes, np.ndarray shrink_inv_matrixes, np.ndarray root_global_poses, double max_length, double min_ratio)
+
+cdef tuple c_calc_sphere_collisions(MVector3D shape_size, np.ndarray matrixes, np.ndarray points, np.ndarray root_global_poses, \
+                                    double max_length, double min_ratio, double max_ratio, int h_sign, int v_sign)
+
+cdef np.ndarray c_is_in_boxes(MVector3D shape_size, np.ndarray matrixes, np.ndarray points, double ratio)
+
+cdef tuple c_calc_box_collisions(MVector3D shape_size, np.ndarray matrixes, np.ndarray rotated_matrixes, np.ndarray points, np.ndarray root_global_poses, \
+                                 double max_length, double min_ratio, double max_ratio, int h_sign)
+
+cdef tuple c_calc_capsule_collisions(MVector3D shape_size, np.ndarray matrixes, np.ndarray rotated_matrixes, np.ndarray points, np.ndarray root_global_poses, \
+                                     double max_length, double min_ratio, double max_ratio, int h_sign, int v_sign)
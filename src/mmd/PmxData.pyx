@@ -542,6 +542,60 @@ cdef class RigidBody:
             return Capsule(fno, self.shape_size, self.shape_position, self.shape_rotation, self.bone_name, bone_pos, bone_matrix, is_aliginment, \
                                      is_arm_left, self.is_arm_upper, self.is_small, True)
 
+    # 衝突判定の外接球の半径（剛体の原点からこの距離より遠い点は、衝突も近接もしない）
+    # 大まかな判定用なので、計算誤差分の余裕を持たせる
+    def get_collision_radius(self, base_size):
+        # 衝突判定・近接判定で使う倍率のうち大きい方
+        ratio = max(abs(base_size - 0.02), abs(base_size + 0.02))
+
+        if self.shape_type == self.SHAPE_SPHERE:
+            # 球の半径
+            radius = abs(self.shape_size.x()) * ratio
+        elif self.shape_type == self.SHAPE_BOX:
+            # 箱の対角線の半分（近接判定は箱を拡大、衝突判定は元の大きさ）
+            radius = self.shape_size.length() * max(1, ratio)
+        else:
+            # 垂線の足は線分の外側にも線分長まで出るため、原点から線分長の1.5倍まで離れ得る
+            radius = abs(self.shape_size.y()) * 3 + abs(self.shape_size.x()) * ratio
+
+        return radius * 1.01 + 0.01
+
+    # 複数フレーム一括の衝突判定（フレーム毎に get_obb(...).get_collistion(...) するのと同じ判定）
+    # bone_matrixes: 追従ボーンの行列(フレーム数×4×4), points: 判定する点(フレーム数×3), root_global_poses: 腕の位置(フレーム数×3)
+    # 戻り値：(衝突, 近接, X距離, Z+距離, Z-距離, X回避位置, Z+回避位置, Z-回避位置) それぞれフレーム数分の配列
+    def get_collisions(self, bone_pos, bone_matrixes, points, root_global_poses, max_length, base_size, is_arm_left):
+        cdef np.ndarray matrixes, rotated_matrixes
+        cdef MMatrix4x4 rotation_matrix
+
+        # get_collistion と同じく単精度に丸めてから使う
+        cdef float f_max_length = max_length
+        cdef float f_base_size = base_size
+        cdef float min_ratio = f_base_size - 0.02
+        cdef float max_ratio = f_base_size + 0.02
+
+        cdef int h_sign = 1 if is_arm_left else -1
+        cdef int v_sign = -1 if self.is_arm_upper and self.is_small else 1
+
+        # 回転なし行列（剛体自体の位置に移動）
+        matrixes = np.array(bone_matrixes, dtype=np.float64)
+        matrixes[:, :, 3] += np.sum(matrixes[:, :, :3] * (self.shape_position - bone_pos).data(), axis=2)
+
+        # 回転あり行列
+        rotation_matrix = MQuaternion.fromEulerAngles(math.degrees(self.shape_rotation.x()), math.degrees(self.shape_rotation.y()), \
+                                                      math.degrees(self.shape_rotation.z())).toMatrix4x4()
+        rotated_matrixes = np.matmul(matrixes, rotation_matrix.data())
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            if self.shape_type == self.SHAPE_SPHERE:
+                return c_calc_sphere_collisions(self.shape_size, matrixes, np.array(points, dtype=np.float64), np.array(root_global_poses, dtype=np.float64), \
+                                                f_max_length, min_ratio, max_ratio, h_sign, v_sign)
+            elif self.shape_type == self.SHAPE_BOX:
+                return c_calc_box_collisions(self.shape_size, matrixes, rotated_matrixes, np.array(points, dtype=np.float64), np.array(root_global_poses, dtype=np.float64), \
+                                             f_max_length, min_ratio, max_ratio, h_sign)
+            else:
+                return c_calc_capsule_collisions(self.shape_size, matrixes, rotated_matrixes, np.array(points, dtype=np.float64), np.array(root_global_poses, dtype=np.float64), \
+                                                 f_max_length, min_ratio, max_ratio, h_sign, v_sign)
+
 cdef class RigidBodyParam:
     def __init__(self, mass, linear_damping, angular_damping, restitution, friction):
         self.mass = mass
@@ -1066,6 +1120,26 @@ cdef class PmxModel:
         self.material_indices = {}
         # 材質-頂点引き当てデータ（キー：材質名、値：頂点INDEXリスト）
         self.material_vertices = {}
+        # 以下、頂点配列モードで読み込んだ場合のみ（各配列の行は頂点INDEX）
+        # 頂点位置・法線(n x 3)、UV(n x 2)、追加UV(n x 追加UV数 x 4)
+        self.vertex_positions = None
+        self.vertex_normals = None
+        self.vertex_uvs = None
+        self.vertex_extended_uvs = None
+        # ウェイト変形方式（0:BDEF1, 1:BDEF2, 2:BDEF4, 3:SDEF, 4:QDEF）
+        self.vertex_deform_types = None
+        # ボーンINDEX(n x 4、未使用は-1)、ウェイト(n x 4)、SDEFパラメータ(n x 9: C, R0, R1)
+        self.vertex_bone_indices = None
+        self.vertex_weights = None
+        self.vertex_sdef_params = None
+        # エッジ倍率
+        self.vertex_edge_factors = None
+        # 面データ（面 x 3の頂点INDEX）
+        self.face_indices = None
+        # ウェイトボーン-頂点引き当てデータ（キー：ボーンINDEX、値：頂点INDEX配列）
+        self.bone_vertex_indices = {}
+        # 材質-頂点引き当てデータ（キー：材質名、値：頂点INDEX配列（重複なし））
+        self.material_vertex_indices = {}
         # ボーンデータ
         self.bones = {}
         # ボーンINDEXデータ（キー：ボーンINDEX、値：ボーン名）
@@ -1106,6 +1180,8 @@ cdef class PmxModel:
         self.elbow_entity_vertex = {}
         # 左右ひじ手首中間頂点
         self.elbow_middle_entity_vertex = {}
+        # ウェイトボーン毎の頂点INDEXと頂点位置（頂点の端を探す時に一度だけ求める）
+        self.bone_vertex_positions = {}
     
     # ローカルX軸の取得
     def get_local_x_axis(self, bone_name: str):
@@ -1713,32 +1789,90 @@ cdef class PmxModel:
         return down_max_vertex
 
     # 頂点位置を返す（オリジナルそのまま）
-    def def_calc_vertex_pos_original(self, b: Bone, v: Vertex, qq4calc: MQuaternion):
-        return v.position
+    def def_calc_vertex_pos_original(self, b: Bone, v_positions: np.ndarray, qq4calc: MQuaternion):
+        return v_positions
 
-    # 水平にした場合の頂点位置を返す
-    def def_calc_vertex_pos_horizonal(self, b: Bone, v: Vertex, qq4calc: MQuaternion):
-        horzinal_v_pos = qq4calc.inverted() * (v.position - self.bones["{0}ひじ".format(b.name[0])].position)
-        return horzinal_v_pos
+    # 水平にした場合の頂点位置を返す（MQuaternion * MVector3D と同じ計算）
+    def def_calc_vertex_pos_horizonal(self, b: Bone, v_positions: np.ndarray, qq4calc: MQuaternion):
+        cdef np.ndarray mat = qq4calc.inverted().toMatrix4x4().data()
+        cdef np.ndarray local_positions = v_positions - self.bones["{0}ひじ".format(b.name[0])].position.data()
+        return np.sum(local_positions[:, np.newaxis, :] * mat[np.newaxis, :3, :3], axis=2) + mat[:3, 3]
 
     # X軸方向の制限がかかった頂点のみを対象とする
-    def def_is_target_x_limit(self, b: Bone, v: Vertex, v_pos: MVector3D):
-        return v_pos.x() - 0.1 <= b.position.x() <= v_pos.x() + 0.1
+    def def_is_target_x_limit(self, b: Bone, v_positions: np.ndarray):
+        return (v_positions[:, 0] - 0.1 <= b.position.x()) & (b.position.x() <= v_positions[:, 0] + 0.1)
 
-    # 最も底面でかつ前面にある頂点であるか
-    def def_is_multi_target_down_front(self, multi_max_pos: MVector3D, v_pos: MVector3D):
-        return v_pos.y() <= multi_max_pos.y() + 0.1 and v_pos.z() <= multi_max_pos.z()
-    
-    # 最も底面でかつ前面にある頂点であるか
-    def def_is_multi_target_down_front_sole(self, multi_max_pos: MVector3D, v_pos: MVector3D):
-        return v_pos.y() <= multi_max_pos.y() + 0.1 and v_pos.z() <= multi_max_pos.z()
+    # 最も底面でかつ前面にある頂点のINDEX（先頭から順に判定して、最後に条件を満たした頂点）
+    def def_is_multi_target_down_front(self, multi_max_pos: MVector3D, v_positions: np.ndarray):
+        return c_find_multi_target_down_front(v_positions, multi_max_pos.y(), multi_max_pos.z())
     
+    # 最も底面でかつ前面にある頂点のINDEX（先頭から順に判定して、最後に条件を満たした頂点）
+    def def_is_multi_target_down_front_sole(self, multi_max_pos: MVector3D, v_positions: np.ndarray):
+        return c_find_multi_target_down_front(v_positions, multi_max_pos.y(), multi_max_pos.z())
+
+    # 頂点配列モードで読み込んだモデルであるか
+    def is_vertex_array(self):
+        return self.vertex_positions is not None
+
+    # 指定INDEXの頂点（頂点配列モードの場合、配列から頂点データを生成する）
+    def get_vertex(self, vertex_idx: int):
+        if not self.is_vertex_array():
+            return self.vertex_dict[vertex_idx]
+
+        deform_type = self.vertex_deform_types[vertex_idx]
+        bone_indices = self.vertex_bone_indices[vertex_idx].tolist()
+        weights = self.vertex_weights[vertex_idx].tolist()
+        sdef_params = self.vertex_sdef_params[vertex_idx]
+
+        if deform_type == 0:
+            deform = Bdef1(bone_indices[0])
+        elif deform_type == 1:
+            deform = Bdef2(bone_indices[0], bone_indices[1], weights[0])
+        elif deform_type == 2:
+            deform = Bdef4(*(bone_indices + weights))
+        elif deform_type == 3:
+            deform = Sdef(bone_indices[0], bone_indices[1], weights[0], MVector3D(sdef_params[:3]), MVector3D(sdef_params[3:6]), MVector3D(sdef_params[6:]))
+        else:
+            deform = Qdef(bone_indices[0], bone_indices[1], weights[0], MVector3D(sdef_params[:3]), MVector3D(sdef_params[3:6]), MVector3D(sdef_params[6:]))
+
+        return Vertex(vertex_idx, MVector3D(self.vertex_positions[vertex_idx]), MVector3D(self.vertex_normals[vertex_idx]), MVector2D(self.vertex_uvs[vertex_idx]), \
+                      [MVector4D(extended_uv) for extended_uv in self.vertex_extended_uvs[vertex_idx]], deform, float(self.vertex_edge_factors[vertex_idx]))
+
+    # 指定ボーンにウェイトが乗っている頂点があるか
+    def has_bone_vertex(self, bone_idx: int):
+        if self.is_vertex_array():
+            return bone_idx in self.bone_vertex_indices
+
+        return bone_idx in self.vertices
+
+    # 指定ボーンにウェイトが乗っている頂点リスト
+    def get_bone_vertices(self, bone_idx: int):
+        if self.is_vertex_array():
+            return [self.get_vertex(vertex_idx) for vertex_idx in self.bone_vertex_indices.get(bone_idx, [])]
+
+        return self.vertices.get(bone_idx, [])
+
+    # 指定ボーンにウェイトが乗っている頂点INDEX、頂点位置(n x 3)、頂点（頂点配列モードの場合はNone）
+    # ボーン毎に一度だけ求めて保持する
+    def get_bone_vertex_positions(self, bone_idx: int):
+        if bone_idx not in self.bone_vertex_positions:
+            if self.is_vertex_array():
+                vertex_idxs = self.bone_vertex_indices.get(bone_idx, np.zeros(0, dtype=np.int))
+                self.bone_vertex_positions[bone_idx] = (vertex_idxs, self.vertex_positions[vertex_idxs], None)
+            else:
+                vertices = np.empty(len(self.vertices.get(bone_idx, [])), dtype=object)
+                vertices[:] = self.vertices.get(bone_idx, [])
+                self.bone_vertex_positions[bone_idx] = (np.array([v.index for v in vertices], dtype=np.int), \
+                                                        np.array([v.position.data() for v in vertices], dtype=np.float64).reshape(len(vertices), 3), vertices)
+
+        return self.bone_vertex_positions[bone_idx]
+
     # 指定ボーンにウェイトが乗っている頂点とそのINDEX
     def get_bone_end_vertex(self, bone_name_list, def_calc_vertex_pos, def_is_target=None, def_is_multi_target=None, multi_target_default_val=None, qq4calc=None):
         # 指定ボーンにウェイトが乗っているボーンINDEXリスト
         bone_idx_list = []
         for bk, bv in self.bones.items():
-            if bk in bone_name_list and bv.index in self.vertices:
+            if bk in bone_name_list and self.has_bone_vertex(bv.index):
                 bone_idx_list.append(bv.index)
 
         if len(bone_idx_list) == 0:
@@ -1748,21 +1882,10 @@ cdef class PmxModel:
 
         logger.test("model: %s, bone_name: %s, bone_idx_list:%s", self.name, bone_name_list, bone_idx_list)
 
-        up_max_pos = MVector3D(0, -99999, 0)
-        up_max_vertex = None
-        down_max_pos = MVector3D(0, 99999, 0)
-        down_max_vertex = None
-        right_max_pos = MVector3D(99999, 0, 0)
-        right_max_vertex = None
-        left_max_pos = MVector3D(-99999, 0, 0)
-        left_max_vertex = None
-        back_max_pos = MVector3D(0, 0, -99999)
-        back_max_vertex = None
-        front_max_pos = MVector3D(0, 0, 99999)
-        front_max_vertex = None
-        multi_max_pos = multi_target_default_val
-        multi_max_vertex = None
-
+        # 処理対象頂点のINDEXと判定用の位置を、ボーンの順にまとめる
+        target_vertex_idxs_list = [np.zeros(0, dtype=np.int)]
+        target_positions_list = [np.zeros((0, 3), dtype=np.float64)]
+        target_vertices_list = [np.zeros(0, dtype=object)]
         for bone_idx in bone_idx_list:
             if bone_idx not in self.bone_indexes:
                 continue
@@ -1770,48 +1893,74 @@ cdef class PmxModel:
             # ボーンINDEXに該当するボーン
             bone = self.bones[self.bone_indexes[bone_idx]]
 
-            for v in self.vertices[bone_idx]:
-                v_pos = def_calc_vertex_pos(bone, v, qq4calc)
-
-                if def_is_target and def_is_target(bone, v, v_pos) or not def_is_target:
-                    # 処理対象頂点である場合のみ判定処理に入る
-                    if v_pos.y() < down_max_pos.y():
-                        # 指定ボーンにウェイトが乗っていて、かつ最下の頂点より下の場合、保持
-                        down_max_pos = v_pos
-                        down_max_vertex = v
-
-                    if v_pos.y() > up_max_pos.y():
-                        # 指定ボーンにウェイトが乗っていて、かつ最上の頂点より上の場合、保持
-                        up_max_pos = v_pos
-                        up_max_vertex = v
-
-                    if v_pos.x() < right_max_pos.x():
-                        # 指定ボーンにウェイトが乗っていて、かつ最下の頂点より下の場合、保持
-                        right_max_pos = v_pos
-                        right_max_vertex = v
-
-                    if v_pos.x() > left_max_pos.x():
-                        # 指定ボーンにウェイトが乗っていて、かつ最上の頂点より上の場合、保持
-                        left_max_pos = v_pos
-                        left_max_vertex = v
-
-                    if v_pos.z() < front_max_pos.z():
-                        # 指定ボーンにウェイトが乗っていて、かつ最上の頂点より手前の場合、保持
-                        front_max_pos = v_pos
-                        front_max_vertex = v
-
-                    if v_pos.z() > back_max_pos.z():
-                        # 指定ボーンにウェイトが乗っていて、かつ最下の頂点より奥の場合、保持
-                        back_max_pos = v_pos
-                        back_max_vertex = v
-                    
-                    if def_is_multi_target and def_is_multi_target(multi_max_pos, v_pos):
-                        multi_max_pos = v_pos
-                        multi_max_vertex = v
+            vertex_idxs, vertex_positions, vertices = self.get_bone_vertex_positions(bone_idx)
+            v_positions = def_calc_vertex_pos(bone, vertex_positions, qq4calc)
+
+            if def_is_target:
+                # 処理対象頂点のみに絞り込む
+                is_targets = def_is_target(bone, v_positions)
+                vertex_idxs = vertex_idxs[is_targets]
+                v_positions = v_positions[is_targets]
+                vertices = vertices[is_targets] if vertices is not None else None
+
+            target_vertex_idxs_list.append(vertex_idxs)
+            target_positions_list.append(v_positions)
+            target_vertices_list.append(vertices)
+
+        cdef np.ndarray target_vertex_idxs = np.concatenate(target_vertex_idxs_list)
+        cdef np.ndarray target_positions = np.concatenate(target_positions_list)
+        # 頂点配列モードの場合、頂点は必要になった時に生成する
+        target_vertices = np.concatenate(target_vertices_list) if not self.is_vertex_array() else None
+
+        # 各方向で最も端にある頂点（同じ値の場合は先の頂点）
+        up_max_pos, up_max_vertex = self.get_end_vertex(target_vertex_idxs, target_vertices, target_positions, 1, -99999, True)
+        down_max_pos, down_max_vertex = self.get_end_vertex(target_vertex_idxs, target_vertices, target_positions, 1, 99999, False)
+        right_max_pos, right_max_vertex = self.get_end_vertex(target_vertex_idxs, target_vertices, target_positions, 0, 99999, False)
+        left_max_pos, left_max_vertex = self.get_end_vertex(target_vertex_idxs, target_vertices, target_positions, 0, -99999, True)
+        back_max_pos, back_max_vertex = self.get_end_vertex(target_vertex_idxs, target_vertices, target_positions, 2, -99999, True)
+        front_max_pos, front_max_vertex = self.get_end_vertex(target_vertex_idxs, target_vertices, target_positions, 2, 99999, False)
+        if up_max_vertex is None:
+            up_max_pos = MVector3D(0, -99999, 0)
+        if down_max_vertex is None:
+            down_max_pos = MVector3D(0, 99999, 0)
+        if right_max_vertex is None:
+            right_max_pos = MVector3D(99999, 0, 0)
+        if left_max_vertex is None:
+            left_max_pos = MVector3D(-99999, 0, 0)
+        if back_max_vertex is None:
+            back_max_pos = MVector3D(0, 0, -99999)
+        if front_max_vertex is None:
+            front_max_pos = MVector3D(0, 0, 99999)
+
+        multi_max_pos = multi_target_default_val
+        multi_max_vertex = None
+        if def_is_multi_target:
+            multi_idx = def_is_multi_target(multi_target_default_val, target_positions)
+            if multi_idx >= 0:
+                multi_max_pos = MVector3D(target_positions[multi_idx])
+                multi_max_vertex = self.get_target_vertex(target_vertex_idxs, target_vertices, multi_idx)
 
         return up_max_pos, up_max_vertex, down_max_pos, down_max_vertex, right_max_pos, right_max_vertex, left_max_pos, left_max_vertex, \
             back_max_pos, back_max_vertex, front_max_pos, front_max_vertex, multi_max_pos, multi_max_vertex
 
+    # 指定軸で初期値より端にある頂点のうち、最も端にある頂点の位置と頂点（ない場合はNone）
+    def get_end_vertex(self, vertex_idxs: np.ndarray, vertices, v_positions: np.ndarray, axis: int, default_value: float, is_max: bool):
+        cdef np.ndarray values = v_positions[:, axis]
+        cdef np.ndarray candidate_idxs = np.flatnonzero(values > default_value if is_max else values < default_value)
+
+        if len(candidate_idxs) == 0:
+            return None, None
+
+        cdef int end_idx = candidate_idxs[np.argmax(values[candidate_idxs]) if is_max else np.argmin(values[candidate_idxs])]
+        return MVector3D(v_positions[end_idx]), self.get_target_vertex(vertex_idxs, vertices, end_idx)
+
+    # 処理対象頂点のうち、指定位置の頂点
+    def get_target_vertex(self, vertex_idxs: np.ndarray, vertices, target_idx: int):
+        if vertices is not None:
+            return vertices[target_idx]
+
+        return self.get_vertex(int(vertex_idxs[target_idx]))
+
     @classmethod
     def get_effective_value(cls, v):
         if math.isnan(v):
@@ -1830,3 +1979,219 @@ cdef class PmxModel:
 
     def copy(self):
         return cPickle.loads(cPickle.dumps(self, -1))
+
+
+# 先頭から順に、前回採用した頂点より底面（Yの差0.1以内）かつ前面にある頂点を採用していき、最後に採用した頂点のINDEXを返す
+cdef int c_find_multi_target_down_front(np.ndarray[np.float64_t, ndim=2] v_positions, double y, double z):
+    cdef int multi_idx = -1
+    cdef int vidx
+
+    for vidx in range(v_positions.shape[0]):
+        if v_positions[vidx, 1] <= y + 0.1 and v_positions[vidx, 2] <= z:
+            y = v_positions[vidx, 1]
+            z = v_positions[vidx, 2]
+            multi_idx = vidx
+
+    return multi_idx
+
+
+# 複数フレーム分の行列(フレーム数×4×4)で、それぞれの点(フレーム数×3)を変換する（MMatrix4x4 * MVector3D と同じ計算）
+cdef np.ndarray c_transform_points(np.ndarray matrixes, np.ndarray points):
+    cdef np.ndarray data_sum = np.sum(points[:, np.newaxis, :] * matrixes[:, :, :3], axis=2) + matrixes[:, :, 3]
+    cdef np.ndarray ws = data_sum[:, 3:]
+
+    return np.where(ws == 1.0, data_sum[:, :3], np.where(ws == 0.0, 0.0, data_sum[:, :3] / ws))
+
+# それぞれのベクトルの長さ
+cdef np.ndarray c_calc_lengths(np.ndarray vs):
+    return np.sqrt(np.einsum('ij,ij->i', vs, vs))
+
+# NaN・無限大を0にする（MVector3D.effective と同じ）
+cdef np.ndarray c_effective_points(np.ndarray vs):
+    vs[np.isnan(vs)] = 0
+    vs[np.isinf(vs)] = 0
+
+    return vs
+
+# math.acos(max(-1, min(1, v))) と同じ（NaNの場合は1として扱われる）
+cdef np.ndarray c_calc_clip_acos(np.ndarray vs):
+    return np.arccos(np.clip(np.where(np.isnan(vs), 1, vs), -1, 1))
+
+# 回避位置が腕から最大可能距離より遠い場合、縮める
+cdef c_shrink_collision_vecs(np.ndarray rep_collision_vecs, np.ndarray distances, np.ndarray root_global_poses, np.ndarray inv_matrixes, np.ndarray local_points, \
+                             double max_length, double min_ratio):
+    cdef np.ndarray arm_locals = rep_collision_vecs - root_global_poses
+    cdef np.ndarray arm_lengths = c_calc_lengths(arm_locals)
+    cdef np.ndarray shrink_idxs = np.where(arm_lengths >= max_length)[0]
+
+    if len(shrink_idxs) == 0:
+        return
+
+    arm_locals = c_effective_points(arm_locals[shrink_idxs] * ((max_length / arm_lengths[shrink_idxs]) * min_ratio)[:, np.newaxis])
+    rep_collision_vecs[shrink_idxs] = arm_locals + root_global_poses[shrink_idxs]
+    distances[shrink_idxs] = c_calc_lengths(c_transform_points(inv_matrixes[shrink_idxs], rep_collision_vecs[shrink_idxs]) - local_points[shrink_idxs])
+
+# 衝突・近接していたフレーム(hit_idxs)の回避位置・距離を求めて、全フレーム分の結果にまとめる
+# local_points 以降の配列は、衝突・近接していたフレーム分だけのもの
+cdef tuple c_calc_collision_vecs(np.ndarray collisions, np.ndarray near_collisions, np.ndarray hit_idxs, np.ndarray local_points, list new_locals, \
+                                 np.ndarray matrixes, np.ndarray shrink_inv_matrixes, np.ndarray root_global_poses, double max_length, double min_ratio):
+    cdef int n = collisions.shape[0]
+    cdef int aidx
+    cdef np.ndarray distances, rep_collision_vecs, hit_distances, hit_collision_vecs
+    cdef list all_distances = []
+    cdef list all_collision_vecs = []
+
+    # X, Z+, Z- の順
+    for aidx in range(3):
+        distances = np.zeros(n, dtype=np.float64)
+        rep_collision_vecs = np.zeros((n, 3), dtype=np.float64)
+
+        if len(hit_idxs) > 0:
+            hit_distances = c_calc_lengths(new_locals[aidx] - local_points)
+            hit_collision_vecs = c_transform_points(matrixes, new_locals[aidx])
+            c_shrink_collision_vecs(hit_collision_vecs, hit_distances, root_global_poses, shrink_inv_matrixes, local_points, max_length, min_ratio)
+
+            distances[hit_idxs] = hit_distances
+            rep_collision_vecs[hit_idxs] = hit_collision_vecs
+
+        all_distances.append(distances)
+        all_collision_vecs.append(rep_collision_vecs)
+
+    return (collisions, near_collisions, all_distances[0], all_distances[1], all_distances[2], all_collision_vecs[0], all_collision_vecs[1], all_collision_vecs[2])
+
+# 球剛体の複数フレーム一括衝突判定（Sphere.get_collistion と同じ判定）
+cdef tuple c_calc_sphere_collisions(MVector3D shape_size, np.ndarray matrixes, np.ndarray points, np.ndarray root_global_poses, \
+                                    double max_length, double min_ratio, double max_ratio, int h_sign, int v_sign):
+    cdef double x, y, z_plus, z_minus
+    cdef np.ndarray ds, collisions, near_collisions, hit_idxs, inv_matrixes, local_points, y_thetas, new_x_locals, new_z_plus_locals, new_z_minus_locals
+
+    # 原点との距離が半径未満なら衝突
+    ds = c_calc_lengths(points - matrixes[:, :3, 3])
+    collisions = (0 < ds) & (ds < shape_size.x() * min_ratio)
+    near_collisions = (0 <= ds) & (ds <= shape_size.x() * max_ratio)
+    hit_idxs = np.where(collisions | near_collisions)[0]
+
+    # 剛体のローカル座標系に基づく点の位置
+    inv_matrixes = np.linalg.inv(matrixes[hit_idxs])
+    local_points = c_transform_points(inv_matrixes, points[hit_idxs])
+
+    x = shape_size.x() * max_ratio * h_sign
+    y = shape_size.x() * max_ratio * v_sign
+    z_plus = shape_size.x() * max_ratio * 1
+    z_minus = shape_size.x() * max_ratio * -1
+
+    # 縦方向の離れ具合
+    y_thetas = c_calc_clip_acos(local_points[:, 1] / y)
+
+    new_x_locals = np.stack([y_thetas * x, local_points[:, 1], local_points[:, 2]], axis=1)
+    new_z_plus_locals = np.stack([local_points[:, 0], local_points[:, 1], y_thetas * z_plus], axis=1)
+    new_z_minus_locals = np.stack([local_points[:, 0], local_points[:, 1], y_thetas * z_minus], axis=1)
+
+    return c_calc_collision_vecs(collisions, near_collisions, hit_idxs, local_points, [new_x_locals, new_z_plus_locals, new_z_minus_locals], \
+                                 matrixes[hit_idxs], inv_matrixes, root_global_poses[hit_idxs], max_length, min_ratio)
+
+# 箱の中に点が含まれているか（Box.get_collistion の内外判定と同じ）
+cdef np.ndarray c_is_in_boxes(MVector3D shape_size, np.ndarray matrixes, np.ndarray points, double ratio):
+    cdef int n = points.shape[0]
+    cdef np.ndarray b1, b2, b4, t1, dir_vecs, edge, sizes, dirs
+    cdef np.ndarray results = np.ones(n, dtype=np.bool_)
+
+    # 下辺・上辺の頂点（ratio倍は変換後の位置に掛ける）
+    b1 = c_effective_points(c_transform_points(matrixes, np.tile([-shape_size.x(), -shape_size.y(), -shape_size.z()], (n, 1))) * ratio)
+    b2 = c_effective_points(c_transform_points(matrixes, np.tile([shape_size.x(), -shape_size.y(), -shape_size.z()], (n, 1))) * ratio)
+    b4 = c_effective_points(c_transform_points(matrixes, np.tile([-shape_size.x(), -shape_size.y(), shape_size.z()], (n, 1))) * ratio)
+    t1 = c_effective_points(c_transform_points(matrixes, np.tile([-shape_size.x(), shape_size.y(), -shape_size.z()], (n, 1))) * ratio)
+
+    dir_vecs = c_effective_points(points - matrixes[:, :3, 3])
+
+    # 3方向の間に点が含まれていたら衝突あり
+    for edge in [t1 - b1, b2 - b1, b4 - b1]:
+        sizes = c_calc_lengths(edge)
+        dirs = c_effective_points(edge / sizes[:, np.newaxis])
+        results &= np.abs(np.einsum('ij,ij->i', dir_vecs, dirs)) * 2 < sizes
+
+    return results
+
+# 箱剛体の複数フレーム一括衝突判定（Box.get_collistion と同じ判定）
+cdef tuple c_calc_box_collisions(MVector3D shape_size, np.ndarray matrixes, np.ndarray rotated_matrixes, np.ndarray points, np.ndarray root_global_poses, \
+                                 double max_length, double min_ratio, double max_ratio, int h_sign):
+    cdef double x, z_plus, z_minus
+    cdef np.ndarray collisions, near_collisions, hit_idxs, local_points, new_x_locals, new_z_plus_locals, new_z_minus_locals
+
+    collisions = c_is_in_boxes(shape_size, matrixes, points, 1)
+    near_collisions = c_is_in_boxes(shape_size, matrixes, points, max_ratio)
+    hit_idxs = np.where(collisions | near_collisions)[0]
+
+    # 左右の腕のどちらと衝突しているかにより、元に戻す方向が逆になる
+    x = shape_size.x() * max_ratio * h_sign
+    z_plus = -shape_size.z() * max_ratio * 1
+    z_minus = -shape_size.z() * max_ratio * -1
+
+    # 剛体のローカル座標系に基づく点の位置
+    local_points = c_transform_points(np.linalg.inv(rotated_matrixes[hit_idxs]), points[hit_idxs])
+
+    new_x_locals = np.stack([np.full(len(hit_idxs), x), local_points[:, 1], local_points[:, 2]], axis=1)
+    new_z_plus_locals = np.stack([local_points[:, 0], local_points[:, 1], np.full(len(hit_idxs), z_plus)], axis=1)
+    new_z_minus_locals = np.stack([local_points[:, 0], local_points[:, 1], np.full(len(hit_idxs), z_minus)], axis=1)
+
+    # 縮めた後の位置は回転なし行列で戻す
+    return c_calc_collision_vecs(collisions, near_collisions, hit_idxs, local_points, [new_x_locals, new_z_plus_locals, new_z_minus_locals], \
+                                 rotated_matrixes[hit_idxs], np.linalg.inv(matrixes[hit_idxs]), root_global_poses[hit_idxs], max_length, min_ratio)
+
+# カプセル剛体の複数フレーム一括衝突判定（Capsule.get_collistion と同じ判定）
+cdef tuple c_calc_capsule_collisions(MVector3D shape_size, np.ndarray matrixes, np.ndarray rotated_matrixes, np.ndarray points, np.ndarray root_global_poses, \
+                                     double max_length, double min_ratio, double max_ratio, int h_sign, int v_sign):
+    cdef int n = points.shape[0]
+    cdef np.ndarray b1, t1, vs, lensqs, ts, hs, segment_lengths, b1_h_lengths, t1_h_lengths, is_b1_outer, is_t1_outer
+    cdef np.ndarray ds, collisions, near_collisions, hit_idxs, h_matrixes, h_inv_matrixes, local_points, hit_ds, xs, ys, z_pluses, z_minuses, y_thetas
+    cdef np.ndarray new_x_locals, new_z_plus_locals, new_z_minus_locals
+
+    # 下辺・上辺
+    b1 = c_transform_points(rotated_matrixes, np.tile([0, -shape_size.y(), 0], (n, 1)))
+    t1 = c_transform_points(rotated_matrixes, np.tile([0, shape_size.y(), 0], (n, 1)))
+
+    # 垂線を下ろした座標
+    vs = t1 - b1
+    lensqs = c_calc_lengths(vs) ** 2
+    ts = np.where(lensqs == 0, 0, np.einsum('ij,ij->i', vs, points - b1) / lensqs)
+    hs = b1 + c_effective_points(vs * ts[:, np.newaxis])
+
+    segment_lengths = c_calc_lengths(b1 - t1)
+    b1_h_lengths = c_calc_lengths(b1 - hs)
+    t1_h_lengths = c_calc_lengths(t1 - hs)
+
+    # b1側の外分点
+    is_b1_outer = (segment_lengths < b1_h_lengths) & (b1_h_lengths < t1_h_lengths)
+    # t1側の外分点
+    is_t1_outer = ~is_b1_outer & (segment_lengths < t1_h_lengths) & (t1_h_lengths < b1_h_lengths)
+    hs[is_b1_outer] = b1[is_b1_outer]
+    hs[is_t1_outer] = t1[is_t1_outer]
+
+    # カプセルの線分から半径以内なら中に入っている
+    ds = c_calc_lengths(points - hs)
+    collisions = (0 < ds) & (ds < shape_size.x() * min_ratio)
+    near_collisions = (0 <= ds) & (ds <= shape_size.x() * max_ratio)
+    hit_idxs = np.where(collisions | near_collisions)[0]
+
+    # hのローカル座標系に基づく点の位置
+    h_matrixes = matrixes[hit_idxs].copy()
+    h_matrixes[:, :, 3] += np.sum(h_matrixes[:, :, :3] * c_transform_points(np.linalg.inv(matrixes[hit_idxs]), hs[hit_idxs])[:, np.newaxis, :], axis=2)
+    h_inv_matrixes = np.linalg.inv(h_matrixes)
+    local_points = c_transform_points(h_inv_matrixes, points[hit_idxs])
+
+    # 距離分だけ離した場合の球
+    hit_ds = ds[hit_idxs]
+    xs = hit_ds * max_ratio * h_sign
+    ys = hit_ds * max_ratio * v_sign
+    z_pluses = hit_ds * max_ratio * 1
+    z_minuses = hit_ds * max_ratio * -1
+
+    # 縦方向の離れ具合
+    y_thetas = c_calc_clip_acos(np.abs(local_points[:, 1]) / ys)
+
+    new_x_locals = np.stack([y_thetas * xs, local_points[:, 1], local_points[:, 2]], axis=1)
+    new_z_plus_locals = np.stack([local_points[:, 0], local_points[:, 1], y_thetas * z_pluses], axis=1)
+    new_z_minus_locals = np.stack([local_points[:, 0], local_points[:, 1], y_thetas * z_minuses], axis=1)
+
+    return c_calc_collision_vecs(collisions, near_collisions, hit_idxs, local_points, [new_x_locals, new_z_plus_locals, new_z_minus_locals], \
+                                 h_matrixes, h_inv_matrixes, root_global_poses[hit_idxs], max_length, min_ratio)
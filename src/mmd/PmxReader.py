@@ -1,9 +1,14 @@
 # -*- coding: utf-8 -*-
 #
+import os
+import glob
+import zlib
 import struct
 import hashlib
 import random
 import string
+import _pickle as cPickle
+import numpy as np
 
 from mmd.PmxData import PmxModel, Bone, RigidBody, Vertex, Material, Morph, DisplaySlot, RigidBody, Joint, Ik, IkLink, Bdef1, Bdef2, Bdef4, Sdef, Qdef, MaterialMorphData, UVMorphData, BoneMorphData, VertexMorphOffset, GroupMorphData # noqa
 from module.MMath import MRect, MVector2D, MVector3D, MVector4D, MQuaternion, MMatrix4x4 # noqa
@@ -12,12 +17,23 @@ from utils.MException import SizingException, MKilledException, MParseException
 
 logger = MLogger(__name__, level=1)
 
+# 解析済みモデルキャッシュの形式（PmxDataの構造を変えた場合は上げる）
+PMX_CACHE_VERSION = 3
+# 解析済みモデルキャッシュの最大保持件数
+PMX_CACHE_MAX_COUNT = 20
+
 
 class PmxReader:
-    def __init__(self, file_path, is_check=True, is_sizing=True):
+    # 解析済みモデルキャッシュの保存先（Noneの場合、キャッシュしない）
+    cache_dir_path = None
+
+    def __init__(self, file_path, is_check=True, is_sizing=True, is_vertex_array=False):
         self.file_path = file_path
         self.is_check = is_check
         self.is_sizing = is_sizing
+        # 頂点・面データを頂点オブジェクトではなく、列ごとの配列で保持するか
+        self.is_vertex_array = is_vertex_array
+        self.digest = None
         self.offset = 0
         self.buffer = None
         self.vertex_index_size = 0
@@ -98,6 +114,75 @@ class PmxReader:
         return model_name
 
     def read_data(self):
+        # 解析済みのキャッシュがあれば、そのまま使う
+        pmx = self.read_cache()
+        if pmx:
+            logger.info("-- PMX 读取缓存完成")
+            return pmx
+
+        pmx = self.read_pmx_data()
+
+        if isinstance(pmx, PmxModel):
+            # 解析結果をキャッシュしておく
+            self.write_cache(pmx)
+
+        return pmx
+
+    # 解析済みモデルキャッシュのパス
+    def get_cache_path(self):
+        if not PmxReader.cache_dir_path:
+            return None
+
+        return os.path.join(PmxReader.cache_dir_path, "{0}_{1}{2}{3}{4}.pmxc".format( \
+            self.hexdigest(), PMX_CACHE_VERSION, int(self.is_check), int(self.is_sizing), int(self.is_vertex_array)))
+
+    # 解析済みモデルキャッシュの読み込み
+    def read_cache(self):
+        cache_path = self.get_cache_path()
+
+        if not cache_path or not os.path.exists(cache_path):
+            return None
+
+        try:
+            with open(cache_path, "rb") as f:
+                pmx = cPickle.loads(zlib.decompress(f.read()))
+
+            if isinstance(pmx, PmxModel) and pmx.digest == self.hexdigest():
+                # 読み込んだキャッシュは最新扱いにする
+                os.utime(cache_path)
+                pmx.path = self.file_path
+                return pmx
+        except Exception as e:
+            # 壊れている・古い形式の場合、読み直す
+            logger.test("read_cache失敗: %s, %s", cache_path, e)
+
+        return None
+
+    # 解析済みモデルキャッシュの書き込み
+    def write_cache(self, pmx: PmxModel):
+        cache_path = self.get_cache_path()
+
+        if not cache_path:
+            return
+
+        try:
+            os.makedirs(PmxReader.cache_dir_path, exist_ok=True)
+
+            # 書き込み途中のファイルを読まないよう、一時ファイルから置き換える
+            tmp_cache_path = "{0}.{1}.tmp".format(cache_path, randomname(8))
+            with open(tmp_cache_path, "wb") as f:
+                f.write(zlib.compress(cPickle.dumps(pmx, -1), 1))
+            os.replace(tmp_cache_path, cache_path)
+
+            # 古いキャッシュから削除
+            cache_paths = sorted(glob.glob(os.path.join(PmxReader.cache_dir_path, "*.pmxc")), key=os.path.getmtime, reverse=True)
+            for old_cache_path in cache_paths[PMX_CACHE_MAX_COUNT:]:
+                os.remove(old_cache_path)
+        except Exception as e:
+            # キャッシュできなくても処理は続ける
+            logger.test("write_cache失敗: %s, %s", cache_path, e)
+
+    def read_pmx_data(self):
         # Pmxモデル生成
         pmx = PmxModel()
         pmx.path = self.file_path
@@ -181,46 +266,59 @@ class PmxReader:
                 pmx.english_comment = self.read_text()
                 logger.test("english_comment: %s (%s)", pmx.english_comment, self.offset)
 
-                # 頂点データリスト
-                for vertex_idx in range(self.read_int(4)):
-                    position = self.read_Vector3D()
-                    normal = self.read_Vector3D()
-                    uv = self.read_Vector2D()
-
-                    extended_uvs = []
-                    if pmx.extended_uv > 0:
-                        # 追加UVがある場合
-                        for _ in range(pmx.extended_uv):
-                            extended_uvs.append(self.read_Vector4D())
-
-                    deform = self.read_deform()
-                    edge_factor = self.read_float()
-
-                    # 頂点をウェイトボーンごとに分けて保持する
-                    vertex = Vertex(vertex_idx, position, normal, uv, extended_uvs, deform, edge_factor)
-                    for bone_idx in vertex.deform.get_idx_list():
-                        if bone_idx not in pmx.vertices:
-                            pmx.vertices[bone_idx] = []
-                        pmx.vertices[bone_idx].append(vertex)
+                if self.is_vertex_array:
+                    # 頂点配列モードの場合、頂点データを列ごとの配列でまとめて読み込む
+                    self.read_vertex_arrays(pmx, self.read_int(4))
+                    logger.test("len(vertex_positions): %s", len(pmx.vertex_positions))
+                    logger.test("bone_vertex_indices.keys: %s", pmx.bone_vertex_indices.keys())
+                    logger.info("-- PMX 顶点读取完成")
+
+                    # 面データ（面 x 3の頂点INDEX）
+                    self.read_face_indices(pmx, self.read_int(4))
+                    logger.test("len(face_indices): %s", len(pmx.face_indices))
+
+                    logger.info("-- PMX 读取完成")
+                else:
+                    # 頂点データリスト
+                    for vertex_idx in range(self.read_int(4)):
+                        position = self.read_Vector3D()
+                        normal = self.read_Vector3D()
+                        uv = self.read_Vector2D()
+
+                        extended_uvs = []
+                        if pmx.extended_uv > 0:
+                            # 追加UVがある場合
+                            for _ in range(pmx.extended_uv):
+                                extended_uvs.append(self.read_Vector4D())
+
+                        deform = self.read_deform()
+                        edge_factor = self.read_float()
+
+                        # 頂点をウェイトボーンごとに分けて保持する
+                        vertex = Vertex(vertex_idx, position, normal, uv, extended_uvs, deform, edge_factor)
+                        for bone_idx in vertex.deform.get_idx_list():
+                            if bone_idx not in pmx.vertices:
+                                pmx.vertices[bone_idx] = []
+                            pmx.vertices[bone_idx].append(vertex)
                     
-                    # 全頂点データとしても保持
-                    pmx.vertex_dict[vertex.index] = vertex
+                        # 全頂点データとしても保持
+                        pmx.vertex_dict[vertex.index] = vertex
                     
-                logger.test("len(vertices): %s", len(pmx.vertices))
-                logger.test("vertices.keys: %s", pmx.vertices.keys())
-                logger.info("-- PMX 顶点读取完成")
+                    logger.test("len(vertices): %s", len(pmx.vertices))
+                    logger.test("vertices.keys: %s", pmx.vertices.keys())
+                    logger.info("-- PMX 顶点读取完成")
 
-                # 面データリスト
-                for iidx in range(self.read_int(4)):
-                    index_idx = iidx // 3
-                    if index_idx not in pmx.indices.keys():
-                        pmx.indices[index_idx] = []
+                    # 面データリスト
+                    for iidx in range(self.read_int(4)):
+                        index_idx = iidx // 3
+                        if index_idx not in pmx.indices.keys():
+                            pmx.indices[index_idx] = []
 
-                    pmx.indices[index_idx].append(self.read_vertex_index_size(self.vertex_index_size))
+                        pmx.indices[index_idx].append(self.read_vertex_index_size(self.vertex_index_size))
                     
-                logger.test("len(indices): %s", len(pmx.indices))
+                    logger.test("len(indices): %s", len(pmx.indices))
                 
-                logger.info("-- PMX 读取完成")
+                    logger.info("-- PMX 读取完成")
 
                 # テクスチャデータリスト
                 for _ in range(self.read_int(4)):
@@ -270,10 +368,17 @@ class PmxReader:
                     
                     logger.test("material.vertex_count: %s: %s total: %s", material.name, material.vertex_count, total_index_count)
 
-                    for iidx in range(total_index_count, total_index_count + (material.vertex_count // 3)):
-                        pmx.material_indices[material.name].append(iidx)
-                        for iiidx in pmx.indices[iidx]:
-                            pmx.material_vertices[material.name].append(iiidx)
+                    if self.is_vertex_array:
+                        # 材質の面に含まれる頂点INDEX（重複なし）
+                        pmx.material_indices[material.name].extend(range(total_index_count, total_index_count + (material.vertex_count // 3)))
+                        pmx.material_vertex_indices[material.name] = \
+                            np.union1d(pmx.material_vertex_indices.get(material.name, np.zeros(0, dtype=np.int)), \
+                                       pmx.face_indices[total_index_count:(total_index_count + (material.vertex_count // 3))].ravel())
+                    else:
+                        for iidx in range(total_index_count, total_index_count + (material.vertex_count // 3)):
+                            pmx.material_indices[material.name].append(iidx)
+                            for iiidx in pmx.indices[iidx]:
+                                pmx.material_vertices[material.name].append(iiidx)
                 
                     # 全面数加算
                     total_index_count += (material.vertex_count // 3)
@@ -966,6 +1071,9 @@ class PmxReader:
             return index, pmx.bones[tmp_bone_indexes[parent_index]].index
 
     def hexdigest(self):
+        if self.digest:
+            return self.digest
+
         sha1 = hashlib.sha1()
 
         with open(self.file_path, 'rb') as f:
@@ -977,7 +1085,9 @@ class PmxReader:
         # ファイルパスをハッシュに含める
         sha1.update(self.file_path.encode('utf-8'))
 
-        return sha1.hexdigest()
+        self.digest = sha1.hexdigest()
+
+        return self.digest
 
     def calc_bone_length(self, bones, bone_indexes):
         for k, v in bones.items():
@@ -1141,6 +1251,101 @@ class PmxReader:
         else:
             raise MParseException("unknown deform_type: {0}".format(deform_type))
 
+    # 頂点データを列ごとの配列でまとめて読み込む（頂点オブジェクトは生成しない）
+    def read_vertex_arrays(self, pmx, vertex_count):
+        # ウェイト変形方式の手前までのサイズ（位置、法線、UV、追加UV）
+        deform_type_offset = 4 * (3 + 3 + 2 + 4 * pmx.extended_uv)
+        # ウェイト変形方式毎のデータサイズ（BDEF1, BDEF2, BDEF4, SDEF, QDEF）
+        b = self.bone_index_size
+        deform_sizes = (b, b * 2 + 4, b * 4 + 16, b * 2 + 4 + 36, b * 2 + 4 + 36)
+
+        # 頂点毎にサイズが異なるので、先頭位置とウェイト変形方式だけを順番に求める
+        offsets = []
+        deform_types = []
+        buffer = self.buffer
+        offset = self.offset
+        for _ in range(vertex_count):
+            deform_type = buffer[offset + deform_type_offset]
+            if deform_type > 4:
+                raise MParseException("unknown deform_type: {0}".format(deform_type))
+
+            offsets.append(offset)
+            deform_types.append(deform_type)
+            offset += deform_type_offset + 1 + deform_sizes[deform_type] + 4
+        self.offset = offset
+
+        offsets = np.array(offsets, dtype=np.int)
+        deform_types = np.array(deform_types, dtype=np.int8)
+
+        data = np.frombuffer(self.buffer, dtype=np.uint8)
+        bone_dtype = {1: "i1", 2: "<i2", 4: "<i4"}[b]
+
+        pmx.vertex_positions = self.gather_values(data, offsets, 3, "<f4")
+        pmx.vertex_normals = self.gather_values(data, offsets + 12, 3, "<f4")
+        pmx.vertex_uvs = self.gather_values(data, offsets + 24, 2, "<f4")
+        pmx.vertex_extended_uvs = self.gather_values(data, offsets + 32, 4 * pmx.extended_uv, "<f4").reshape(vertex_count, pmx.extended_uv, 4)
+        pmx.vertex_deform_types = deform_types
+
+        # ボーンINDEX（未使用は-1）とウェイト、SDEFパラメータ（C, R0, R1）
+        bone_indices = np.full((vertex_count, 4), -1, dtype=np.int)
+        weights = np.zeros((vertex_count, 4), dtype=np.float64)
+        sdef_params = np.zeros((vertex_count, 9), dtype=np.float64)
+        deform_offsets = offsets + deform_type_offset + 1
+
+        # BDEF1
+        vidxs = np.flatnonzero(deform_types == 0)
+        bone_indices[vidxs, :1] = self.gather_values(data, deform_offsets[vidxs], 1, bone_dtype)
+        weights[vidxs, 0] = 1
+
+        # BDEF2, SDEF, QDEF
+        vidxs = np.flatnonzero((deform_types == 1) | (deform_types == 3) | (deform_types == 4))
+        bone_indices[vidxs, :2] = self.gather_values(data, deform_offsets[vidxs], 2, bone_dtype)
+        weights[vidxs, 0] = self.gather_values(data, deform_offsets[vidxs] + b * 2, 1, "<f4")[:, 0]
+        weights[vidxs, 1] = 1 - weights[vidxs, 0]
+
+        vidxs = np.flatnonzero(deform_types >= 3)
+        sdef_params[vidxs] = self.gather_values(data, deform_offsets[vidxs] + b * 2 + 4, 9, "<f4")
+
+        # BDEF4
+        vidxs = np.flatnonzero(deform_types == 2)
+        bone_indices[vidxs] = self.gather_values(data, deform_offsets[vidxs], 4, bone_dtype)
+        weights[vidxs] = self.gather_values(data, deform_offsets[vidxs] + b * 4, 4, "<f4")
+
+        pmx.vertex_bone_indices = bone_indices
+        pmx.vertex_weights = weights
+        pmx.vertex_sdef_params = sdef_params
+
+        # エッジ倍率は頂点データの末尾
+        edge_offsets = np.append(offsets[1:], self.offset) - 4
+        pmx.vertex_edge_factors = self.gather_values(data, edge_offsets, 1, "<f4")[:, 0]
+
+        # ウェイトボーン毎の頂点INDEX（Deform.get_idx_list と同じく、ウェイトが負のボーンは除く）
+        slot_counts = np.array([1, 2, 4, 2, 2])[deform_types]
+        is_target = (np.arange(4) < slot_counts[:, np.newaxis]) & ((weights >= 0) | (deform_types[:, np.newaxis] >= 3))
+        target_vidxs, target_slots = np.nonzero(is_target)
+        # ボーンINDEX・頂点INDEXの順に並べて重複を除き、ボーンINDEXの切れ目で分ける
+        # （ボーン数×頂点数が32bitに収まらないモデルもあるので、キーは64bitで作る）
+        key_size = max(1, vertex_count)
+        bone_vertex_keys = np.unique((bone_indices[target_vidxs, target_slots].astype(np.int64) + 1) * key_size + target_vidxs.astype(np.int64))
+        bone_keys = bone_vertex_keys // key_size - 1
+        split_idxs = np.flatnonzero(np.diff(bone_keys)) + 1
+        pmx.bone_vertex_indices = {}
+        for start_idx, bone_vidxs in zip(np.append(0, split_idxs), np.split((bone_vertex_keys % key_size).astype(np.int), split_idxs)):
+            if len(bone_vidxs) > 0:
+                pmx.bone_vertex_indices[int(bone_keys[start_idx])] = bone_vidxs
+
+    # 面データを（面 x 3）の頂点INDEX配列でまとめて読み込む
+    def read_face_indices(self, pmx, index_count):
+        index_dtype = {1: "u1", 2: "<u2", 4: "<i4"}[self.vertex_index_size]
+        pmx.face_indices = np.frombuffer(self.buffer, dtype=index_dtype, count=index_count, offset=self.offset).astype(np.int).reshape(-1, 3)
+        self.offset += index_count * self.vertex_index_size
+
+    # 各先頭位置から、指定型の値を指定個数ずつ取り出す（頂点 x 個数）
+    def gather_values(self, data, offsets, count, dtype):
+        item_size = np.dtype(dtype).itemsize
+        byte_idxs = offsets[:, np.newaxis] + np.arange(count * item_size)
+        return np.ascontiguousarray(data[byte_idxs]).view(dtype).reshape(len(offsets), count).astype(np.float64 if np.dtype(dtype).kind == "f" else np.int)
+
     # 文字列の解凍（エンコーディングに基づく）
     def define_read_text(self, text_encoding):
         if text_encoding == 0:
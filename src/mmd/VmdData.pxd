@@ -23,6 +23,9 @@ cdef class OneEuroFilter:
     cdef double __lasttime
     cdef double __alpha(self, double cutoff)
     cdef double c__call__(self, double x, double timestamp)
+    cdef np.ndarray c_filter_values(self, np.ndarray values, np.ndarray timestamps)
+
+cdef np.ndarray c_filter_values(np.ndarray values, dict config, np.ndarray timestamps)
 
 cdef class VmdBoneFrame:
     cdef public str name
@@ -46,6 +49,26 @@ cdef class VmdMorphFrame:
     cdef public bint key
     cdef public bint read
 
+cdef class VmdBoneTrack:
+    cdef public str name
+    cdef public bytes bname
+    cdef public int last_motion_frame
+    cdef public np.ndarray fnos
+    cdef public np.ndarray positions
+    cdef public np.ndarray rotations
+    cdef public np.ndarray org_rotations
+    cdef public np.ndarray interpolations
+    cdef public np.ndarray keys
+    cdef public np.ndarray reads
+
+    cdef VmdBoneFrame c_get_bf(self, int idx)
+
+    cdef VmdBoneFrame c_calc_bf(self, int fno, bint is_key, bint is_read)
+
+    cdef tuple c_calc_values(self, np.ndarray target_fnos)
+
+    cdef c_regist_bf(self, VmdBoneFrame bf, int fno, bint copy_interpolation, bint key)
+
 cdef class VmdMotion:
     cdef public str path
     cdef public str signature
@@ -64,6 +87,10 @@ cdef class VmdMotion:
     cdef public int ik_cnt
     cdef public list showiks
     cdef public str digest
+    cdef dict bone_fno_indexes
+    cdef public dict fk_cache
+    cdef public set shared_bone_names
+    cdef public bint is_snapshot
 
     cdef c_regist_full_bf(self, int data_set_no, list bone_name_list, int offset, bint is_key)
 
@@ -79,6 +106,8 @@ cdef class VmdMotion:
 
     cdef tuple c_get_infections(self, int data_set_no, str bone_name, bint is_rot, bint is_mov, np.ndarray fnos, list active_fnos)
 
+    cdef np.ndarray c_get_value_infections(self, str bone_name, str value_name, np.ndarray fnos, np.ndarray diff_values, double diff_limit)
+
     # cdef dict c_smooth_values(self, dict values, int delimiter)
 
     cdef dict c_smooth_values(self, dict value_dict, dict config)
@@ -87,6 +116,16 @@ cdef class VmdMotion:
 
     cdef VmdBoneFrame c_calc_bf(self, str bone_name, int fno, bint is_key, bint is_read, bint is_reset_interpolation)
 
+    cdef tuple c_calc_bone_values(self, str bone_name, np.ndarray fnos)
+
+    cdef list c_get_bone_fno_index(self, str bone_name)
+
+    cdef dict c_own_bone_frames(self, str bone_name)
+
+    cdef c_set_bf(self, str bone_name, int fno, VmdBoneFrame bf)
+
+    cdef c_delete_bf(self, str bone_name, int fno)
+
     cdef MQuaternion calc_bf_rot(self, VmdBoneFrame prev_bf, VmdBoneFrame fill_bf, VmdBoneFrame next_bf)
 
     cdef MVector3D calc_bf_pos(self, VmdBoneFrame prev_bf, VmdBoneFrame fill_bf, VmdBoneFrame next_bf)
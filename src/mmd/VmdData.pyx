@@ -7,10 +7,12 @@ cimport libc.math as cmath
 from libcpp cimport  list, str, int, float
 import struct
 import _pickle as cPickle
+from bisect import bisect_left, bisect_right
 from libc.math cimport pi, fabs
 from math import ceil, radians, isnan, isinf
 
 from utils import MBezierUtils # noqa
+from utils cimport MBezierUtils
 from utils.MLogger import MLogger
 
 from module.MMath import MRect, MVector2D, MVector3D, MVector4D, MQuaternion, MMatrix4x4, get_effective_value # noqa
@@ -19,6 +21,7 @@ logger = MLogger(__name__, level=1)
 
 ctypedef np.int_t DTYPE_INT_t
 ctypedef np.float64_t DTYPE_FLOAT_t
+ctypedef np.int16_t DTYPE_SHORT_t
 
 
 # OneEuroFilter
@@ -97,14 +100,50 @@ cdef class OneEuroFilter:
         # ---- estimate the current variation per second
         cdef double prev_x = self.__x.lastValue()
         cdef double dx = 0.0 if prev_x < 0 else (x - prev_x) * self.__freq  # FIXME: 0.0 or value?
-        cdef double edx = self.__dx(dx, timestamp, alpha=self.__alpha(self.__dcutoff))
+        cdef double edx = self.__dx.c__call__(dx, timestamp, self.__alpha(self.__dcutoff))
         # ---- use it to update the cutoff frequency
         cdef double cutoff = self.__mincutoff + self.__beta * fabs(edx)
         # まったく同じ値の場合、スキップ
         if prev_x == x:
-            return self.__x.skip(x, timestamp, alpha=self.__alpha(cutoff))
+            return self.__x.skip(x, timestamp, self.__alpha(cutoff))
         # ---- filter the given value
-        return self.__x(x, timestamp, alpha=self.__alpha(cutoff))
+        return self.__x.c__call__(x, timestamp, self.__alpha(cutoff))
+
+    def filter_values(self, values: np.ndarray, timestamps=None):
+        return self.c_filter_values(np.asarray(values, dtype=np.float64), \
+                                    np.full(len(values), -1, dtype=np.float64) if timestamps is None else np.asarray(timestamps, dtype=np.float64))
+
+    # 1チャンネル分の値をまとめてフィルタにかける（1値ずつ呼び出した場合と同じ結果・同じ状態になる）
+    cdef np.ndarray c_filter_values(self, np.ndarray values, np.ndarray timestamps):
+        cdef np.ndarray[DTYPE_FLOAT_t, ndim=1] c_values = values
+        cdef np.ndarray[DTYPE_FLOAT_t, ndim=1] c_timestamps = timestamps
+        cdef int n = c_values.shape[0]
+        cdef int i
+        cdef np.ndarray[DTYPE_FLOAT_t, ndim=1] filtered_values = np.zeros(n, dtype=np.float64)
+
+        for i in range(n):
+            filtered_values[i] = self.c__call__(c_values[i], c_timestamps[i])
+
+        return filtered_values
+
+
+# トラック単位でフィルタをかける
+# values: フレーム数 x チャンネル数（位置・オイラー角・クォータニオン成分など）の配列、チャンネル毎に別のフィルタを通す
+def filter_values(values: np.ndarray, config: dict, timestamps=None):
+    return c_filter_values(np.asarray(values, dtype=np.float64), config, None if timestamps is None else np.asarray(timestamps, dtype=np.float64))
+
+cdef np.ndarray c_filter_values(np.ndarray values, dict config, np.ndarray timestamps):
+    cdef np.ndarray[DTYPE_FLOAT_t, ndim=2] channel_values = values.reshape(values.shape[0], -1)
+    cdef np.ndarray[DTYPE_FLOAT_t, ndim=2] filtered_values = np.zeros_like(channel_values)
+    cdef np.ndarray[DTYPE_FLOAT_t, ndim=1] channel_timestamps = np.full(values.shape[0], -1, dtype=np.float64) if timestamps is None else timestamps
+    cdef OneEuroFilter efilter
+    cdef int ci
+
+    for ci in range(channel_values.shape[1]):
+        efilter = OneEuroFilter(**config)
+        filtered_values[:, ci] = efilter.c_filter_values(np.ascontiguousarray(channel_values[:, ci]), channel_timestamps)
+
+    return filtered_values.reshape(np.shape(values))
 
 
 cdef class VmdBoneFrame:
@@ -294,6 +333,268 @@ class VmdShowIkFrame:
             fout.write(struct.pack('b', k.onoff))
         
 
+# ボーン1本分のキーフレを列ごとの配列で保持するトラック
+# 全キーフレを対象とした処理を配列でまとめて行う用（キーフレの書き換えはregist_bfで行う）
+cdef class VmdBoneTrack:
+
+    def __init__(self, name='', last_motion_frame=0):
+        self.set_name(name)
+        self.last_motion_frame = last_motion_frame
+        # 昇順フレーム番号
+        self.fnos = np.zeros(0, dtype=np.int)
+        # 移動(n×3)
+        self.positions = np.zeros((0, 3), dtype=np.float64)
+        # 回転(n×4, w,x,y,z)
+        self.rotations = np.zeros((0, 4), dtype=np.float64)
+        self.org_rotations = np.zeros((0, 4), dtype=np.float64)
+        # 補間曲線(n×64)（分割途中でMMDの範囲外の値も持つため、符号付きで保持する）
+        self.interpolations = np.zeros((0, 64), dtype=np.int16)
+        # 登録対象であるか否か
+        self.keys = np.zeros(0, dtype=np.bool_)
+        # VMD読み込み処理で読み込んだキーか
+        self.reads = np.zeros(0, dtype=np.bool_)
+
+    def set_name(self, name):
+        self.name = name
+        self.bname = b'' if not name else name.encode('cp932').decode('shift_jis').encode('shift_jis')[:15].ljust(15, b'\x00')
+
+    def __len__(self):
+        return len(self.fnos)
+
+    # キーフレ辞書からトラックを生成する
+    @classmethod
+    def from_frames(cls, bone_name: str, bone_frames: dict, last_motion_frame=0):
+        cdef VmdBoneTrack track = VmdBoneTrack(bone_name, last_motion_frame)
+        cdef list bfs = [bone_frames[fno] for fno in sorted(bone_frames.keys())]
+        cdef VmdBoneFrame bf
+        cdef int n = len(bfs)
+
+        if n == 0:
+            return track
+
+        track.fnos = np.array([bf.fno for bf in bfs], dtype=np.int)
+        track.positions = np.array([bf.position.data() for bf in bfs], dtype=np.float64)
+        track.rotations = np.array([bf.rotation.data().components for bf in bfs], dtype=np.float64)
+        track.org_rotations = np.array([bf.org_rotation.data().components for bf in bfs], dtype=np.float64)
+        track.interpolations = np.array([bf.interpolation for bf in bfs], dtype=np.int16)
+        track.keys = np.array([bf.key for bf in bfs], dtype=np.bool_)
+        track.reads = np.array([bf.read for bf in bfs], dtype=np.bool_)
+
+        return track
+
+    # キーフレ辞書に戻す
+    def to_frames(self):
+        cdef int idx
+        return {int(self.fnos[idx]): self.get_bf(idx) for idx in range(len(self.fnos))}
+
+    def copy(self):
+        cdef VmdBoneTrack track = VmdBoneTrack(self.name, self.last_motion_frame)
+        track.fnos = self.fnos.copy()
+        track.positions = self.positions.copy()
+        track.rotations = self.rotations.copy()
+        track.org_rotations = self.org_rotations.copy()
+        track.interpolations = self.interpolations.copy()
+        track.keys = self.keys.copy()
+        track.reads = self.reads.copy()
+
+        return track
+
+    # 指定INDEXのキーフレを生成する（トラックとは別インスタンスなので、書き換えはregist_bfで反映する）
+    def get_bf(self, idx: int):
+        return self.c_get_bf(idx)
+
+    cdef VmdBoneFrame c_get_bf(self, int idx):
+        cdef VmdBoneFrame bf = VmdBoneFrame(int(self.fnos[idx]))
+        bf.name = self.name
+        bf.bname = self.bname
+        bf.position = MVector3D(self.positions[idx])
+        bf.rotation = MQuaternion(self.rotations[idx])
+        bf.org_rotation = MQuaternion(self.org_rotations[idx])
+        bf.interpolation = self.interpolations[idx].tolist()
+        bf.key = self.keys[idx]
+        bf.read = self.reads[idx]
+
+        return bf
+
+    # フレーム番号リスト
+    def get_bone_fnos(self, is_key=False, is_read=False):
+        cdef np.ndarray mask = np.ones(len(self.fnos), dtype=np.bool_)
+        if is_key:
+            mask &= self.keys
+        if is_read:
+            mask &= self.reads
+
+        return self.fnos[mask].tolist()
+
+    # 補間曲線を考慮した指定フレーム番号のキーフレ（VmdMotion.calc_bf と同じ値を返す）
+    def calc_bf(self, fno: int, is_key=False, is_read=False):
+        return self.c_calc_bf(fno, is_key, is_read)
+
+    cdef VmdBoneFrame c_calc_bf(self, int fno, bint is_key, bint is_read):
+        cdef VmdBoneFrame fill_bf
+        cdef int n = len(self.fnos)
+        cdef int idx = np.searchsorted(self.fnos, fno, side='left')
+
+        if idx < n and self.fnos[idx] == fno and (not is_key or self.keys[idx]) and (not is_read or self.reads[idx]):
+            # 合致するキーが見つかった場合、それを返す
+            return self.c_get_bf(idx)
+
+        if is_key or is_read:
+            # 既存キーのみ探している場合はNone
+            return None
+
+        if n == 0:
+            fill_bf = VmdBoneFrame(fno)
+            fill_bf.set_name(self.name)
+            return fill_bf
+
+        if idx >= n or idx == 0:
+            # 前後どちらかしかない場合、ある方をコピーして返す
+            fill_bf = self.c_get_bf(n - 1 if idx >= n else 0)
+            fill_bf.fno = fno
+            fill_bf.key = False
+            fill_bf.read = False
+            return fill_bf
+
+        cdef np.ndarray[DTYPE_FLOAT_t, ndim=2] positions, rotations
+        positions, rotations = self.c_calc_values(np.array([fno], dtype=np.int))
+
+        fill_bf = VmdBoneFrame(fno)
+        fill_bf.name = self.name
+        fill_bf.bname = self.bname
+        fill_bf.position = MVector3D(positions[0])
+        fill_bf.rotation = MQuaternion(rotations[0])
+
+        return fill_bf
+
+    # 指定フレーム番号群の移動(m×3)・回転(m×4)を、補間曲線を考慮してまとめて求める
+    def calc_values(self, fnos):
+        return self.c_calc_values(np.asarray(fnos, dtype=np.int))
+
+    cdef tuple c_calc_values(self, np.ndarray target_fnos):
+        cdef int m = len(target_fnos)
+        cdef int n = len(self.fnos)
+        cdef np.ndarray[DTYPE_FLOAT_t, ndim=2] positions = np.zeros((m, 3), dtype=np.float64)
+        cdef np.ndarray[DTYPE_FLOAT_t, ndim=2] rotations = np.zeros((m, 4), dtype=np.float64)
+        rotations[:, 0] = 1
+
+        if n == 0 or m == 0:
+            return positions, rotations
+
+        # 前後のキーのINDEX（キーそのもの・範囲外は、該当するキーの値をそのまま使う）
+        cdef np.ndarray[np.intp_t, ndim=1] after_idxs = np.searchsorted(self.fnos, target_fnos, side='right')
+        cdef np.ndarray[np.intp_t, ndim=1] before_idxs = np.searchsorted(self.fnos, target_fnos, side='left') - 1
+        cdef np.ndarray exact_idxs = before_idxs + 1 != after_idxs
+        before_idxs[exact_idxs] += 1
+        before_idxs[before_idxs < 0] = 0
+        after_idxs[after_idxs >= n] = n - 1
+        after_idxs[exact_idxs] = before_idxs[exact_idxs]
+
+        positions[:] = self.positions[before_idxs]
+        rotations[:] = self.rotations[before_idxs]
+
+        cdef np.ndarray[np.intp_t, ndim=1] fill_idxs = np.where(before_idxs != after_idxs)[0]
+        if len(fill_idxs) == 0:
+            return positions, rotations
+
+        # 前後のキーの間のフレームのみ、補間曲線を元に間を埋める
+        cdef np.ndarray[DTYPE_INT_t, ndim=1] key_fnos = self.fnos
+        cdef np.ndarray[DTYPE_INT_t, ndim=1] fnos = np.asarray(target_fnos, dtype=np.int)
+        cdef np.ndarray[DTYPE_FLOAT_t, ndim=2] key_positions = self.positions
+        cdef np.ndarray[DTYPE_FLOAT_t, ndim=2] key_rotations = self.rotations
+        cdef np.ndarray[DTYPE_SHORT_t, ndim=2] interpolations = self.interpolations
+        cdef int i, fidx, pidx, nidx, axis
+        cdef double ry, dot, factor1, factor2, angle, sin_of_angle, sign
+        cdef double[3] ys
+        cdef int[3] x1_idxs = [MBezierUtils.MX_x1_idxs[3], MBezierUtils.MY_x1_idxs[3], MBezierUtils.MZ_x1_idxs[3]]
+        cdef int[3] y1_idxs = [MBezierUtils.MX_y1_idxs[3], MBezierUtils.MY_y1_idxs[3], MBezierUtils.MZ_y1_idxs[3]]
+        cdef int[3] x2_idxs = [MBezierUtils.MX_x2_idxs[3], MBezierUtils.MY_x2_idxs[3], MBezierUtils.MZ_x2_idxs[3]]
+        cdef int[3] y2_idxs = [MBezierUtils.MX_y2_idxs[3], MBezierUtils.MY_y2_idxs[3], MBezierUtils.MZ_y2_idxs[3]]
+        cdef int r_x1_idx = MBezierUtils.R_x1_idxs[3]
+        cdef int r_y1_idx = MBezierUtils.R_y1_idxs[3]
+        cdef int r_x2_idx = MBezierUtils.R_x2_idxs[3]
+        cdef int r_y2_idx = MBezierUtils.R_y2_idxs[3]
+
+        for i in range(len(fill_idxs)):
+            fidx = fill_idxs[i]
+            pidx = before_idxs[fidx]
+            nidx = after_idxs[fidx]
+
+            # 回転補間曲線（MQuaternion.slerp と同じ計算）
+            if key_rotations[pidx, 0] != key_rotations[nidx, 0] or key_rotations[pidx, 1] != key_rotations[nidx, 1] \
+                    or key_rotations[pidx, 2] != key_rotations[nidx, 2] or key_rotations[pidx, 3] != key_rotations[nidx, 3]:
+                ry = MBezierUtils.c_evaluate_y(interpolations[nidx, r_x1_idx], interpolations[nidx, r_y1_idx], \
+                                               interpolations[nidx, r_x2_idx], interpolations[nidx, r_y2_idx], \
+                                               key_fnos[pidx], fnos[fidx], key_fnos[nidx])
+                if ry >= 1.0:
+                    for axis in range(4):
+                        rotations[fidx, axis] = key_rotations[nidx, axis]
+                elif ry > 0.0:
+                    dot = 0.0
+                    for axis in range(4):
+                        dot += key_rotations[pidx, axis] * key_rotations[nidx, axis]
+
+                    sign = 1.0
+                    if dot < 0.0:
+                        sign = -1.0
+                        dot = -dot
+
+                    factor1 = 1.0 - ry
+                    factor2 = ry
+                    if (1.0 - dot) > 0.0000001:
+                        angle = cmath.acos(max(0, min(1, dot)))
+                        sin_of_angle = cmath.sin(angle)
+                        if sin_of_angle > 0.0000001:
+                            factor1 = cmath.sin((1.0 - ry) * angle) / sin_of_angle
+                            factor2 = cmath.sin(ry * angle) / sin_of_angle
+
+                    for axis in range(4):
+                        rotations[fidx, axis] = key_rotations[pidx, axis] * factor1 + (sign * key_rotations[nidx, axis]) * factor2
+
+            # 移動補間曲線
+            if key_positions[pidx, 0] != key_positions[nidx, 0] or key_positions[pidx, 1] != key_positions[nidx, 1] \
+                    or key_positions[pidx, 2] != key_positions[nidx, 2]:
+                for axis in range(3):
+                    ys[axis] = MBezierUtils.c_evaluate_y(interpolations[nidx, x1_idxs[axis]], interpolations[nidx, y1_idxs[axis]], \
+                                                         interpolations[nidx, x2_idxs[axis]], interpolations[nidx, y2_idxs[axis]], \
+                                                         key_fnos[pidx], fnos[fidx], key_fnos[nidx])
+                for axis in range(3):
+                    positions[fidx, axis] = key_positions[pidx, axis] + ((key_positions[nidx, axis] - key_positions[pidx, axis]) * ys[axis])
+
+        return positions, rotations
+
+    # 補間曲線分割ありで登録（VmdMotion.regist_bf と同じ結果になる）
+    def regist_bf(self, bf: VmdBoneFrame, fno: int, copy_interpolation=False, key=True):
+        self.c_regist_bf(bf, fno, copy_interpolation, key)
+
+    cdef c_regist_bf(self, VmdBoneFrame bf, int fno, bint copy_interpolation, bint key):
+        # 分割で書き換わるのは前後の有効キーの間だけなので、その区間だけモーションに戻して登録する
+        cdef np.ndarray[DTYPE_INT_t, ndim=1] key_fnos = self.fnos[self.keys]
+        cdef int key_idx = np.searchsorted(key_fnos, fno, side='left')
+        cdef int start_idx = 0 if key_idx == 0 else np.searchsorted(self.fnos, key_fnos[key_idx - 1], side='left')
+        cdef int end_idx = len(self.fnos)
+
+        if key_idx < len(key_fnos) and key_fnos[key_idx] == fno:
+            key_idx += 1
+        if key_idx < len(key_fnos):
+            end_idx = np.searchsorted(self.fnos, key_fnos[key_idx], side='right')
+
+        cdef VmdMotion motion = VmdMotion()
+        motion.last_motion_frame = self.last_motion_frame
+        motion.bones[self.name] = {int(self.fnos[idx]): self.c_get_bf(idx) for idx in range(start_idx, end_idx)}
+        motion.c_regist_bf(bf, self.name, fno, copy_interpolation, key)
+
+        cdef VmdBoneTrack segment = VmdBoneTrack.from_frames(self.name, motion.bones[self.name], self.last_motion_frame)
+
+        self.fnos = np.concatenate([self.fnos[:start_idx], segment.fnos, self.fnos[end_idx:]])
+        self.positions = np.concatenate([self.positions[:start_idx], segment.positions, self.positions[end_idx:]])
+        self.rotations = np.concatenate([self.rotations[:start_idx], segment.rotations, self.rotations[end_idx:]])
+        self.org_rotations = np.concatenate([self.org_rotations[:start_idx], segment.org_rotations, self.org_rotations[end_idx:]])
+        self.interpolations = np.concatenate([self.interpolations[:start_idx], segment.interpolations, self.interpolations[end_idx:]])
+        self.keys = np.concatenate([self.keys[:start_idx], segment.keys, self.keys[end_idx:]])
+        self.reads = np.concatenate([self.reads[:start_idx], segment.reads, self.reads[end_idx:]])
+
+
 # https://blog.goo.ne.jp/torisu_tetosuki/e/bc9f1c4d597341b394bd02b64597499d
 # https://w.atwiki.jp/kumiho_k/pages/15.html
 cdef class VmdMotion:
@@ -322,6 +623,14 @@ cdef class VmdMotion:
         self.showiks = []
         # ハッシュ値
         self.digest = None
+        # ボーン名：(キーフレ辞書, 昇順フレーム番号リスト)の辞書
+        self.bone_fno_indexes = {}
+        # FK計算結果のキャッシュ（Noneの場合、キャッシュしない）
+        self.fk_cache = None
+        # 他のモーションとキーフレ辞書を共有しているボーン名（書き換える前に複製する）
+        self.shared_bone_names = set()
+        # 読み取り専用のスナップショットであるか（参照だけではキーフレ辞書を複製しない）
+        self.is_snapshot = False
     
     def regist_full_bf(self, data_set_no: int, bone_name_list: list, offset=1, is_key=True):
         self.c_regist_full_bf(data_set_no, bone_name_list, offset, is_key)
@@ -365,16 +674,22 @@ cdef class VmdMotion:
 
     cdef list c_get_differ_fnos(self, int data_set_no, list bone_name_list, double limit_degrees, double limit_length):
         # cdef double limit_radians = cmath.cos(math.radians(limit_degrees))
-        cdef list fnos = [0]
+        cdef set fnos = {0}
         cdef str bone_name
         cdef int prev_sep_fno = 0
         cdef list bone_fnos
-        cdef VmdBoneFrame prev_bf
         cdef int fno
         cdef int last_fno
-        cdef VmdBoneFrame bf
-        cdef DTYPE_FLOAT_t dot
+        cdef int bidx
         cdef DTYPE_FLOAT_t rot_diff, mov_diff
+        cdef np.ndarray sample_fnos, positions, diff_positions
+        cdef np.ndarray[DTYPE_FLOAT_t, ndim=2] rotations
+        cdef list read_fnos_list = []
+        cdef list degrees_list = []
+        cdef list mov_diffs_list = []
+        cdef np.ndarray[DTYPE_FLOAT_t, ndim=1] degrees
+        cdef np.ndarray[DTYPE_FLOAT_t, ndim=1] mov_diffs
+        cdef set read_fnos
 
         prev_sep_fno = 0
 
@@ -384,19 +699,41 @@ cdef class VmdMotion:
         if len(bone_fnos) <= 0:
             return []
         
+        last_fno = bone_fnos[-1] + 1
+
+        # ボーン毎に、全フレームの値と読み込みキーを先にまとめて求めておく
+        sample_fnos = np.arange(0, last_fno + 1, dtype=np.int)
+        for bone_name in bone_name_list:
+            if bone_name not in self.bones:
+                # ボーンがない場合、0F目を登録しておく（フレーム毎に求める場合と同じ状態にする）
+                self.c_calc_bf(bone_name, 0, is_key=False, is_read=False, is_reset_interpolation=False)
+
+            positions, rotations = self.c_calc_bone_values(bone_name, sample_fnos)
+
+            # 各フレームの回転角度（MQuaternion.toDegree と同じ計算）
+            degrees = np.empty(last_fno + 1, dtype=np.float64)
+            for fno in range(last_fno + 1):
+                degrees[fno] = (2 * cmath.acos(min(1, max(-1, <double> rotations[fno, 0])))) * (180.0 / pi)
+            degrees_list.append(degrees)
+
+            # 前フレームとの移動量（MVector3D.distanceToPoint と同じ計算）
+            diff_positions = positions[:-1] - positions[1:]
+            mov_diffs_list.append(np.concatenate(([0], np.sqrt(np.einsum('ij,ij->i', diff_positions, diff_positions)))))
+
+            read_fnos_list.append({bf_fno for bf_fno, bf in self.bones[bone_name].items() if (<VmdBoneFrame> bf).read})
+
         # 比較対象bf
         rot_diff = 0
         mov_diff = 0
-        prev_bf = None
-        last_fno = bone_fnos[-1] + 1
         for fno in range(1, last_fno + 1):
-            for bone_name in bone_name_list:
-                prev_bf = self.c_calc_bf(bone_name, fno - 1, is_key=False, is_read=False, is_reset_interpolation=False)
-                bf = self.c_calc_bf(bone_name, fno, is_key=False, is_read=False, is_reset_interpolation=False)
+            for bidx, bone_name in enumerate(bone_name_list):
+                degrees = degrees_list[bidx]
+                mov_diffs = mov_diffs_list[bidx]
+                read_fnos = read_fnos_list[bidx]
 
-                if bf.read:
+                if fno in read_fnos:
                     # 読み込みキーである場合、必ず処理対象に追加
-                    fnos.append(fno)
+                    fnos.add(fno)
                     rot_diff = 0
                     mov_diff = 0
                 else:
@@ -406,19 +743,19 @@ cdef class VmdMotion:
                         continue
 
                     # 読み込みキーとの差
-                    rot_diff += abs(prev_bf.rotation.toDegree() - bf.rotation.toDegree())
+                    rot_diff += abs(degrees[fno - 1] - degrees[fno])
                     if rot_diff > limit_degrees and limit_degrees > 0:
                         # 前と今回の内積の差が指定度数より離れている場合、追加
                         logger.debug("★ 追加 set: %s, %s, f: %s, diff: %s", data_set_no, bone_name, fno, rot_diff)
-                        fnos.append(fno)
+                        fnos.add(fno)
                         rot_diff = 0
                     elif limit_length > 0:
                         # 読み込みキーとの差
-                        mov_diff += prev_bf.position.distanceToPoint(bf.position)
+                        mov_diff += mov_diffs[fno]
                         if mov_diff > limit_length:
                             # 前と今回の移動量の差が指定値より離れている場合、追加
                             logger.test("★ 追加 set: %s, %s, f: %s, diff: %s", data_set_no, bone_name, fno, mov_diff)
-                            fnos.append(fno)
+                            fnos.add(fno)
                             mov_diff = 0
                     else:
                         logger.test("× 追加なし set: %s, %s, f: %s, rot_diff: %s, mov_diff: %s", data_set_no, bone_name, fno, rot_diff, mov_diff)
@@ -431,8 +768,8 @@ cdef class VmdMotion:
                         logger.info("-- 第%s帧：完成(%s％)【增加关键帧- %s】", fno, round((fno / bone_fnos[-1]) * 100, 3), bone_name)
                         prev_sep_fno = fno // 2000
 
-        # 重複を除いて再計算
-        return sorted(list(set(fnos)))
+        # 重複を除いて昇順に並べる
+        return sorted(fnos)
 
     # 指定ボーンが跳ねてたりするのを回避
     def smooth_bf(self, data_set_no: int, bone_name: str, is_rot: bint, is_mov: bint, limit_degrees: float, start_fno=-1, end_fno=-1, is_show_log=True):
@@ -493,11 +830,13 @@ cdef class VmdMotion:
     # フィルターをかける
     cdef c_smooth_filter_bf(self, int data_set_no, str bone_name, bint is_rot, bint is_mov, int loop, dict mconfig, int start_fno, int end_fno, bint is_show_log):
         cdef int n, fno
-        cdef list active_fnos
+        cdef list active_fnos, now_bfs
         cdef prev_sep_fno = 0
         cdef VmdBoneFrame now_bf, start_bf, end_bf, bf
         cdef MQuaternion filterd_qq
         cdef np.ndarray[DTYPE_INT_t, ndim=1] fnos
+        cdef np.ndarray positions, timestamps, xs, ys, zs
+        cdef OneEuroFilter mxfilter, myfilter, mzfilter
 
         for n in range(loop):
             prev_sep_fno = 0
@@ -525,12 +864,27 @@ cdef class VmdMotion:
                 for inf_start_fno, inf_end_fno in zip(infections[:-2:2], infections[2::2]):
                     logger.test("move filter: start: %s, end: %s", inf_start_fno, inf_end_fno)
 
-                    for fno in range(inf_start_fno + 1, inf_end_fno):
-                        now_bf = self.c_calc_bf(bone_name, fno, is_key=False, is_read=False, is_reset_interpolation=False)
-                        now_bf.position = MVector3D(mxfilter(now_bf.position.x()), myfilter(now_bf.position.y()), mzfilter(now_bf.position.z()))
-                        # 補間曲線分割なしでそのまま登録
-                        self.bones[bone_name][fno] = now_bf
+                    if bone_name in self.bones and all([fno in self.bones[bone_name] for fno in range(inf_start_fno + 1, inf_end_fno)]):
+                        # 区間内が全部登録済みの場合、前のフィルタ結果に左右されないので、区間単位でまとめてフィルタにかける
+                        now_bfs = [self.c_calc_bf(bone_name, fno, is_key=False, is_read=False, is_reset_interpolation=False) for fno in range(inf_start_fno + 1, inf_end_fno)]
+                        positions = np.array([[bf.position.x(), bf.position.y(), bf.position.z()] for bf in now_bfs], dtype=np.float64).reshape(-1, 3)
+                        timestamps = np.full(len(now_bfs), -1, dtype=np.float64)
+                        xs = mxfilter.c_filter_values(np.ascontiguousarray(positions[:, 0]), timestamps)
+                        ys = myfilter.c_filter_values(np.ascontiguousarray(positions[:, 1]), timestamps)
+                        zs = mzfilter.c_filter_values(np.ascontiguousarray(positions[:, 2]), timestamps)
+
+                        for now_bf, x, y, z in zip(now_bfs, xs, ys, zs):
+                            now_bf.position = MVector3D(x, y, z)
+                            # 補間曲線分割なしでそのまま登録
+                            self.c_set_bf(bone_name, now_bf.fno, now_bf)
+                    else:
+                        for fno in range(inf_start_fno + 1, inf_end_fno):
+                            now_bf = self.c_calc_bf(bone_name, fno, is_key=False, is_read=False, is_reset_interpolation=False)
+                            now_bf.position = MVector3D(mxfilter.c__call__(now_bf.position.x(), -1), myfilter.c__call__(now_bf.position.y(), -1), mzfilter.c__call__(now_bf.position.z(), -1))
+                            # 補間曲線分割なしでそのまま登録
+                            self.c_set_bf(bone_name, fno, now_bf)
 
+                    for fno in range(inf_start_fno + 1, inf_end_fno):
                         if is_show_log and fno // 2000 > prev_sep_fno and fnos[-1] > 0:
                             if data_set_no > 0:
                                 logger.info("-- %sフレーム目:終了(%s％)【No.%s - 移動フィルタリング(%s) - %s】", fno, round((fno / fnos[-1]) * 100, 3), data_set_no, (n + 1), bone_name)
@@ -552,7 +906,7 @@ cdef class VmdMotion:
                         # 現在の回転にも少し近づける
                         now_bf.rotation = MQuaternion.slerp(filterd_qq, now_bf.rotation, 0.8)
                         # 補間曲線分割なしでそのまま登録
-                        self.bones[bone_name][fno] = now_bf
+                        self.c_set_bf(bone_name, fno, now_bf)
 
                     if is_show_log and inf_start_fno // 2000 > prev_sep_fno and fnos[-1] > 0:
                         if data_set_no > 0:
@@ -567,7 +921,7 @@ cdef class VmdMotion:
             bf = self.c_calc_bf(bone_name, fno, is_key=False, is_read=False, is_reset_interpolation=False)
 
             if fno in self.bones[bone_name] and not bf.key:
-                del self.bones[bone_name][fno]
+                self.c_delete_bf(bone_name, fno)
 
     # 指定ボーンの不要キーを削除する
     # 変曲点を求める
@@ -609,6 +963,8 @@ cdef class VmdMotion:
         cdef VmdBoneFrame next_bf = None
         cdef MQuaternion prev_rot = None
         cdef int fidx, fno, prev_fno, next_fno, n
+        # ログ出力対象であるか（出力しない場合、ログ用の値を計算しない）
+        cdef bint is_debug_info = logger.is_enabled_for(MLogger.DEBUG_INFO)
 
         if not infections:
             infections, r_dict, mx_dict, my_dict, mz_dict = self.c_get_infections(data_set_no, bone_name, is_rot, is_mov, fnos, active_fnos)
@@ -651,40 +1007,41 @@ cdef class VmdMotion:
 
             next_bf = None
 
-            # 単調増加としてキーを結合してみる
-            (joined_rot_bzs, rot_inflection) = MBezierUtils.join_value_2_bezier(inf_end_fno, f'{bone_name}R', rot_values, \
-                                                                                offset=offset, diff_limit=rot_diff_limit) if is_rot else (True, [])
-            (joined_mx_bzs, mx_inflection) = MBezierUtils.join_value_2_bezier(inf_end_fno, f'{bone_name}MX', mx_values, \
-                                                                              offset=offset, diff_limit=mov_diff_limit) if is_mov else (True, [])
-            (joined_my_bzs, my_inflection) = MBezierUtils.join_value_2_bezier(inf_end_fno, f'{bone_name}MY', my_values, \
-                                                                              offset=offset, diff_limit=mov_diff_limit) if is_mov else (True, [])
-            (joined_mz_bzs, mz_inflection) = MBezierUtils.join_value_2_bezier(inf_end_fno, f'{bone_name}MZ', mz_values, \
-                                                                              offset=offset, diff_limit=mov_diff_limit) if is_mov else (True, [])
+            # 単調増加としてキーを結合してみる（最小二乗法で補間曲線を当てはめる）
+            (joined_rot_bzs, rot_inflection) = MBezierUtils.c_fit_value_2_bezier(inf_end_fno, f'{bone_name}R', rot_values, offset, rot_diff_limit) if is_rot else (True, [])
+            (joined_mx_bzs, mx_inflection) = MBezierUtils.c_fit_value_2_bezier(inf_end_fno, f'{bone_name}MX', mx_values, offset, mov_diff_limit) if is_mov else (True, [])
+            (joined_my_bzs, my_inflection) = MBezierUtils.c_fit_value_2_bezier(inf_end_fno, f'{bone_name}MY', my_values, offset, mov_diff_limit) if is_mov else (True, [])
+            (joined_mz_bzs, mz_inflection) = MBezierUtils.c_fit_value_2_bezier(inf_end_fno, f'{bone_name}MZ', mz_values, offset, mov_diff_limit) if is_mov else (True, [])
 
             if joined_rot_bzs and joined_mx_bzs and joined_my_bzs and joined_mz_bzs:
                 next_bf = self.c_calc_bf(bone_name, inf_end_fno, is_key=False, is_read=False, is_reset_interpolation=False)
 
                 # 結合できた場合、補間曲線をnextに設定
                 if is_rot and len(joined_rot_bzs) > 0:
-                    logger.debug_info("☆%s: f: %s(%s), キー:回転補間曲線成功: 1: %s, 2: %s", bone_name, inf_start_fno, inf_end_fno, joined_rot_bzs[1].to_log(), joined_rot_bzs[2].to_log())
+                    if is_debug_info:
+                        logger.debug_info("☆%s: f: %s(%s), キー:回転補間曲線成功: 1: %s, 2: %s", bone_name, inf_start_fno, inf_end_fno, joined_rot_bzs[1].to_log(), joined_rot_bzs[2].to_log())
                     self.reset_interpolation_parts(bone_name, next_bf, joined_rot_bzs, MBezierUtils.R_x1_idxs, MBezierUtils.R_y1_idxs, MBezierUtils.R_x2_idxs, MBezierUtils.R_y2_idxs)
                 
                 if is_mov and len(joined_mx_bzs) > 0 and len(joined_my_bzs) > 0 and len(joined_mz_bzs) > 0:
-                    logger.debug_info("☆%s: f: %s(%s), キー:移動X補間曲線成功: 1: %s, 2: %s", bone_name, inf_start_fno, inf_end_fno, joined_mx_bzs[1].to_log(), joined_mx_bzs[2].to_log())
-                    logger.debug_info("☆%s: f: %s(%s), キー:移動Y補間曲線成功: 1: %s, 2: %s", bone_name, inf_start_fno, inf_end_fno, joined_my_bzs[1].to_log(), joined_my_bzs[2].to_log())
-                    logger.debug_info("☆%s: f: %s(%s), キー:移動Z補間曲線成功: 1: %s, 2: %s", bone_name, inf_start_fno, inf_end_fno, joined_mz_bzs[1].to_log(), joined_mz_bzs[2].to_log())
+                    if is_debug_info:
+                        logger.debug_info("☆%s: f: %s(%s), キー:移動X補間曲線成功: 1: %s, 2: %s", bone_name, inf_start_fno, inf_end_fno, joined_mx_bzs[1].to_log(), joined_mx_bzs[2].to_log())
+                        logger.debug_info("☆%s: f: %s(%s), キー:移動Y補間曲線成功: 1: %s, 2: %s", bone_name, inf_start_fno, inf_end_fno, joined_my_bzs[1].to_log(), joined_my_bzs[2].to_log())
+                        logger.debug_info("☆%s: f: %s(%s), キー:移動Z補間曲線成功: 1: %s, 2: %s", bone_name, inf_start_fno, inf_end_fno, joined_mz_bzs[1].to_log(), joined_mz_bzs[2].to_log())
                     self.reset_interpolation_parts(bone_name, next_bf, joined_mx_bzs, MBezierUtils.MX_x1_idxs, MBezierUtils.MX_y1_idxs, MBezierUtils.MX_x2_idxs, MBezierUtils.MX_y2_idxs)
                     self.reset_interpolation_parts(bone_name, next_bf, joined_my_bzs, MBezierUtils.MY_x1_idxs, MBezierUtils.MY_y1_idxs, MBezierUtils.MY_x2_idxs, MBezierUtils.MY_y2_idxs)
                     self.reset_interpolation_parts(bone_name, next_bf, joined_mz_bzs, MBezierUtils.MZ_x1_idxs, MBezierUtils.MZ_y1_idxs, MBezierUtils.MZ_x2_idxs, MBezierUtils.MZ_y2_idxs)
 
                 # 変曲点で登録
                 if bone_name in self.bones and inf_end_fno in self.bones[bone_name]:
+                    self.c_own_bone_frames(bone_name)
                     self.bones[bone_name][inf_end_fno].key = True
                     self.bones[bone_name][inf_end_fno].interpolation = next_bf.interpolation
-                    logger.debug_info("◇记录 %s: f: %s, next_bf(%s) rot:%s", bone_name, inf_end_fno, next_bf.fno, next_bf.rotation.toEulerAngles4MMD().to_log())
+                    if is_debug_info:
+                        logger.debug_info("◇记录 %s: f: %s, next_bf(%s) rot:%s", bone_name, inf_end_fno, next_bf.fno, next_bf.rotation.toEulerAngles4MMD().to_log())
                 else:
                     self.c_regist_bf(next_bf, bone_name, inf_end_fno, copy_interpolation=True, key=True)
-                    logger.debug_info("☆记录 %s: f: %s, next_bf(%s) rot:%s", bone_name, inf_end_fno, next_bf.fno, next_bf.rotation.toEulerAngles4MMD().to_log())
+                    if is_debug_info:
+                        logger.debug_info("☆记录 %s: f: %s, next_bf(%s) rot:%s", bone_name, inf_end_fno, next_bf.fno, next_bf.rotation.toEulerAngles4MMD().to_log())
                 
                 logger.debug_info("☆%s: f: %s, 删除关键帧: %s-%s", bone_name, inf_end_fno, inf_start_fno + 1, inf_end_fno - 1)
 
@@ -692,7 +1049,7 @@ cdef class VmdMotion:
                     # 結合できた場合、区間内を削除
                     if f in self.bones[bone_name]:
                         # self.bones[bone_name][f].key = False
-                        del self.bones[bone_name][f]
+                        self.c_delete_bf(bone_name, f)
                 
                 # 成功記録
                 is_prev_success = True
@@ -758,104 +1115,71 @@ cdef class VmdMotion:
         
         return activate_fnos
     
+    def get_infections(self, data_set_no: int, bone_name: str, is_rot: bint, is_mov: bint, fnos: np.ndarray, active_fnos: list):
+        return self.c_get_infections(data_set_no, bone_name, is_rot, is_mov, fnos, active_fnos)
+
     cdef tuple c_get_infections(self, int data_set_no, str bone_name, bint is_rot, bint is_mov, np.ndarray fnos, list active_fnos):
         cdef dict r_dict = {}
         cdef dict mx_dict = {}
         cdef dict my_dict = {}
         cdef dict mz_dict = {}
-        cdef dict rot_diff_value_dict = {}
-        cdef dict mx_diff_value_dict = {}
-        cdef dict my_diff_value_dict = {}
-        cdef dict mz_diff_value_dict = {}
         cdef np.ndarray[DTYPE_INT_t, ndim=1] r_infections = np.array([], dtype=np.int)
         cdef np.ndarray[DTYPE_INT_t, ndim=1] mx_infections = np.array([], dtype=np.int)
         cdef np.ndarray[DTYPE_INT_t, ndim=1] my_infections = np.array([], dtype=np.int)
         cdef np.ndarray[DTYPE_INT_t, ndim=1] mz_infections = np.array([], dtype=np.int)
+        cdef np.ndarray[DTYPE_FLOAT_t, ndim=2] positions, rotations, normalized_rotations, prev_rotations
+        cdef np.ndarray[DTYPE_FLOAT_t, ndim=1] rot_diff_values, mov_diff_values
+        cdef VmdBoneFrame bf
+        cdef int fidx, fno
+        # ログ出力対象であるか（出力しない場合、ログ用の配列を作らない）
+        cdef bint is_test = logger.is_enabled_for(MLogger.TEST)
 
-        for fidx, fno in enumerate(fnos):
-            bf = self.c_calc_bf(bone_name, fno, is_key=False, is_read=False, is_reset_interpolation=False)
-            logger.test("*%s: f: %s, bf(%s):rot:%s", bone_name, fno, bf.fno, bf.rotation.toEulerAngles4MMD().to_log())
+        if is_test or bone_name not in self.bones:
+            # キーフレ毎に求める（ボーンがない場合の登録も含む）
+            positions = np.zeros((len(fnos), 3), dtype=np.float64)
+            rotations = np.zeros((len(fnos), 4), dtype=np.float64)
 
-            if is_mov:
-                mx_dict[fno] = bf.position.x()
-                my_dict[fno] = bf.position.y()
-                mz_dict[fno] = bf.position.z()
-            
-            if is_rot:
-                r_dict[fno] = bf.rotation
+            for fidx, fno in enumerate(fnos):
+                bf = self.c_calc_bf(bone_name, fno, is_key=False, is_read=False, is_reset_interpolation=False)
+                if is_test:
+                    logger.test("*%s: f: %s, bf(%s):rot:%s", bone_name, fno, bf.fno, bf.rotation.toEulerAngles4MMD().to_log())
 
-        # 変化量
-        for fidx, fno in enumerate(fnos):
-            if is_rot:
-                if fidx == 0:
-                    rot_diff_value_dict[fno] = 0
-                    prev_rot = MQuaternion()
-                else:
-                    rot = r_dict[fno]
-                    rot_diff_value_dict[fno] = rot.calcTheata(prev_rot)
-                    prev_rot = rot
+                positions[fidx] = bf.position.data()
+                rotations[fidx] = bf.rotation.data().components
+        else:
+            # ボーン単位でまとめて求める
+            positions, rotations = self.c_calc_bone_values(bone_name, fnos)
 
-            if is_mov:
-                if fidx == 0:
-                    mx_diff_value_dict[fno] = 0
-                    my_diff_value_dict[fno] = 0
-                    mz_diff_value_dict[fno] = 0
-                else:
-                    mx_diff_value_dict[fno] = mx_dict[fno] - mx_dict[fnos[fidx - 1]]
-                    my_diff_value_dict[fno] = my_dict[fno] - my_dict[fnos[fidx - 1]]
-                    mz_diff_value_dict[fno] = mz_dict[fno] - mz_dict[fnos[fidx - 1]]
+        if is_mov:
+            mx_dict = dict(zip(fnos.tolist(), positions[:, 0].tolist()))
+            my_dict = dict(zip(fnos.tolist(), positions[:, 1].tolist()))
+            mz_dict = dict(zip(fnos.tolist(), positions[:, 2].tolist()))
+
+        if is_rot:
+            r_dict = {fno: MQuaternion(w, x, y, z) for fno, (w, x, y, z) in zip(fnos.tolist(), rotations.tolist())}
 
-        # 全変化量から変曲点を求める
+        # 変化量
         # https://teratail.com/questions/162391
         if is_rot:
-            rf_prime = np.gradient(list(rot_diff_value_dict.values()))                                                      # 差分近似
-            r_indices = np.where(np.diff(np.sign(rf_prime)))[0]                                                             # 変曲点を求める。
-            r_diff_indices = np.where(np.abs(np.diff(np.array(list(rot_diff_value_dict.values()))[r_indices])) > 0.001)     # 変曲点同士の差異が閾値以上
-            r_infections = (fnos[1:][r_indices])[r_diff_indices]                                                            # 変曲点のキーフレを再取得する
-
-            logger.debug_info("☆%s: start: %s, end: %s, rf_prime: %s", bone_name, fnos[0], fnos[-1], list(rf_prime))
-            logger.debug_info("☆%s: start: %s, end: %s, sign: %s", bone_name, fnos[0], fnos[-1], list(np.sign(rf_prime)))
-            logger.debug_info("☆%s: start: %s, end: %s, diff: %s", bone_name, fnos[0], fnos[-1], list(np.diff(np.sign(rf_prime))))
-            logger.debug_info("☆%s: start: %s, end: %s, r_indices: %s", bone_name, fnos[0], fnos[-1], list(fnos[r_indices]))
-            logger.debug_info("☆%s: start: %s, end: %s, index_diff: %s", bone_name, fnos[0], fnos[-1], list(np.diff(np.array(list(rot_diff_value_dict.values()))[r_indices])))
-            logger.debug_info("☆%s: start: %s, end: %s, r_diff_indices: %s", bone_name, fnos[0], fnos[-1], list((fnos[r_indices])[r_diff_indices]))
+            # 1つ前の回転との差（先頭の次は、単位回転との差）
+            normalized_rotations = rotations / np.sqrt(np.sum(rotations * rotations, axis=1)).reshape(-1, 1)
+            prev_rotations = np.tile(np.array([1, 0, 0, 0], dtype=np.float64), (len(fnos), 1))
+            prev_rotations[2:] = normalized_rotations[1:-1]
+            rot_diff_values = 1 - np.sum(normalized_rotations * prev_rotations, axis=1)
+            rot_diff_values[0] = 0
+            r_infections = self.c_get_value_infections(bone_name, "r", fnos, rot_diff_values, 0.001)
 
         if is_mov:
-            mxf_prime = np.gradient(list(mx_diff_value_dict.values()))
-            mx_indices = np.where(np.diff(np.sign(mxf_prime)))[0]
-            mx_diff_indices = np.where(np.abs(np.diff(np.array(list(mx_diff_value_dict.values()))[mx_indices])) > 0.003)
-            mx_infections = (fnos[1:][mx_indices])[mx_diff_indices]
-
-            logger.debug_info("☆%s: start: %s, end: %s, mxf_prime: %s", bone_name, fnos[0], fnos[-1], list(mxf_prime))
-            logger.debug_info("☆%s: start: %s, end: %s, sign: %s", bone_name, fnos[0], fnos[-1], list(np.sign(mxf_prime)))
-            logger.debug_info("☆%s: start: %s, end: %s, diff: %s", bone_name, fnos[0], fnos[-1], list(np.diff(np.sign(mxf_prime))))
-            logger.debug_info("☆%s: start: %s, end: %s, mx_indices: %s", bone_name, fnos[0], fnos[-1], list(fnos[mx_indices]))
-            logger.debug_info("☆%s: start: %s, end: %s, index_diff: %s", bone_name, fnos[0], fnos[-1], list(np.diff(np.array(list(mx_diff_value_dict.values()))[mx_indices])))
-            logger.debug_info("☆%s: start: %s, end: %s, mx_diff_indices: %s", bone_name, fnos[0], fnos[-1], list((fnos[mx_indices])[mx_diff_indices]))
-
-            myf_prime = np.gradient(list(my_diff_value_dict.values()))
-            my_indices = np.where(np.diff(np.sign(myf_prime)))[0]
-            my_diff_indices = np.where(np.abs(np.diff(np.array(list(my_diff_value_dict.values()))[my_indices])) > 0.003)
-            my_infections = (fnos[1:][my_indices])[my_diff_indices]
-
-            logger.debug_info("☆%s: start: %s, end: %s, myf_prime: %s", bone_name, fnos[0], fnos[-1], list(myf_prime))
-            logger.debug_info("☆%s: start: %s, end: %s, sign: %s", bone_name, fnos[0], fnos[-1], list(np.sign(myf_prime)))
-            logger.debug_info("☆%s: start: %s, end: %s, diff: %s", bone_name, fnos[0], fnos[-1], list(np.diff(np.sign(myf_prime))))
-            logger.debug_info("☆%s: start: %s, end: %s, my_indices: %s", bone_name, fnos[0], fnos[-1], list(fnos[my_indices]))
-            logger.debug_info("☆%s: start: %s, end: %s, index_diff: %s", bone_name, fnos[0], fnos[-1], list(np.diff(np.array(list(my_diff_value_dict.values()))[my_indices])))
-            logger.debug_info("☆%s: start: %s, end: %s, my_diff_indices: %s", bone_name, fnos[0], fnos[-1], list((fnos[my_indices])[my_diff_indices]))
-
-            mzf_prime = np.gradient(list(mz_diff_value_dict.values()))
-            mz_indices = np.where(np.diff(np.sign(mzf_prime)))[0]
-            mz_diff_indices = np.where(np.abs(np.diff(np.array(list(mz_diff_value_dict.values()))[mz_indices])) > 0.003)
-            mz_infections = (fnos[1:][mz_indices])[mz_diff_indices]
-
-            logger.debug_info("☆%s: start: %s, end: %s, mzf_prime: %s", bone_name, fnos[0], fnos[-1], list(mzf_prime))
-            logger.debug_info("☆%s: start: %s, end: %s, sign: %s", bone_name, fnos[0], fnos[-1], list(np.sign(mzf_prime)))
-            logger.debug_info("☆%s: start: %s, end: %s, diff: %s", bone_name, fnos[0], fnos[-1], list(np.diff(np.sign(mzf_prime))))
-            logger.debug_info("☆%s: start: %s, end: %s, mz_indices: %s", bone_name, fnos[0], fnos[-1], list(fnos[mz_indices]))
-            logger.debug_info("☆%s: start: %s, end: %s, index_diff: %s", bone_name, fnos[0], fnos[-1], list(np.diff(np.array(list(mz_diff_value_dict.values()))[mz_indices])))
-            logger.debug_info("☆%s: start: %s, end: %s, mz_diff_indices: %s", bone_name, fnos[0], fnos[-1], list((fnos[mz_indices])[mz_diff_indices]))
+            for axis_idx in range(3):
+                mov_diff_values = np.zeros(len(fnos), dtype=np.float64)
+                mov_diff_values[1:] = np.diff(positions[:, axis_idx])
+
+                if axis_idx == 0:
+                    mx_infections = self.c_get_value_infections(bone_name, "mx", fnos, mov_diff_values, 0.003)
+                elif axis_idx == 1:
+                    my_infections = self.c_get_value_infections(bone_name, "my", fnos, mov_diff_values, 0.003)
+                else:
+                    mz_infections = self.c_get_value_infections(bone_name, "mz", fnos, mov_diff_values, 0.003)
 
         # 各値の変曲点の和集合かつ有効なキーフレのみ対象とする
         infections = sorted(set(set([active_fnos[0], active_fnos[-1]]) | set(r_infections) | set(mx_infections) | set(my_infections) | set(mz_infections) | set([active_fnos[-1]])) & set(active_fnos))
@@ -869,6 +1193,23 @@ cdef class VmdMotion:
 
         return (infections, r_dict, mx_dict, my_dict, mz_dict)
 
+    # 変化量から変曲点を求める
+    cdef np.ndarray c_get_value_infections(self, str bone_name, str value_name, np.ndarray fnos, np.ndarray diff_values, double diff_limit):
+        f_prime = np.gradient(diff_values)                                                  # 差分近似
+        indices = np.where(np.diff(np.sign(f_prime)))[0]                                    # 変曲点を求める。
+        diff_indices = np.where(np.abs(np.diff(diff_values[indices])) > diff_limit)         # 変曲点同士の差異が閾値以上
+        infections = (fnos[1:][indices])[diff_indices]                                      # 変曲点のキーフレを再取得する
+
+        if logger.is_enabled_for(MLogger.DEBUG_INFO):
+            logger.debug_info("☆%s: start: %s, end: %s, %sf_prime: %s", bone_name, fnos[0], fnos[-1], value_name, list(f_prime))
+            logger.debug_info("☆%s: start: %s, end: %s, sign: %s", bone_name, fnos[0], fnos[-1], list(np.sign(f_prime)))
+            logger.debug_info("☆%s: start: %s, end: %s, diff: %s", bone_name, fnos[0], fnos[-1], list(np.diff(np.sign(f_prime))))
+            logger.debug_info("☆%s: start: %s, end: %s, %s_indices: %s", bone_name, fnos[0], fnos[-1], value_name, list(fnos[indices]))
+            logger.debug_info("☆%s: start: %s, end: %s, index_diff: %s", bone_name, fnos[0], fnos[-1], list(np.diff(diff_values[indices])))
+            logger.debug_info("☆%s: start: %s, end: %s, %s_diff_indices: %s", bone_name, fnos[0], fnos[-1], value_name, list((fnos[indices])[diff_indices]))
+
+        return infections
+
     # 平滑化
     cdef dict c_smooth_values(self, dict value_dict, dict config):
         efilter = OneEuroFilter(**config)
@@ -917,7 +1258,7 @@ cdef class VmdMotion:
             
         # キーを登録
         regist_bf.key = key
-        self.bones[bone_name][fno] = regist_bf
+        self.c_set_bf(bone_name, fno, regist_bf)
         # 補間曲線を設定（有効なキーのみ）
         cdef int prev_fno, next_fno
         cdef VmdBoneFrame prev_bf, next_bf
@@ -949,6 +1290,9 @@ cdef class VmdMotion:
         # is_read: データ読み込み時のキーを探す
         if fno in self.bones[bone_name] and (not is_key or (is_key and self.bones[bone_name][fno].key)) and (not is_read or (is_read and self.bones[bone_name][fno].read)):
             # 合致するキーが見つかった場合、それを返す
+            if not self.is_snapshot and bone_name in self.shared_bone_names:
+                # 呼び出し元で書き換えられるので、共有中のキーフレは複製してから返す
+                return self.c_own_bone_frames(bone_name)[fno]
             return self.bones[bone_name][fno]
         else:
             # 合致するキーが見つからなかった場合
@@ -956,33 +1300,39 @@ cdef class VmdMotion:
                 # 既存キーのみ探している場合はNone
                 return None
 
-        # 番号より前のフレーム番号
-        cdef list before_fnos = [x for x in sorted(self.bones[bone_name].keys()) if (x < fno)]
-        # 番号より後のフレーム番号
-        cdef list after_fnos = [x for x in sorted(self.bones[bone_name].keys()) if (x > fno)]
+        if is_reset_interpolation and bone_name in self.shared_bone_names:
+            # 前後キーの補間曲線を書き換えるので、共有中のキーフレは複製しておく
+            self.c_own_bone_frames(bone_name)
 
-        if len(after_fnos) == 0 and len(before_fnos) == 0:
+        # 昇順フレーム番号から前後のキーを二分探索する
+        cdef list fnos = self.c_get_bone_fno_index(bone_name)
+        # 番号より前のフレーム番号のINDEX
+        cdef int before_idx = bisect_left(fnos, fno) - 1
+        # 番号より後のフレーム番号のINDEX
+        cdef int after_idx = bisect_right(fnos, fno)
+
+        if after_idx >= len(fnos) and before_idx < 0:
             fill_bf.set_name(bone_name)
             return fill_bf
 
-        if len(after_fnos) == 0:
+        if after_idx >= len(fnos):
             # 番号より前があって、後のがない場合、前のをコピーして返す
-            fill_bf = self.bones[bone_name][before_fnos[-1]].copy()
+            fill_bf = self.bones[bone_name][fnos[before_idx]].copy()
             fill_bf.fno = fno
             fill_bf.key = False
             fill_bf.read = False
             return fill_bf
         
-        if len(before_fnos) == 0:
+        if before_idx < 0:
             # 番号より後があって、前がない場合、後のをコピーして返す
-            fill_bf = self.bones[bone_name][after_fnos[0]].copy()
+            fill_bf = self.bones[bone_name][fnos[after_idx]].copy()
             fill_bf.fno = fno
             fill_bf.key = False
             fill_bf.read = False
             return fill_bf
 
-        cdef VmdBoneFrame prev_bf = self.bones[bone_name][before_fnos[-1]]
-        cdef VmdBoneFrame next_bf = self.bones[bone_name][after_fnos[0]]
+        cdef VmdBoneFrame prev_bf = self.bones[bone_name][fnos[before_idx]]
+        cdef VmdBoneFrame next_bf = self.bones[bone_name][fnos[after_idx]]
 
         # 名前をコピー
         fill_bf.name = prev_bf.name
@@ -1001,24 +1351,24 @@ cdef class VmdMotion:
 
             # 回転の分割
             r_x, r_y, r_t, r_bresult, r_aresult, r_before_bz, r_after_bz \
-                = MBezierUtils.split_bezier_mmd(next_bf.interpolation[MBezierUtils.R_x1_idxs[3]], next_bf.interpolation[MBezierUtils.R_y1_idxs[3]], \
-                                                next_bf.interpolation[MBezierUtils.R_x2_idxs[3]], next_bf.interpolation[MBezierUtils.R_y2_idxs[3]], \
-                                                prev_bf.fno, fill_bf.fno, next_bf.fno)
+                = MBezierUtils.c_split_bezier_mmd(next_bf.interpolation[MBezierUtils.R_x1_idxs[3]], next_bf.interpolation[MBezierUtils.R_y1_idxs[3]], \
+                                                  next_bf.interpolation[MBezierUtils.R_x2_idxs[3]], next_bf.interpolation[MBezierUtils.R_y2_idxs[3]], \
+                                                  prev_bf.fno, fill_bf.fno, next_bf.fno)
             # 移動Xの分割
             x_x, x_y, x_t, x_bresult, x_aresult, x_before_bz, x_aftex_bz \
-                = MBezierUtils.split_bezier_mmd(next_bf.interpolation[MBezierUtils.MX_x1_idxs[3]], next_bf.interpolation[MBezierUtils.MX_y1_idxs[3]], \
-                                                next_bf.interpolation[MBezierUtils.MX_x2_idxs[3]], next_bf.interpolation[MBezierUtils.MX_y2_idxs[3]], \
-                                                prev_bf.fno, fill_bf.fno, next_bf.fno)
+                = MBezierUtils.c_split_bezier_mmd(next_bf.interpolation[MBezierUtils.MX_x1_idxs[3]], next_bf.interpolation[MBezierUtils.MX_y1_idxs[3]], \
+                                                  next_bf.interpolation[MBezierUtils.MX_x2_idxs[3]], next_bf.interpolation[MBezierUtils.MX_y2_idxs[3]], \
+                                                  prev_bf.fno, fill_bf.fno, next_bf.fno)
             # 移動Yの分割
             y_x, y_y, y_t, y_bresult, y_aresult, y_before_bz, y_aftey_bz \
-                = MBezierUtils.split_bezier_mmd(next_bf.interpolation[MBezierUtils.MY_x1_idxs[3]], next_bf.interpolation[MBezierUtils.MY_y1_idxs[3]], \
-                                                next_bf.interpolation[MBezierUtils.MY_x2_idxs[3]], next_bf.interpolation[MBezierUtils.MY_y2_idxs[3]], \
-                                                prev_bf.fno, fill_bf.fno, next_bf.fno)
+                = MBezierUtils.c_split_bezier_mmd(next_bf.interpolation[MBezierUtils.MY_x1_idxs[3]], next_bf.interpolation[MBezierUtils.MY_y1_idxs[3]], \
+                                                  next_bf.interpolation[MBezierUtils.MY_x2_idxs[3]], next_bf.interpolation[MBezierUtils.MY_y2_idxs[3]], \
+                                                  prev_bf.fno, fill_bf.fno, next_bf.fno)
             # 移動Zの分割
             z_x, z_y, z_t, z_bresult, z_aresult, z_before_bz, z_aftez_bz \
-                = MBezierUtils.split_bezier_mmd(next_bf.interpolation[MBezierUtils.MZ_x1_idxs[3]], next_bf.interpolation[MBezierUtils.MZ_y1_idxs[3]], \
-                                                next_bf.interpolation[MBezierUtils.MZ_x2_idxs[3]], next_bf.interpolation[MBezierUtils.MZ_y2_idxs[3]], \
-                                                prev_bf.fno, fill_bf.fno, next_bf.fno)
+                = MBezierUtils.c_split_bezier_mmd(next_bf.interpolation[MBezierUtils.MZ_x1_idxs[3]], next_bf.interpolation[MBezierUtils.MZ_y1_idxs[3]], \
+                                                  next_bf.interpolation[MBezierUtils.MZ_x2_idxs[3]], next_bf.interpolation[MBezierUtils.MZ_y2_idxs[3]], \
+                                                  prev_bf.fno, fill_bf.fno, next_bf.fno)
 
             # 強制設定
             self.reset_interpolation(bone_name, prev_bf, fill_bf, next_bf, r_before_bz, r_after_bz, \
@@ -1034,37 +1384,37 @@ cdef class VmdMotion:
 
     # 補間曲線を元に、回転ボーンの値を求める
     cdef MQuaternion calc_bf_rot(self, VmdBoneFrame prev_bf, VmdBoneFrame fill_bf, VmdBoneFrame next_bf):
-        cdef double rx, ry, rt
+        cdef double ry
 
         if prev_bf.rotation != next_bf.rotation:
             # 回転補間曲線
-            rx, ry, rt = MBezierUtils.evaluate(next_bf.interpolation[MBezierUtils.R_x1_idxs[3]], next_bf.interpolation[MBezierUtils.R_y1_idxs[3]], \
-                                               next_bf.interpolation[MBezierUtils.R_x2_idxs[3]], next_bf.interpolation[MBezierUtils.R_y2_idxs[3]], \
-                                               prev_bf.fno, fill_bf.fno, next_bf.fno)
+            ry = MBezierUtils.c_evaluate_y(next_bf.interpolation[MBezierUtils.R_x1_idxs[3]], next_bf.interpolation[MBezierUtils.R_y1_idxs[3]], \
+                                           next_bf.interpolation[MBezierUtils.R_x2_idxs[3]], next_bf.interpolation[MBezierUtils.R_y2_idxs[3]], \
+                                           prev_bf.fno, fill_bf.fno, next_bf.fno)
             return MQuaternion.slerp(prev_bf.rotation, next_bf.rotation, ry)
 
         return prev_bf.rotation.copy()
 
     # 補間曲線を元に移動ボーンの値を求める
     cdef MVector3D calc_bf_pos(self, VmdBoneFrame prev_bf, VmdBoneFrame fill_bf, VmdBoneFrame next_bf):
-        cdef double xx, xy, xt, yx, yy, yt, zx, zy, zt
+        cdef double xy, yy, zy
         cdef MVector3D fill_pos
 
         # 補間曲線を元に間を埋める
         if prev_bf.position != next_bf.position:
             # http://rantyen.blog.fc2.com/blog-entry-65.html
             # X移動補間曲線
-            xx, xy, xt = MBezierUtils.evaluate(next_bf.interpolation[MBezierUtils.MX_x1_idxs[3]], next_bf.interpolation[MBezierUtils.MX_y1_idxs[3]], \
-                                               next_bf.interpolation[MBezierUtils.MX_x2_idxs[3]], next_bf.interpolation[MBezierUtils.MX_y2_idxs[3]], \
-                                               prev_bf.fno, fill_bf.fno, next_bf.fno)
+            xy = MBezierUtils.c_evaluate_y(next_bf.interpolation[MBezierUtils.MX_x1_idxs[3]], next_bf.interpolation[MBezierUtils.MX_y1_idxs[3]], \
+                                           next_bf.interpolation[MBezierUtils.MX_x2_idxs[3]], next_bf.interpolation[MBezierUtils.MX_y2_idxs[3]], \
+                                           prev_bf.fno, fill_bf.fno, next_bf.fno)
             # Y移動補間曲線
-            yx, yy, yt = MBezierUtils.evaluate(next_bf.interpolation[MBezierUtils.MY_x1_idxs[3]], next_bf.interpolation[MBezierUtils.MY_y1_idxs[3]], \
-                                               next_bf.interpolation[MBezierUtils.MY_x2_idxs[3]], next_bf.interpolation[MBezierUtils.MY_y2_idxs[3]], \
-                                               prev_bf.fno, fill_bf.fno, next_bf.fno)
+            yy = MBezierUtils.c_evaluate_y(next_bf.interpolation[MBezierUtils.MY_x1_idxs[3]], next_bf.interpolation[MBezierUtils.MY_y1_idxs[3]], \
+                                           next_bf.interpolation[MBezierUtils.MY_x2_idxs[3]], next_bf.interpolation[MBezierUtils.MY_y2_idxs[3]], \
+                                           prev_bf.fno, fill_bf.fno, next_bf.fno)
             # Z移動補間曲線
-            zx, zy, zt = MBezierUtils.evaluate(next_bf.interpolation[MBezierUtils.MZ_x1_idxs[3]], next_bf.interpolation[MBezierUtils.MZ_y1_idxs[3]], \
-                                               next_bf.interpolation[MBezierUtils.MZ_x2_idxs[3]], next_bf.interpolation[MBezierUtils.MZ_y2_idxs[3]], \
-                                               prev_bf.fno, fill_bf.fno, next_bf.fno)
+            zy = MBezierUtils.c_evaluate_y(next_bf.interpolation[MBezierUtils.MZ_x1_idxs[3]], next_bf.interpolation[MBezierUtils.MZ_y1_idxs[3]], \
+                                           next_bf.interpolation[MBezierUtils.MZ_x2_idxs[3]], next_bf.interpolation[MBezierUtils.MZ_y2_idxs[3]], \
+                                           prev_bf.fno, fill_bf.fno, next_bf.fno)
 
             fill_pos = MVector3D()
             fill_pos.setX(prev_bf.position.x() + ((next_bf.position.x() - prev_bf.position.x()) * xy))
@@ -1084,7 +1434,7 @@ cdef class VmdMotion:
         # 補間曲線もともに分割する
         cdef VmdBoneFrame fill_bf = self.c_calc_bf(target_bone_name, fill_fno, is_key=False, is_read=False, is_reset_interpolation=True)
         fill_bf.key = True
-        self.bones[target_bone_name][fill_fno] = fill_bf
+        self.c_set_bf(target_bone_name, fill_fno, fill_bf)
 
         # 分割結果
         cdef bint fill_result = True
@@ -1141,9 +1491,9 @@ cdef class VmdMotion:
         cdef int next_y2v = next_bf.interpolation[y2_idxs[3]]
         cdef int new_fill_fno
 
-        if not MBezierUtils.is_fit_bezier_mmd([MVector2D(), MVector2D(next_x1v, next_y1v), MVector2D(next_x2v, next_y2v), MVector2D()]):
+        if not MBezierUtils.c_is_fit_bezier_mmd([MVector2D(), MVector2D(next_x1v, next_y1v), MVector2D(next_x2v, next_y2v), MVector2D()], 0):
             # ベジェ曲線がMMDの範囲内に収まっていない場合、中点で分割
-            new_fill_fno, _, _ = MBezierUtils.evaluate_by_t(next_x1v, next_y1v, next_x2v, next_y2v, prev_bf.fno, next_bf.fno, 0.5)
+            new_fill_fno, _, _ = MBezierUtils.c_evaluate_by_t(next_x1v, next_y1v, next_x2v, next_y2v, prev_bf.fno, next_bf.fno, 0.5)
 
             if prev_bf.fno < new_fill_fno < next_bf.fno:
                 return new_fill_fno
@@ -1362,7 +1712,8 @@ cdef class VmdMotion:
     cdef c_smooth_filter_mf(self, int data_set_no, str morph_name, int loop, dict config, int start_fno, int end_fno, bint is_show_log):
         cdef OneEuroFilter rxfilter
         cdef int n
-        cdef list fnos
+        cdef list fnos, now_mfs
+        cdef np.ndarray ratios
         cdef prev_sep_fno = 0
         cdef VmdMorphFrame now_mf
 
@@ -1380,10 +1731,13 @@ cdef class VmdMotion:
                 # 範囲指定がある場合はその範囲内だけ
                 fnos = self.get_morph_fnos(morph_name, start_fno=start_fno, end_fno=end_fno)
 
-            # 全区間をフィルタにかける
-            for fno in fnos:
-                now_mf = self.c_calc_mf(morph_name, fno, is_key=False, is_read=False)
-                now_mf.ratio = rxfilter(now_mf.ratio, fno)
+            # 全区間をまとめてフィルタにかける
+            now_mfs = [self.c_calc_mf(morph_name, fno, is_key=False, is_read=False) for fno in fnos]
+            ratios = rxfilter.c_filter_values(np.array([mf.ratio for mf in now_mfs], dtype=np.float64), np.array(fnos, dtype=np.float64))
+
+            for now_mf, ratio in zip(now_mfs, ratios):
+                now_mf.ratio = ratio
+                fno = now_mf.fno
 
                 if is_show_log and data_set_no > 0 and fno // 2000 > prev_sep_fno and fnos[-1] > 0:
                     logger.info("-- 第%s帧：完成(%s％)【No.%s - 过滤 - %s(%s)】", fno, round((fno / fnos[-1]) * 100, 3), data_set_no, morph_name, (n + 1))
@@ -1528,31 +1882,184 @@ cdef class VmdMotion:
         keys = []
         for bone_name in bone_names:
             if bone_name in self.bones:
-                keys.extend([x for x in self.bones[bone_name].keys() if self.bones[bone_name][x].fno >= start_fno and self.bones[bone_name][x].fno <= end_fno and \
-                            (not is_key or (is_key and self.bones[bone_name][x].key)) and (not is_read or (is_read and self.bones[bone_name][x].read))])
+                bone_frames = self.bones[bone_name]
+                fnos = self.c_get_bone_fno_index(bone_name)
+                # 範囲内のフレーム番号は二分探索で切り出す
+                range_fnos = fnos[bisect_left(fnos, start_fno):bisect_right(fnos, end_fno)]
+
+                if is_key or is_read:
+                    range_fnos = [x for x in range_fnos if (not is_key or bone_frames[x].key) and (not is_read or bone_frames[x].read)]
+                
+                if len(bone_names) == 1:
+                    # 単一ボーンの場合、既に重複のない昇順なのでそのまま返す
+                    return range_fnos
+
+                keys.extend(range_fnos)
         
         # 重複を除いた昇順フレーム番号リストを返す
         return sorted(list(set(keys)))
     
     # 指定されたfnoの前後のキーを取得する
     def get_bone_prev_next_fno(self, *bone_names, **kwargs):
-        # 指定されたボーン名のfnos
-        fnos = self.get_bone_fnos(*bone_names, **kwargs)
+        is_key = True if "is_key" in kwargs and kwargs["is_key"] else False
+        is_read = True if "is_read" in kwargs and kwargs["is_read"] else False
+        start_fno = kwargs["start_fno"] if "start_fno" in kwargs and kwargs["start_fno"] else 0
+        end_fno = kwargs["end_fno"] if "end_fno" in kwargs and kwargs["end_fno"] else 9999999999
 
         fno = kwargs["fno"] if "fno" in kwargs else 0
 
-        # 指定より前のキーフレ
-        prev_fnos = [x for x in fnos if x < fno]
-        # 指定より後のキーフレ
-        next_fnos = [x for x in fnos if x > fno]
-        
         # 前のは取れなければ-1で強制的に前の
-        prev_fno = -1 if len(prev_fnos) <= 0 else prev_fnos[-1]
+        prev_fno = -1
         # 後のは取れなければ最終フレーム＋1
-        next_fno = self.last_motion_frame + 1 if len(next_fnos) <= 0 else next_fnos[0]
+        next_fno = self.last_motion_frame + 1
+        has_next = False
+
+        for bone_name in bone_names:
+            if bone_name not in self.bones:
+                continue
+
+            bone_frames = self.bones[bone_name]
+            fnos = self.c_get_bone_fno_index(bone_name)
+
+            # 指定より前のキーフレ（条件に合うまで前に辿る）
+            idx = bisect_left(fnos, fno) - 1
+            while idx >= 0 and fnos[idx] >= start_fno:
+                x = fnos[idx]
+                if x <= end_fno and (not is_key or bone_frames[x].key) and (not is_read or bone_frames[x].read):
+                    prev_fno = max(prev_fno, x)
+                    break
+                idx -= 1
+
+            # 指定より後のキーフレ（条件に合うまで後ろに辿る）
+            idx = bisect_right(fnos, fno)
+            while idx < len(fnos) and fnos[idx] <= end_fno:
+                x = fnos[idx]
+                if x >= start_fno and (not is_key or bone_frames[x].key) and (not is_read or bone_frames[x].read):
+                    next_fno = x if not has_next else min(next_fno, x)
+                    has_next = True
+                    break
+                idx += 1
 
         return prev_fno, next_fno
 
+    # 指定ボーンの昇順フレーム番号リスト（前後キーの二分探索用）
+    # キーフレの追加・削除は c_set_bf / c_delete_bf（set_bf / delete_bf）経由で行い、リストも同時に更新すること
+    # キーフレ辞書ごと差し替えられた場合は作り直す（件数が変わっている場合も念のため作り直す）
+    cdef list c_get_bone_fno_index(self, str bone_name):
+        cdef dict bone_frames = self.bones[bone_name]
+        cdef tuple fno_index = self.bone_fno_indexes.get(bone_name, None)
+
+        if fno_index is None or fno_index[0] is not bone_frames or len(fno_index[1]) != len(bone_frames):
+            fno_index = (bone_frames, sorted(bone_frames.keys()))
+            self.bone_fno_indexes[bone_name] = fno_index
+
+        return fno_index[1]
+
+    # 他のモーションと共有中のキーフレ辞書を複製して、このモーション専用にする
+    def own_bone_frames(self, bone_name: str):
+        return self.c_own_bone_frames(bone_name)
+
+    cdef dict c_own_bone_frames(self, str bone_name):
+        cdef dict bone_frames = self.bones[bone_name]
+        cdef tuple fno_index
+        cdef VmdBoneFrame bf
+
+        if bone_name in self.shared_bone_names:
+            fno_index = self.bone_fno_indexes.get(bone_name, None)
+
+            bone_frames = {fno: bf.copy() for fno, bf in bone_frames.items()}
+            self.bones[bone_name] = bone_frames
+            self.shared_bone_names.discard(bone_name)
+
+            if fno_index is not None:
+                # フレーム番号リストはそのまま使い回す
+                self.bone_fno_indexes[bone_name] = (bone_frames, fno_index[1])
+
+        return bone_frames
+
+    # キーフレを登録し、フレーム番号リストも更新する
+    def set_bf(self, bone_name: str, fno: int, bf: VmdBoneFrame):
+        self.c_set_bf(bone_name, fno, bf)
+
+    cdef c_set_bf(self, str bone_name, int fno, VmdBoneFrame bf):
+        if bone_name not in self.bones:
+            self.bones[bone_name] = {}
+
+        self.c_own_bone_frames(bone_name)
+
+        cdef list fnos = self.c_get_bone_fno_index(bone_name)
+        if fno not in self.bones[bone_name]:
+            fnos.insert(bisect_left(fnos, fno), fno)
+
+        self.bones[bone_name][fno] = bf
+
+        # モーションが変わったので、FKキャッシュは破棄
+        if self.fk_cache:
+            self.fk_cache = {}
+
+    # キーフレを削除し、フレーム番号リストも更新する
+    def delete_bf(self, bone_name: str, fno: int):
+        self.c_delete_bf(bone_name, fno)
+
+    cdef c_delete_bf(self, str bone_name, int fno):
+        if bone_name not in self.bones or fno not in self.bones[bone_name]:
+            return
+
+        self.c_own_bone_frames(bone_name)
+
+        cdef list fnos = self.c_get_bone_fno_index(bone_name)
+        del fnos[bisect_left(fnos, fno)]
+        del self.bones[bone_name][fno]
+
+        # モーションが変わったので、FKキャッシュは破棄
+        if self.fk_cache:
+            self.fk_cache = {}
+
+    # 指定ボーンの補間後の値を、フレーム範囲（またはフレーム番号リスト）でまとめて求める
+    # 戻り値は（フレーム番号、移動(n x 3)、回転(n x 4: w, x, y, z)）で、キーフレは追加しない
+    def calc_bone_values(self, bone_name: str, fnos=None, start_fno=0, end_fno=-1):
+        cdef list bone_fnos
+
+        if fnos is None:
+            if end_fno < 0:
+                # 範囲指定がない場合、最後のキーフレまで
+                bone_fnos = self.get_bone_fnos(bone_name)
+                end_fno = bone_fnos[-1] if len(bone_fnos) > 0 else start_fno
+            fnos = range(start_fno, end_fno + 1)
+
+        target_fnos = np.array(fnos, dtype=np.int)
+        positions, rotations = self.c_calc_bone_values(bone_name, target_fnos)
+
+        return target_fnos, positions, rotations
+
+    cdef tuple c_calc_bone_values(self, str bone_name, np.ndarray fnos):
+        # キーフレの区間毎に一度だけ前後を探して、補間曲線を評価する
+        return (<VmdBoneTrack> VmdBoneTrack.from_frames(bone_name, self.bones.get(bone_name, {}), self.last_motion_frame)).c_calc_values(fnos)
+
+    # 指定ボーンのキーフレを、列ごとの配列で保持するトラックに変換する
+    def get_bone_track(self, bone_name: str):
+        return VmdBoneTrack.from_frames(bone_name, self.bones.get(bone_name, {}), self.last_motion_frame)
+
+    # トラックの内容で、ボーンのキーフレを置き換える
+    def set_bone_track(self, track: VmdBoneTrack):
+        self.bones[track.name] = track.to_frames()
+        self.shared_bone_names.discard(track.name)
+
+        # モーションが変わったので、FKキャッシュは破棄
+        if self.fk_cache:
+            self.fk_cache = {}
+
+    # FK計算結果のキャッシュを有効にする
+    # キーフレを直接書き換えた場合は検知できないため、読み取り専用のモーションでのみ使用すること
+    def start_fk_cache(self):
+        if self.fk_cache is None:
+            self.fk_cache = {}
+
+    # FK計算結果のキャッシュをクリアする
+    def clear_fk_cache(self):
+        if self.fk_cache:
+            self.fk_cache = {}
+
     # カメラモーション：フレーム番号リスト
     def get_camera_fnos(self):
         if not self.cameras:
@@ -1622,11 +2129,8 @@ cdef class VmdMotion:
 
     # ボーンキーフレを追加
     def append_bone_frame(self, frame: VmdBoneFrame):
-        if frame.name not in self.bones:
-            # まだ該当ボーン名がない場合、追加
-            self.bones[frame.name] = {}
-        
-        self.bones[frame.name][frame.fno] = frame
+        # まだ該当ボーン名がない場合も含めて、フレーム番号リストと一緒に追加
+        self.c_set_bf(frame.name, frame.fno, frame)
 
     # モーフキーフレを追加
     def append_morph_frame(self, frame: VmdMorphFrame):
@@ -1645,7 +2149,9 @@ cdef class VmdMotion:
         
         return new_motion
 
-    def copy(self):
+    # is_snapshot: 読み取り専用のスナップショットとして複製する
+    # ボーンのキーフレ辞書は複製元と共有し、どちらかで書き換える時に初めて複製する
+    def copy(self, is_snapshot=False):
         motion = VmdMotion()
 
         motion.path = cPickle.loads(cPickle.dumps(self.path, -1))
@@ -1654,10 +2160,10 @@ cdef class VmdMotion:
         motion.last_motion_frame = cPickle.loads(cPickle.dumps(self.last_motion_frame, -1))
         motion.motion_cnt = cPickle.loads(cPickle.dumps(self.motion_cnt, -1))
 
-        for bone_name, bf_dict in self.bones.items():
-            motion.bones[bone_name] = {}
-            for bf in bf_dict.values():
-                motion.bones[bone_name][bf.fno] = bf.copy()
+        motion.bones = dict(self.bones)
+        motion.shared_bone_names = set(self.bones.keys())
+        motion.is_snapshot = is_snapshot
+        self.shared_bone_names.update(motion.shared_bone_names)
 
         motion.morph_cnt = cPickle.loads(cPickle.dumps(self.morph_cnt, -1))
         motion.morphs = cPickle.loads(cPickle.dumps(self.morphs, -1))
@@ -3,6 +3,7 @@
 import struct
 import hashlib
 import re
+import numpy as np
 
 from mmd.VmdData import VmdMotion, VmdBoneFrame, VmdCameraFrame, VmdInfoIk, VmdLightFrame, VmdMorphFrame, VmdShadowFrame, VmdShowIkFrame
 from module.MMath import MRect, MVector3D, MVector4D, MQuaternion, MMatrix4x4 # noqa
@@ -11,6 +12,20 @@ from utils.MException import SizingException, MKilledException, MParseException
 
 logger = MLogger(__name__)
 
+# ボーンフレーム（ボーン名, フレームIDX, 位置X,Y,Z, 回転X,Y,Z,scalar, 補間曲線）
+BONE_FRAME_DTYPE = np.dtype([("bname", "S15"), ("fno", "<u4"), ("position", "<f4", (3,)), ("rotation", "<f4", (4,)), ("interpolation", "u1", (64,))])
+# モーフフレーム（モーフ名, フレームIDX, 度数）
+MORPH_FRAME_DTYPE = np.dtype([("bname", "S15"), ("fno", "<u4"), ("ratio", "<f4")])
+# カメラフレーム（フレームIDX, 距離, 位置X,Y,Z, 角度X,Y,Z, 補間曲線, 視野角, パース有無）
+CAMERA_FRAME_DTYPE = np.dtype([("fno", "<u4"), ("length", "<f4"), ("position", "<f4", (3,)), ("euler", "<f4", (3,)), ("interpolation", "u1", (24,)), \
+                               ("angle", "<u4"), ("perspective", "u1")])
+# 照明フレーム（フレームIDX, 照明色, 照明位置）
+LIGHT_FRAME_DTYPE = np.dtype([("fno", "<u4"), ("color", "<f4", (3,)), ("position", "<f4", (3,))])
+# セルフ影フレーム（フレームIDX, シャドウ種別, 距離）
+SHADOW_FRAME_DTYPE = np.dtype([("fno", "<u4"), ("type", "u1"), ("distance", "<f4")])
+# IK情報（IK名, ON/OFF）
+IK_INFO_DTYPE = np.dtype([("bname", "S20"), ("onoff", "u1")])
+
 
 class VmdReader:
     def __init__(self, file_path):
@@ -46,53 +61,41 @@ class VmdReader:
                 # VMDファイルをバイナリ読み込み
                 self.buffer = f.read()
 
-                # vmdバージョン
-                signature = self.unpack(30, "30s")
-                logger.test("signature %s", signature)
-
-                # モデル名
-                model_bname, model_name = self.read_text(20)
-                logger.test("model_bname %s, model_name: %s", model_bname, model_name)
-                motion.model_name = model_name
+                # vmdバージョン・モデル名
+                self.read_header(motion)
 
-                # モーション数
-                motion.motion_cnt = self.read_uint(4)
-                logger.test("motion.motion_cnt %s", motion.motion_cnt)
+                # ボーン・モーフ・カメラ・照明・セルフ影・IKの各セクションを配列で一括読み込み
+                sections = self.read_sections(motion)
 
                 # 1F分のモーション情報
+                bone_frames = sections["bone"]
+                bone_names = self.decode_bnames(bone_frames["bname"], 15)
+                fnos = bone_frames["fno"].tolist()
+                positions = bone_frames["position"].tolist()
+                rotations = bone_frames["rotation"].tolist()
+                interpolations = bone_frames["interpolation"].tolist()
 
                 prev_n = 0
-                for n in range(motion.motion_cnt):
-                    frame = VmdBoneFrame(0)
+                for n, (bone_bname, bone_name) in enumerate(bone_names):
+                    frame = VmdBoneFrame(fnos[n])
                     frame.key = True
                     frame.read = True
 
-                    # ボーン ----------------------
                     # ボーン名
-                    bone_bname, bone_name = self.read_text(15)
-
                     frame.name = bone_name
                     frame.bname = bone_bname
-                    logger.test("name: %s, bname %s", bone_name, bone_bname)
-
-                    # フレームIDX
-                    frame.fno = self.read_uint(4)
-                    logger.test("frame.fno %s", frame.fno)
 
                     # 位置X,Y,Z
-                    frame.position = self.read_Vector3D()
-                    logger.test("frame.position %s", frame.position)
+                    frame.position = MVector3D(*positions[n])
 
                     # 回転X,Y,Z,scalar
-                    frame.rotation = self.read_Quaternion()
-                    logger.test("frame.rotation %s", frame.rotation)
-                    logger.test("frame.rotation.euler %s", frame.rotation.toEulerAngles())
+                    (x, y, z, scalar) = rotations[n]
+                    frame.rotation = MQuaternion(scalar, x, y, z)
                     # オリジナルを保持
                     frame.org_rotation = frame.rotation.copy()
 
                     # 補間曲線
-                    frame.interpolation = list(self.unpack(64, "64B", True))
-                    logger.test("interpolation %s", frame.interpolation)
+                    frame.interpolation = interpolations[n]
 
                     if bone_name not in motion.bones:
                         # まだ辞書にない場合、配列追加
@@ -100,42 +103,34 @@ class VmdReader:
 
                     # 辞書の該当部分にボーンフレームを追加
                     if frame.fno not in motion.bones[bone_name]:
-                        motion.bones[bone_name][frame.fno] = frame
-
-                    if frame.fno > motion.last_motion_frame:
-                        # 最終フレームを記録
-                        motion.last_motion_frame = frame.fno
+                        motion.set_bf(bone_name, frame.fno, frame)
 
                     if n // 10000 > prev_n:
                         prev_n = n // 10000
                         logger.info("-- VMD骨骼动作读取 关键帧: %s" % n)
 
-                # モーフ数
-                motion.morph_cnt = self.read_uint(4)
-                logger.test("motion.morph_cnt %s", motion.morph_cnt)
+                if len(fnos) > 0:
+                    # 最終フレームを記録
+                    motion.last_motion_frame = max(motion.last_motion_frame, int(bone_frames["fno"].max()))
 
                 # 1F分のモーフ情報
+                morph_frames = sections["morph"]
+                morph_names = self.decode_bnames(morph_frames["bname"], 15)
+                fnos = morph_frames["fno"].tolist()
+                ratios = morph_frames["ratio"].tolist()
+
                 prev_n = 0
-                for n in range(motion.morph_cnt):
-                    morph = VmdMorphFrame()
+                for n, (morph_bname, morph_name) in enumerate(morph_names):
+                    morph = VmdMorphFrame(fnos[n])
                     morph.key = True
                     morph.read = True
 
-                    # モーフ ----------------------
                     # モーフ名
-                    morph_bname, morph_name = self.read_text(15)
-
                     morph.name = morph_name
                     morph.bname = morph_bname
-                    logger.test("name: %s, bname %s", morph_name, morph_bname)
-
-                    # フレームIDX
-                    morph.fno = self.read_uint(4)
-                    logger.test("morph.fno %s", morph.fno)
 
                     # 度数
-                    morph.ratio = self.read_float(4)
-                    logger.test("morph.ratio %s", morph.ratio)
+                    morph.ratio = ratios[n]
 
                     if morph_name not in motion.morphs:
                         # まだ辞書にない場合、配列追加
@@ -149,177 +144,214 @@ class VmdReader:
                         prev_n = n // 1000
                         logger.info("--VMD动作读取 表情: %s" % n)
 
-                try:
-                    # カメラ数
-                    motion.camera_cnt = self.read_uint(4)
-                    logger.test("motion.camera_cnt %s", motion.camera_cnt)
-
-                    # 1F分のカメラ情報
-                    prev_n = 0
-                    for n in range(motion.camera_cnt):
-                        camera = VmdCameraFrame()
-
-                        # フレームIDX
-                        camera.fno = self.read_uint(4)
-                        logger.test("camera.fno %s", camera.fno)
-
-                        # 距離
-                        camera.length = self.read_float(4)
-                        logger.test("camera.length %s", camera.length)
-
-                        # ０距離の場合、念のため少しだけ距離を入れておく
-                        if camera.length == 0:
-                            camera.length = -0.00001
-
-                        # 位置X,Y,Z
-                        camera.position = self.read_Vector3D()
-                        logger.test("camera.position %s", camera.position)
-
-                        # 角度（オイラー角）
-                        camera.euler = self.read_Vector3D()
-                        logger.test("camera.euler %s", camera.euler)
-
-                        # 補間曲線
-                        camera.interpolation = self.unpack(24, "24B", True)
-                        logger.test("camera.interpolation %s", camera.interpolation)
-
-                        # 視野角
-                        camera.angle = self.read_uint(4)
-                        logger.test("camera.angle %s", camera.angle)
-
-                        # パース有無
-                        camera.perspective = self.unpack(1, "B")
-                        logger.test("camera.perspective %s", camera.perspective)
-
-                        # オリジナルを保持
-                        camera.org_length = camera.org_length
-                        camera.org_position = camera.org_position.copy()
-
-                        # カメラを追加
-                        motion.cameras[camera.fno] = camera
-
-                        if n // 10000 > prev_n:
-                            prev_n = n // 10000
-                            logger.info("VMD相机读取 关键帧: %s" % n)
-
-                except Exception:
-                    # 情報がない場合、catchして握りつぶす
-                    motion.camera_cnt = 0
-
-                # 照明数
-                try:
-                    motion.light_cnt = self.read_uint(4)
-                    logger.test("motion.light_cnt %s", motion.light_cnt)
-
-                    # 1F分の照明情報
-                    for _ in range(motion.light_cnt):
-                        light = VmdLightFrame()
-
-                        # フレームIDX
-                        light.fno = self.read_uint(4)
-                        logger.test("light.fno %s", light.fno)
+                # 1F分のカメラ情報
+                prev_n = 0
+                for n, (fno, length, position, euler, interpolation, angle, perspective) in enumerate(sections["camera"].tolist()):
+                    camera = VmdCameraFrame()
+                    camera.fno = fno
+                    # ０距離の場合、念のため少しだけ距離を入れておく
+                    camera.length = length if length != 0 else -0.00001
+                    camera.position = MVector3D(*position)
+                    camera.euler = MVector3D(*euler)
+                    camera.interpolation = tuple(interpolation)
+                    camera.angle = angle
+                    camera.perspective = perspective
+
+                    # カメラを追加
+                    motion.cameras[camera.fno] = camera
 
-                        # 照明色(RGBだが、下手に数値が変わるのも怖いのでV3D)
-                        light.color = self.read_Vector3D()
-                        logger.test("light.color %s", light.color)
+                    if n // 10000 > prev_n:
+                        prev_n = n // 10000
+                        logger.info("VMD相机读取 关键帧: %s" % n)
+
+                # 1F分の照明情報
+                for (fno, color, position) in sections["light"].tolist():
+                    light = VmdLightFrame()
+                    light.fno = fno
+                    # 照明色(RGBだが、下手に数値が変わるのも怖いのでV3D)
+                    light.color = MVector3D(*color)
+                    light.position = MVector3D(*position)
+
+                    # 追加
+                    motion.lights.append(light)
+
+                # 1F分のシャドウ情報
+                for (fno, shadow_type, distance) in sections["shadow"].tolist():
+                    shadow = VmdShadowFrame()
+                    shadow.fno = fno
+                    shadow.type = shadow_type
+                    shadow.distance = distance
+
+                    # 追加
+                    motion.shadows.append(shadow)
+
+                # 1F分のIK情報
+                for (fno, show, ik_infos) in sections["showik"]:
+                    show_ik = VmdShowIkFrame()
+                    show_ik.fno = fno
+                    show_ik.show = show
+                    show_ik.ik_count = len(ik_infos)
+
+                    for (ik_bname, ik_name), onoff in zip(self.decode_bnames(ik_infos["bname"], 20), ik_infos["onoff"].tolist()):
+                        ik_info = VmdInfoIk()
+                        ik_info.name = ik_name
+                        ik_info.bname = ik_bname
+                        ik_info.onoff = onoff
+
+                        show_ik.ik.append(ik_info)
+
+                    # 追加
+                    motion.showiks.append(show_ik)
 
-                        # 照明位置
-                        light.position = self.read_Vector3D()
-                        logger.test("light.position %s", light.position)
+            # ハッシュを設定
+            motion.digest = self.hexdigest()
+            logger.test("motion: %s, hash: %s", motion.path, motion.digest)
 
-                        # 追加
-                        motion.lights.append(light)
+            return motion
+        except MKilledException as ke:
+            # 終了命令
+            raise ke
+        except SizingException as se:
+            logger.error("VMD読み込み処理が処理できないデータで終了しました。\n\n%s", se.message, decoration=MLogger.DECORATION_BOX)
+            return se
+        except Exception as e:
+            import traceback
+            logger.critical("VMD読み込み処理が意図せぬエラーで終了しました。\n\n%s", traceback.format_exc(), decoration=MLogger.DECORATION_BOX)
+            raise e
 
-                except Exception:
-                    # 情報がない場合、catchして握りつぶす
-                    motion.light_cnt = 0
+    # ボーン・モーフ等のキーフレを生成せず、構造化配列のまま読み込む
+    def read_columns(self):
+        # モーションパス
+        motion = VmdMotion()
+        motion.path = self.file_path
 
-                # セルフシャドウ数
-                try:
-                    motion.shadow_cnt = self.read_uint(4)
-                    logger.test("motion.shadow_cnt %s", motion.shadow_cnt)
+        with open(self.file_path, "rb") as f:
+            # VMDファイルをバイナリ読み込み
+            self.buffer = f.read()
 
-                    # 1F分のシャドウ情報
-                    for _ in range(motion.shadow_cnt):
-                        shadow = VmdShadowFrame()
+            # vmdバージョン・モデル名
+            self.read_header(motion)
 
-                        # フレームIDX
-                        shadow.fno = self.read_uint(4)
-                        logger.test("shadow.fno %s", shadow.fno)
+            # 各セクション
+            sections = self.read_sections(motion)
 
-                        # シャドウ種別
-                        shadow.type = self.read_uint(1)
-                        logger.test("shadow.type %s", shadow.type)
+            if motion.motion_cnt > 0:
+                # 最終フレームを記録
+                motion.last_motion_frame = int(sections["bone"]["fno"].max())
 
-                        # 距離
-                        shadow.distance = self.read_float()
-                        logger.test("shadow.distance %s", shadow.distance)
+        # ハッシュを設定
+        motion.digest = self.hexdigest()
 
-                        # 追加
-                        motion.shadows.append(shadow)
+        return motion, sections
 
-                except Exception:
-                    # 情報がない場合、catchして握りつぶす
-                    motion.shadow_cnt = 0
+    def read_header(self, motion: VmdMotion):
+        # vmdバージョン
+        signature = self.unpack(30, "30s")
+        logger.test("signature %s", signature)
 
-                # IK数
-                try:
-                    motion.ik_cnt = self.read_uint(4)
-                    logger.test("motion.ik_cnt %s", motion.ik_cnt)
+        # モデル名
+        model_bname, model_name = self.read_text(20)
+        logger.test("model_bname %s, model_name: %s", model_bname, model_name)
+        motion.model_name = model_name
 
-                    # 1F分のIK情報
-                    for _ in range(motion.ik_cnt):
-                        show_ik = VmdShowIkFrame()
+    # 各セクションを構造化配列として読み込む（VmdBoneFrame等は生成しない）
+    def read_sections(self, motion: VmdMotion):
+        sections = {}
 
-                        # フレームIDX
-                        show_ik.fno = self.read_uint(4)
-                        logger.test("ik.fno %s", show_ik.fno)
+        # モーション数
+        motion.motion_cnt = self.read_uint(4)
+        logger.test("motion.motion_cnt %s", motion.motion_cnt)
+        sections["bone"] = self.read_structs(BONE_FRAME_DTYPE, motion.motion_cnt)
 
-                        # モデル表示, 0:OFF, 1:ON
-                        show_ik.show = self.read_uint(1)
-                        logger.test("ik.show %s", show_ik.show)
+        # モーフ数
+        motion.morph_cnt = self.read_uint(4)
+        logger.test("motion.morph_cnt %s", motion.morph_cnt)
+        sections["morph"] = self.read_structs(MORPH_FRAME_DTYPE, motion.morph_cnt)
 
-                        # 記録するIKの数
-                        show_ik.ik_count = self.read_uint(4)
-                        logger.test("ik.ik_count %s", show_ik.ik_count)
+        try:
+            # カメラ数
+            motion.camera_cnt = self.read_uint(4)
+            logger.test("motion.camera_cnt %s", motion.camera_cnt)
+            sections["camera"] = self.read_structs(CAMERA_FRAME_DTYPE, motion.camera_cnt)
+        except Exception:
+            # 情報がない場合、catchして握りつぶす
+            motion.camera_cnt = 0
+            sections["camera"] = np.empty(0, dtype=CAMERA_FRAME_DTYPE)
+
+        # 照明数
+        try:
+            motion.light_cnt = self.read_uint(4)
+            logger.test("motion.light_cnt %s", motion.light_cnt)
+            sections["light"] = self.read_structs(LIGHT_FRAME_DTYPE, motion.light_cnt)
+        except Exception:
+            # 情報がない場合、catchして握りつぶす
+            motion.light_cnt = 0
+            sections["light"] = np.empty(0, dtype=LIGHT_FRAME_DTYPE)
+
+        # セルフシャドウ数
+        try:
+            motion.shadow_cnt = self.read_uint(4)
+            logger.test("motion.shadow_cnt %s", motion.shadow_cnt)
+            sections["shadow"] = self.read_structs(SHADOW_FRAME_DTYPE, motion.shadow_cnt)
+        except Exception:
+            # 情報がない場合、catchして握りつぶす
+            motion.shadow_cnt = 0
+            sections["shadow"] = np.empty(0, dtype=SHADOW_FRAME_DTYPE)
+
+        # IK数
+        sections["showik"] = []
+        try:
+            motion.ik_cnt = self.read_uint(4)
+            logger.test("motion.ik_cnt %s", motion.ik_cnt)
+
+            # IK情報は1F毎に可変長なので、1F毎にIK名とON/OFFをまとめて読み込む
+            showiks = []
+            for _ in range(motion.ik_cnt):
+                # フレームIDX
+                fno = self.read_uint(4)
+                # モデル表示, 0:OFF, 1:ON
+                show = self.read_uint(1)
+                # 記録するIKの数
+                ik_count = self.read_uint(4)
+                showiks.append((fno, show, self.read_structs(IK_INFO_DTYPE, ik_count)))
+            sections["showik"] = showiks
+        except Exception:
+            # 昔のMMD（MMDv7.39.x64以前）はIK情報がないため、catchして握りつぶす
+            motion.ik_cnt = 0
+
+        return sections
+
+    # 構造化配列の一括解凍して、offsetを更新する
+    def read_structs(self, dtype, count):
+        values = np.frombuffer(self.buffer, dtype=dtype, count=count, offset=self.offset)
 
-                        for _ in range(show_ik.ik_count):
-                            ik_info = VmdInfoIk()
+        # オフセットを更新する
+        self.offset += dtype.itemsize * count
 
-                            # IK名
-                            ik_bname, ik_name = self.read_text(20)
-                            ik_info.name = ik_name
-                            ik_info.bname = ik_bname
-                            logger.test("ik_info.name %s", ik_name)
+        return values
 
-                            # モデル表示, 0:OFF, 1:ON
-                            ik_info.onoff = self.read_uint(1)
-                            logger.test("ik_info.onoff %s", ik_info.onoff)
+    # 名前の配列を（元のバイト列, 復元した文字列）のリストにする
+    # \x00以降のゴミが違うだけの同じ名前は一度だけ復元する
+    def decode_bnames(self, bnames, format_size):
+        names = []
+        decoded_names = {}
 
-                            show_ik.ik.append(ik_info)
+        for bname in bnames.tolist():
+            # 構造化配列は末尾の\x00を落とすので、元の長さに戻す
+            bresult = bname.ljust(format_size, b'\x00')
+            name_key = re.sub(b'\x00.*$', b'', bresult)
 
-                        # 追加
-                        motion.showiks.append(show_ik)
+            if name_key not in decoded_names:
+                if not self.encoding:
+                    # まだエンコードが確定していない場合、エンコード取得
+                    self.encoding = self.get_encoding(bresult, False)
 
-                except Exception:
-                    # 昔のMMD（MMDv7.39.x64以前）はIK情報がないため、catchして握りつぶす
-                    motion.ik_cnt = 0
+                # エンコードが取れた場合、復元
+                decoded_names[name_key] = self.decode_text(bresult, self.encoding, False) if self.encoding else None
 
-            # ハッシュを設定
-            motion.digest = self.hexdigest()
-            logger.test("motion: %s, hash: %s", motion.path, motion.digest)
+            names.append((bresult if self.encoding else None, decoded_names[name_key]))
 
-            return motion
-        except MKilledException as ke:
-            # 終了命令
-            raise ke
-        except SizingException as se:
-            logger.error("VMD読み込み処理が処理できないデータで終了しました。\n\n%s", se.message, decoration=MLogger.DECORATION_BOX)
-            return se
-        except Exception as e:
-            import traceback
-            logger.critical("VMD読み込み処理が意図せぬエラーで終了しました。\n\n%s", traceback.format_exc(), decoration=MLogger.DECORATION_BOX)
-            raise e
+        return names
 
     def hexdigest(self):
         sha1 = hashlib.sha1()
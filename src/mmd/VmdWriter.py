@@ -1,11 +1,17 @@
 # -*- coding: utf-8 -*-
 #
 import struct
+import numpy as np
+
+from mmd.VmdReader import BONE_FRAME_DTYPE, MORPH_FRAME_DTYPE, CAMERA_FRAME_DTYPE, LIGHT_FRAME_DTYPE, SHADOW_FRAME_DTYPE, IK_INFO_DTYPE
 from module.MOptions import MOptionsDataSet
 from utils.MLogger import MLogger # noqa
 
 logger = MLogger(__name__)
 
+# モデル表示・IK on/offフレーム（フレームIDX, 表示有無, IK数）
+SHOW_IK_FRAME_STRUCT = struct.Struct('<LbL')
+
 
 class VmdWriter():
     def __init__(self, data_set: MOptionsDataSet):
@@ -38,26 +44,111 @@ class VmdWriter():
             # カメラ・照明
             fout.write(b'\x83J\x83\x81\x83\x89\x81E\x8f\xc6\x96\xbe\x00on Data')
         
+        # 各セクションはまとめてバイナリ化して、一度に書き込む
         # bone frames
         fout.write(struct.pack('<L', len(bone_frames)))  # ボーンフレーム数
-        for bf in bone_frames:
-            bf.write(fout)
+        fout.write(self.pack_bone_frames(bone_frames))
         fout.write(struct.pack('<L', len(morph_frames)))  # 表情キーフレーム数
-        for mf in morph_frames:
-            mf.write(fout)
+        fout.write(self.pack_morph_frames(morph_frames))
         fout.write(struct.pack('<L', len(camera_frames)))  # カメラキーフレーム数
-        for cf in camera_frames:
-            cf.write(fout)
+        fout.write(self.pack_camera_frames(camera_frames))
         fout.write(struct.pack('<L', len(self.data_set.motion.lights)))  # 照明キーフレーム数
-        for cf in self.data_set.motion.lights:
-            cf.write(fout)
+        fout.write(self.pack_light_frames(self.data_set.motion.lights))
         fout.write(struct.pack('<L', len(self.data_set.motion.shadows)))  # セルフ影キーフレーム数
-        for cf in self.data_set.motion.shadows:
-            cf.write(fout)
+        fout.write(self.pack_shadow_frames(self.data_set.motion.shadows))
             
         if len(camera_frames) == 0:
             fout.write(struct.pack('<L', len(self.data_set.motion.showiks)))  # モデル表示・IK on/offキーフレーム数
-            for sf in self.data_set.motion.showiks:
-                sf.write(fout)
+            fout.write(self.pack_showik_frames(self.data_set.motion.showiks))
         
         fout.close()
+
+    # ボーンフレームをまとめてバイナリ化
+    def pack_bone_frames(self, bone_frames: list):
+        values = np.zeros(len(bone_frames), dtype=BONE_FRAME_DTYPE)
+
+        if len(bone_frames) > 0:
+            values["bname"] = [self.get_bname(bf, 15) for bf in bone_frames]
+            values["fno"] = [int(bf.fno) for bf in bone_frames]
+            values["position"] = [(bf.position.x(), bf.position.y(), bf.position.z()) for bf in bone_frames]
+
+            # 回転は正規化してから出力(x, y, z, scalar)
+            qs = np.array([bf.rotation.data().components for bf in bone_frames], dtype=np.float64)
+            qs[np.isnan(qs) | np.isinf(qs)] = 0
+            with np.errstate(divide='ignore', invalid='ignore'):
+                qs /= np.linalg.norm(qs, ord=2, axis=1, keepdims=True)
+            values["rotation"] = qs[:, [1, 2, 3, 0]]
+
+            values["interpolation"] = np.clip(np.array([bf.interpolation for bf in bone_frames]), 0, 127)
+
+        return values.tobytes()
+
+    # モーフフレームをまとめてバイナリ化
+    def pack_morph_frames(self, morph_frames: list):
+        values = np.zeros(len(morph_frames), dtype=MORPH_FRAME_DTYPE)
+
+        if len(morph_frames) > 0:
+            values["bname"] = [self.get_bname(mf, 15) for mf in morph_frames]
+            values["fno"] = [int(mf.fno) for mf in morph_frames]
+            values["ratio"] = [float(mf.ratio) for mf in morph_frames]
+
+        return values.tobytes()
+
+    # カメラフレームをまとめてバイナリ化
+    def pack_camera_frames(self, camera_frames: list):
+        values = np.zeros(len(camera_frames), dtype=CAMERA_FRAME_DTYPE)
+
+        if len(camera_frames) > 0:
+            values["fno"] = [int(cf.fno) for cf in camera_frames]
+            values["length"] = [float(cf.length) for cf in camera_frames]
+            values["position"] = [(cf.position.x(), cf.position.y(), cf.position.z()) for cf in camera_frames]
+            values["euler"] = [(cf.euler.x(), cf.euler.y(), cf.euler.z()) for cf in camera_frames]
+            values["interpolation"] = np.clip(np.array([cf.interpolation for cf in camera_frames]), 0, 127)
+            values["angle"] = [int(cf.angle) for cf in camera_frames]
+            values["perspective"] = [cf.perspective for cf in camera_frames]
+
+        return values.tobytes()
+
+    # 照明フレームをまとめてバイナリ化
+    def pack_light_frames(self, light_frames: list):
+        values = np.zeros(len(light_frames), dtype=LIGHT_FRAME_DTYPE)
+
+        if len(light_frames) > 0:
+            values["fno"] = [lf.fno for lf in light_frames]
+            values["color"] = [(lf.color.x(), lf.color.y(), lf.color.z()) for lf in light_frames]
+            values["position"] = [(lf.position.x(), lf.position.y(), lf.position.z()) for lf in light_frames]
+
+        return values.tobytes()
+
+    # セルフ影フレームをまとめてバイナリ化
+    def pack_shadow_frames(self, shadow_frames: list):
+        values = np.zeros(len(shadow_frames), dtype=SHADOW_FRAME_DTYPE)
+
+        if len(shadow_frames) > 0:
+            values["fno"] = [sf.fno for sf in shadow_frames]
+            values["type"] = [sf.type for sf in shadow_frames]
+            values["distance"] = [sf.distance for sf in shadow_frames]
+
+        return values.tobytes()
+
+    # モデル表示・IK on/offフレームをまとめてバイナリ化（IK数が可変なので、フレーム単位で連結）
+    def pack_showik_frames(self, showik_frames: list):
+        buffers = []
+
+        for sf in showik_frames:
+            buffers.append(SHOW_IK_FRAME_STRUCT.pack(sf.fno, sf.show, len(sf.ik)))
+
+            iks = np.zeros(len(sf.ik), dtype=IK_INFO_DTYPE)
+            if len(sf.ik) > 0:
+                iks["bname"] = [self.get_bname(k, 20) for k in sf.ik]
+                iks["onoff"] = [k.onoff for k in sf.ik]
+            buffers.append(iks.tobytes())
+
+        return b''.join(buffers)
+
+    # 出力用の名前(shift_jis)を取得する
+    def get_bname(self, frame, length: int):
+        if not frame.bname:
+            frame.bname = frame.name.encode('cp932').decode('shift_jis').encode('shift_jis')[:length].ljust(length, b'\x00')   # 文字数制限
+
+        return frame.bname
@@ -42,6 +42,7 @@ cdef class MOptions():
     cdef public object total_process_ctrl
     cdef public object now_process_ctrl
     cdef public dict tree_process_dict
+    cdef public bint is_multi_process
 
 cdef c_parse(str version_name)
 
@@ -29,7 +29,8 @@ cdef class MOptions():
 
     def __init__(self, version_name, logging_level, max_workers, data_set_list, arm_options, \
                  camera_motion, camera_output_vmd_path, is_sizing_camera_only, camera_length, monitor, \
-                 is_file, outout_datetime, total_process, now_process, total_process_ctrl, now_process_ctrl, tree_process_dict, leg_options=MLegProcessOptions()):
+                 is_file, outout_datetime, total_process, now_process, total_process_ctrl, now_process_ctrl, tree_process_dict, leg_options=MLegProcessOptions(), \
+                 is_multi_process=False):
         self.version_name = version_name
         self.logging_level = logging_level
         self.max_workers = max_workers
@@ -48,6 +49,8 @@ cdef class MOptions():
         self.now_process_ctrl = now_process_ctrl
         self.tree_process_dict = tree_process_dict
         self.leg_options = leg_options
+        # データセット・左右単位の処理をプロセスで並列実行するか
+        self.is_multi_process = is_multi_process
     
     # 複数件のファイルセットの足IKの比率を再設定する
     def calc_leg_ratio(self):
@@ -105,6 +108,8 @@ cdef c_parse(str version_name):
     parser.add_argument("--camera_motion_path", type=str, default="")
     parser.add_argument("--camera_org_model_path", default=[], type=(lambda x: list(map(str, x.split(';')))))
     parser.add_argument("--camera_offset_y", default=[], type=(lambda x: list(map(str, x.split(';')))))
+    parser.add_argument("--max_workers", type=int, default=1)
+    parser.add_argument("--multi_process_flg", type=int, default=0)
     parser.add_argument("--verbose", type=int, default=20)
 
     args = parser.parse_args()
@@ -172,7 +177,7 @@ cdef c_parse(str version_name):
 
             file_name, input_ext = os.path.splitext(os.path.basename(org_model_path))
             if input_ext.lower() == ".pmx":
-                org_model_reader = PmxReader(org_model_path)
+                org_model_reader = PmxReader(org_model_path, is_vertex_array=True)
             else:
                 raise SizingException("{0}.org_model_path 读取失败（扩展名错误）: {1}".format(display_set_no, os.path.basename(org_model_path)))
             
@@ -185,7 +190,7 @@ cdef c_parse(str version_name):
 
             file_name, input_ext = os.path.splitext(os.path.basename(rep_model_path))
             if input_ext.lower() == ".pmx":
-                rep_model_reader = PmxReader(rep_model_path)
+                rep_model_reader = PmxReader(rep_model_path, is_vertex_array=True)
             else:
                 raise SizingException("{0}.rep_model_path 读取失败（扩展名错误）: {1}".format(display_set_no, os.path.basename(rep_model_path)))
             
@@ -199,7 +204,7 @@ cdef c_parse(str version_name):
 
                 file_name, input_ext = os.path.splitext(os.path.basename(camera_org_model_path))
                 if input_ext.lower() == ".pmx":
-                    camera_org_model_reader = PmxReader(camera_org_model_path)
+                    camera_org_model_reader = PmxReader(camera_org_model_path, is_vertex_array=True)
                 else:
                     raise SizingException("{0}.camera_org_model_path 读取失败（扩展名错误）: {1}".format(display_set_no, os.path.basename(camera_org_model_path)))
                 
@@ -259,12 +264,13 @@ cdef c_parse(str version_name):
             monitor=sys.stdout, \
             is_file=True, \
             outout_datetime=logger.outout_datetime, \
-            max_workers=1, \
+            max_workers=max(1, args.max_workers), \
             total_process=0, \
             now_process=0, \
             total_process_ctrl=None, \
             now_process_ctrl=None, \
-            tree_process_dict={})
+            tree_process_dict={}, \
+            is_multi_process=(True if args.multi_process_flg == 1 else False))
 
         return options
     except SizingException as se:
@@ -288,7 +294,9 @@ cdef class MOptionsDataSet():
         self.camera_offset_y = camera_offset_y
         self.selected_stance_details = selected_stance_details
 
-        self.org_motion = self.motion.copy()
+        self.org_motion = self.motion.copy(is_snapshot=True)
+        # 元モーションは書き換えないので、各処理でFK計算結果を使い回す
+        self.org_motion.start_fk_cache()
         self.test_params = None
         self.full_arms = False
 
@@ -157,10 +157,7 @@ class ConvertVmdService():
                     bf.read = True
                     bf.key = True
 
-                    if bf.name not in bone_motion.bones:
-                        bone_motion.bones[bf.name] = {}
-
-                    bone_motion.bones[bf.name][bf.fno] = bf
+                    bone_motion.set_bf(bf.name, bf.fno, bf)
 
                     cnt += 1
 
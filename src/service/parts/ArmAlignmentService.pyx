@@ -2,6 +2,7 @@
 #
 import os
 import numpy as np
+cimport numpy as np
 import math
 import itertools
 from libc.math cimport sin, cos, acos, atan2, asin, pi, sqrt
@@ -166,11 +167,15 @@ cdef class ArmAlignmentService:
     cdef prepare_alignment(self, list fnos):           
         cdef int from_data_set_idx, to_data_set_idx, alignment_idx, data_set_idx, fidx, from_alignment_idx
         cdef int group_idx, to_alignment_idx, fno, priority, prev_block_fno
-        cdef double base_distance, distance, distance_ratio, org_palm_mean
+        cdef double base_distance, distance_ratio
         cdef dict alignment_options, all_alignment_group, all_distances, all_is_alignment, all_messages, all_org_global_effector_matrixs, all_org_global_effector_vec
-        cdef dict all_org_global_neck_vec, all_org_global_tip_vec, all_org_global_trunk_matrixs, all_org_global_upper_vec, distances, org_global_3ds, org_global_matrixs
-        cdef dict all_alignment_idx
-        cdef list alignment_pairs, all_alignment_group_list, org_effector_pairs, target_pairs
+        cdef dict all_org_global_neck_vec, all_org_global_tip_vec, all_org_global_trunk_matrixs, all_org_global_upper_vec
+        cdef dict all_alignment_idx, all_org_global_3ds, all_org_global_matrixs, all_org_link_indexes, org_link_indexes
+        cdef list alignment_pairs, all_alignment_group_list, org_effector_pairs, target_pairs, distance_pairs, pair_idxs
+        cdef dict all_org_global_effector_poses
+        cdef np.ndarray all_pair_distance_ratios, all_pair_is_alignments, pair_base_distances, pair_diffs, pair_distances, pair_palm_means
+        cdef tuple target_pair
+        cdef int prev_fno
         cdef str link_name
         cdef bint is_alignment, is_floor, is_sit, prev_from_alignment, prev_to_alignment
         cdef VmdBoneFrame bf
@@ -178,7 +183,7 @@ cdef class ArmAlignmentService:
         cdef ArmAlignmentOption from_target_link, target_link, to_target_link
         cdef BoneLinks ik_links
         cdef MMatrix4x4 org_effector_matrix, org_origin_matrix, org_trunk_matrix
-        cdef MVector3D org_fno_mean_vec, org_from_global_effector_vec, org_global_effector, org_global_tip, org_local_tip, org_mean_vec, org_to_global_effector_vec
+        cdef MVector3D org_fno_mean_vec, org_global_effector, org_global_tip, org_local_tip, org_mean_vec
         cdef MVector3D org_trunk_local_fno_effector, org_trunk_local_fno_origin
 
         all_org_global_effector_vec = {}
@@ -197,7 +202,20 @@ cdef class ArmAlignmentService:
         org_effector_pairs = list(itertools.combinations(target_pairs, 2))
         logger.test("list: %s, pairs: %s", target_pairs, org_effector_pairs)
         
-        for fno in fnos:
+        # 元モデルのそれぞれのグローバル位置（全フレーム分まとめて算出）
+        all_org_global_3ds = {}
+        all_org_global_matrixs = {}
+        all_org_link_indexes = {}
+        for data_set_idx, alignment_options in self.target_links.items():
+            for alignment_idx, target_link in alignment_options.items():
+                # 処理対象データセット
+                data_set = self.options.data_set_list[data_set_idx]
+
+                all_org_global_3ds[(data_set_idx, alignment_idx)], all_org_global_matrixs[(data_set_idx, alignment_idx)] = \
+                    MServiceUtils.c_calc_global_pos_by_fnos(data_set.org_model, target_link.org_links, data_set.org_motion, fnos, return_matrix=True, is_local_x=True, limit_links=None)
+                all_org_link_indexes[(data_set_idx, alignment_idx)] = {link_name: link_idx for link_idx, link_name in enumerate(target_link.org_links.all().keys())}
+
+        for fidx, fno in enumerate(fnos):
             all_org_global_effector_vec[fno] = {}
             all_org_global_trunk_matrixs[fno] = {}
             all_org_global_neck_vec[fno] = {}
@@ -208,27 +226,24 @@ cdef class ArmAlignmentService:
             # 処理対象キーフレを先頭からひとつずつチェックしていく
             for data_set_idx, alignment_options in self.target_links.items():
                 for alignment_idx, target_link in alignment_options.items():
-                    # 処理対象データセット
-                    data_set = self.options.data_set_list[data_set_idx]
+                    org_global_3ds = all_org_global_3ds[(data_set_idx, alignment_idx)]
+                    org_global_matrixs = all_org_global_matrixs[(data_set_idx, alignment_idx)]
+                    org_link_indexes = all_org_link_indexes[(data_set_idx, alignment_idx)]
 
-                    # 元モデルのそれぞれのグローバル位置
-                    org_global_3ds, org_global_matrixs = \
-                        MServiceUtils.c_calc_global_pos(data_set.org_model, target_link.org_links, data_set.org_motion, fno, return_matrix=True, is_local_x=True, limit_links=None)
-                   
-                    all_org_global_effector_vec[fno][(data_set_idx, alignment_idx)] = org_global_3ds[target_link.effector_bone_name]
+                    all_org_global_effector_vec[fno][(data_set_idx, alignment_idx)] = MVector3D(org_global_3ds[fidx, org_link_indexes[target_link.effector_bone_name]])
 
                     if alignment_idx < 0:
                         # 床の位置は各位置のY0をvectorの場合のみ定義し直す（距離を測る用）
                         all_org_global_effector_vec[fno][(data_set_idx, alignment_idx)].setY(0)
 
-                    all_org_global_trunk_matrixs[fno][(data_set_idx, alignment_idx)] = org_global_matrixs["首根元"]
-                    all_org_global_neck_vec[fno][(data_set_idx, alignment_idx)] = org_global_3ds["首根元"]
-                    all_org_global_upper_vec[fno][(data_set_idx, alignment_idx)] = org_global_3ds["上半身"]
+                    all_org_global_trunk_matrixs[fno][(data_set_idx, alignment_idx)] = MMatrix4x4(org_global_matrixs[fidx, org_link_indexes["首根元"]])
+                    all_org_global_neck_vec[fno][(data_set_idx, alignment_idx)] = MVector3D(org_global_3ds[fidx, org_link_indexes["首根元"]])
+                    all_org_global_upper_vec[fno][(data_set_idx, alignment_idx)] = MVector3D(org_global_3ds[fidx, org_link_indexes["上半身"]])
 
                     if target_link.tip_ik_links:
                         # 指先合わせが必要な場合、保持
-                        all_org_global_tip_vec[fno][(data_set_idx, alignment_idx)] = org_global_3ds[target_link.tip_bone_name]
-                        all_org_global_effector_matrixs[fno][(data_set_idx, alignment_idx)] = org_global_matrixs[target_link.effector_bone_name]
+                        all_org_global_tip_vec[fno][(data_set_idx, alignment_idx)] = MVector3D(org_global_3ds[fidx, org_link_indexes[target_link.tip_bone_name]])
+                        all_org_global_effector_matrixs[fno][(data_set_idx, alignment_idx)] = MMatrix4x4(org_global_matrixs[fidx, org_link_indexes[target_link.effector_bone_name]])
 
             if fno // 200 > prev_block_fno:
                 logger.count("准备对齐①", fno, fnos)
@@ -247,51 +262,68 @@ cdef class ArmAlignmentService:
                 all_is_alignment[(data_set_idx, alignment_idx)] = {}
                 all_alignment_idx[(data_set_idx, alignment_idx)] = -1
 
-        for fno in fnos:
-            distances = {}
-            all_messages[fno] = []
-            all_distances[fno] = {}
+        # 距離を測る組合せ（フレームに関係なく決まる）
+        distance_pairs = []
+        for ((from_data_set_idx, from_alignment_idx), (to_data_set_idx, to_alignment_idx)) in org_effector_pairs:
+            # 処理対象
+            from_target_link = self.target_links[from_data_set_idx][from_alignment_idx]
+            to_target_link = self.target_links[to_data_set_idx][to_alignment_idx]
             
-            # それぞれの距離を算出
-            # 起点となるボーン
-            for ((from_data_set_idx, from_alignment_idx), (to_data_set_idx, to_alignment_idx)) in org_effector_pairs:
-                org_from_global_effector_vec = all_org_global_effector_vec[fno][(from_data_set_idx, from_alignment_idx)]
-                org_to_global_effector_vec = all_org_global_effector_vec[fno][(to_data_set_idx, to_alignment_idx)]
-
-                # 処理対象
-                from_target_link = self.target_links[from_data_set_idx][from_alignment_idx]
-                to_target_link = self.target_links[to_data_set_idx][to_alignment_idx]
+            # 同じINDEX、同じ方向で同じ計算対象
+            if (from_data_set_idx, from_target_link.start_bone_name[0]) == (to_data_set_idx, to_target_link.start_bone_name[0]) or \
+                    (from_data_set_idx, from_alignment_idx, to_data_set_idx, to_alignment_idx) in distance_pairs or \
+                    (to_data_set_idx, to_alignment_idx, from_data_set_idx, from_alignment_idx) in distance_pairs:
+                # 同じ計算対象のペアは計算不要（同じ手首の指同士を想定）
+                continue
                 
-                # 同じINDEX、同じ方向で同じ計算対象
-                if (from_data_set_idx, from_target_link.start_bone_name[0]) == (to_data_set_idx, to_target_link.start_bone_name[0]) or \
-                        (from_data_set_idx, from_alignment_idx, to_data_set_idx, to_alignment_idx) in distances or \
-                        (to_data_set_idx, to_alignment_idx, from_data_set_idx, from_alignment_idx) in distances:
-                    # 同じ計算対象のペアは計算不要（同じ手首の指同士を想定）
-                    continue
-                    
-                if (from_alignment_idx < 0 or to_alignment_idx < 0) and (from_data_set_idx != to_data_set_idx or from_alignment_idx != to_alignment_idx * -1):
-                    # 床は自分自身とのみ調整
-                    continue
+            if (from_alignment_idx < 0 or to_alignment_idx < 0) and (from_data_set_idx != to_data_set_idx or from_alignment_idx != to_alignment_idx * -1):
+                # 床は自分自身とのみ調整
+                continue
 
-                # 2点間の距離を算出
-                distances[(from_data_set_idx, from_alignment_idx, to_data_set_idx, to_alignment_idx)] \
-                    = org_from_global_effector_vec.distanceToPoint(org_to_global_effector_vec)
+            distance_pairs.append((from_data_set_idx, from_alignment_idx, to_data_set_idx, to_alignment_idx))
 
-            logger.test("fno: %s, distances: %s", fno, distances)
-            
-            for (from_data_set_idx, from_alignment_idx, to_data_set_idx, to_alignment_idx), distance in distances.items():
-                # 距離を2点間の比率の平均から比率として求める
-                org_palm_mean = np.mean([self.target_links[from_data_set_idx][from_alignment_idx].ratio, self.target_links[to_data_set_idx][to_alignment_idx].ratio])
-                distance_ratio = distance / org_palm_mean
-
-                # 基準距離（床は床位置合わせの距離が入ってる）
-                base_distance = self.target_links[to_data_set_idx][to_alignment_idx].distance
-                # 基準距離以内か常に位置合わせを行うかの場合、位置合わせ処理実行
-                is_alignment = 0 < distance_ratio <= base_distance or base_distance == 10
-
-                logger.test("f: %s, (%s,%s,%s,%s): org_palm_mean: %s, distance: %s, distance_ratio: %s, base_distance: %s, is_alignment: %s", fno, from_data_set_idx, from_alignment_idx, \
-                            to_data_set_idx, to_alignment_idx, org_palm_mean, distance, distance_ratio, base_distance, is_alignment)
-                
+        # 全フレーム・全組合せの2点間の距離をまとめて算出（フレーム数×組合せ数）
+        all_pair_distance_ratios = np.zeros((len(fnos), len(distance_pairs)), dtype=np.float64)
+        all_pair_is_alignments = np.zeros((len(fnos), len(distance_pairs)), dtype=np.bool_)
+
+        if len(distance_pairs) > 0:
+            all_org_global_effector_poses = {}
+            for data_set_idx, alignment_options in self.target_links.items():
+                for alignment_idx, target_link in alignment_options.items():
+                    all_org_global_effector_poses[(data_set_idx, alignment_idx)] = \
+                        all_org_global_3ds[(data_set_idx, alignment_idx)][:, all_org_link_indexes[(data_set_idx, alignment_idx)][target_link.effector_bone_name]].copy()
+
+                    if alignment_idx < 0:
+                        # 床の位置は各位置のY0にする（距離を測る用）
+                        all_org_global_effector_poses[(data_set_idx, alignment_idx)][:, 1] = 0
+
+            pair_diffs = np.stack([all_org_global_effector_poses[(from_data_set_idx, from_alignment_idx)] - all_org_global_effector_poses[(to_data_set_idx, to_alignment_idx)] \
+                                   for (from_data_set_idx, from_alignment_idx, to_data_set_idx, to_alignment_idx) in distance_pairs], axis=1).reshape(-1, 3)
+            pair_distances = np.sqrt(np.einsum('ij,ij->i', pair_diffs, pair_diffs)).reshape(len(fnos), len(distance_pairs))
+
+            # 距離を2点間の比率の平均から比率として求める
+            pair_palm_means = np.array([np.mean([self.target_links[from_data_set_idx][from_alignment_idx].ratio, self.target_links[to_data_set_idx][to_alignment_idx].ratio]) \
+                                        for (from_data_set_idx, from_alignment_idx, to_data_set_idx, to_alignment_idx) in distance_pairs])
+            all_pair_distance_ratios = pair_distances / pair_palm_means
+
+            # 基準距離（床は床位置合わせの距離が入ってる）
+            pair_base_distances = np.array([self.target_links[to_data_set_idx][to_alignment_idx].distance \
+                                            for (from_data_set_idx, from_alignment_idx, to_data_set_idx, to_alignment_idx) in distance_pairs])
+            # 基準距離以内か常に位置合わせを行うかの場合、位置合わせ処理実行
+            all_pair_is_alignments = ((0 < all_pair_distance_ratios) & (all_pair_distance_ratios <= pair_base_distances)) | (pair_base_distances == 10)
+
+            # 位置合わせ対象毎に、関係する組合せのどれかで位置合わせが必要か
+            for target_pair in all_is_alignment.keys():
+                pair_idxs = [pidx for pidx, distance_pair in enumerate(distance_pairs) if target_pair in (distance_pair[:2], distance_pair[2:])]
+                if len(pair_idxs) > 0:
+                    all_is_alignment[target_pair] = dict(zip(fnos, np.any(all_pair_is_alignments[:, pair_idxs], axis=1).tolist()))
+
+        for fidx, fno in enumerate(fnos):
+            all_messages[fno] = []
+            all_distances[fno] = {}
+
+            for (from_data_set_idx, from_alignment_idx, to_data_set_idx, to_alignment_idx), distance_ratio, is_alignment \
+                    in zip(distance_pairs, all_pair_distance_ratios[fidx].tolist(), all_pair_is_alignments[fidx].tolist()):
                 # 優先順位・距離をキーにして、INDEXの組合せを登録
                 priority = self.target_links[to_data_set_idx][to_alignment_idx].priority
                 if priority not in all_distances[fno]:
@@ -300,18 +332,10 @@ cdef class ArmAlignmentService:
                 if distance_ratio not in all_distances[fno][priority]:
                     all_distances[fno][priority][distance_ratio] = []
 
-                if (from_data_set_idx, from_alignment_idx, to_data_set_idx, to_alignment_idx, is_alignment) not in all_distances[fno][priority][distance_ratio]:
-                    all_distances[fno][priority][distance_ratio].append((from_data_set_idx, from_alignment_idx, to_data_set_idx, to_alignment_idx, is_alignment))
-                    
-                    if fno not in all_is_alignment[(from_data_set_idx, from_alignment_idx)]:
-                        all_is_alignment[(from_data_set_idx, from_alignment_idx)][fno] = is_alignment
-                    else:
-                        all_is_alignment[(from_data_set_idx, from_alignment_idx)][fno] = is_alignment or all_is_alignment[(from_data_set_idx, from_alignment_idx)][fno]
+                all_distances[fno][priority][distance_ratio].append((from_data_set_idx, from_alignment_idx, to_data_set_idx, to_alignment_idx, is_alignment))
 
-                    if fno not in all_is_alignment[(to_data_set_idx, to_alignment_idx)]:
-                        all_is_alignment[(to_data_set_idx, to_alignment_idx)][fno] = is_alignment
-                    else:
-                        all_is_alignment[(to_data_set_idx, to_alignment_idx)][fno] = is_alignment or all_is_alignment[(to_data_set_idx, to_alignment_idx)][fno]
+            if logger.is_enabled_for(MLogger.TEST):
+                logger.test("fno: %s, distances: %s", fno, all_distances[fno])
 
             if fno // 500 > prev_block_fno:
                 logger.count("准备对齐②", fno, fnos)
@@ -325,6 +349,8 @@ cdef class ArmAlignmentService:
         # 優先順位が高いもの、同優先順位では距離の近いものからINDEXの組合せを登録
         # 基本的には全部の中心点を算出するが、それぞれのモデルの両手のみが近かった場合を想定
         for fidx, fno in enumerate(all_distances.keys()):
+            # 前回のキーフレ
+            prev_fno = fnos[fidx - 1] if fidx > 0 else -1
             is_alignment_by_priority = False
             for priority in sorted(all_distances[fno].keys()):
                 alignment_pairs = []
@@ -332,8 +358,8 @@ cdef class ArmAlignmentService:
                     for from_data_set_idx, from_alignment_idx, to_data_set_idx, to_alignment_idx, is_alignment in all_distances[fno][priority][distance_ratio]:
                         is_alignment_by_priority = is_alignment_by_priority or is_alignment
                         # 前回の位置合わせ
-                        prev_from_alignment = False if fidx == 0 else all_is_alignment[(from_data_set_idx, from_alignment_idx)][list(all_distances.keys())[fidx - 1]]
-                        prev_to_alignment = False if fidx == 0 else all_is_alignment[(to_data_set_idx, to_alignment_idx)][list(all_distances.keys())[fidx - 1]]
+                        prev_from_alignment = False if fidx == 0 else all_is_alignment[(from_data_set_idx, from_alignment_idx)][prev_fno]
+                        prev_to_alignment = False if fidx == 0 else all_is_alignment[(to_data_set_idx, to_alignment_idx)][prev_fno]
 
                         # 処理対象データセット
                         from_data_set = self.options.data_set_list[from_data_set_idx]
@@ -450,6 +476,8 @@ cdef class ArmAlignmentService:
                                     to_data_set.motion.regist_bf(bf, link_name, fno)
                             break
                         else:
+                            # 基準距離（床は床位置合わせの距離が入ってる）
+                            base_distance = to_target_link.distance
                             if base_distance < distance_ratio <= base_distance * 3:
                                 # 基準距離に近い場合、情報だけ保持
                                 # 各キーフレにおける距離情報保持
@@ -555,7 +583,7 @@ cdef class ArmAlignmentService:
                     # if debug_bone_name not in data_set.motion.bones:
                     #     data_set.motion.bones[debug_bone_name] = {}
                     
-                    # data_set.motion.bones[debug_bone_name][fno] = debug_bf
+                    # data_set.motion.set_bf(debug_bone_name, fno, debug_bf)
 
                     # # 作成元のエフェクタボーン位置 -------------
                     # debug_bone_name = "{0}2".format(target_link.effector_bone_name[0])
@@ -568,7 +596,7 @@ cdef class ArmAlignmentService:
                     # if debug_bone_name not in data_set.motion.bones:
                     #     data_set.motion.bones[debug_bone_name] = {}
                     
-                    # data_set.motion.bones[debug_bone_name][fno] = debug_bf
+                    # data_set.motion.set_bf(debug_bone_name, fno, debug_bf)
 
             if fno // 500 > prev_block_fno:
                 logger.count("准备对齐④", fno, fnos)
@@ -635,7 +663,7 @@ cdef class ArmAlignmentService:
                     for bone_name in ["{0}腕".format(target_link.effector_bone_name[0]), "{0}ひじ".format(target_link.effector_bone_name[0])]:
                         if bone_name not in data_set.motion.bones:
                             data_set.motion.bones[bone_name] = {}
-                        data_set.motion.bones[bone_name][fno] = data_set.motion.calc_bf(bone_name, fno)
+                        data_set.motion.own_bone_frames(bone_name)[fno] = data_set.motion.calc_bf(bone_name, fno)
             
             results = {}
             for fidx, fno in enumerate(all_alignment_group["fnos"]):
@@ -704,7 +732,7 @@ cdef class ArmAlignmentService:
                     # if debug_bone_name not in data_set.motion.bones:
                     #     data_set.motion.bones[debug_bone_name] = {}
                     
-                    # data_set.motion.bones[debug_bone_name][fno] = debug_bf
+                    # data_set.motion.set_bf(debug_bone_name, fno, debug_bf)
 
                     org_fno_global_effector = MVector3D(all_alignment_group["org_fno_global_effector"][fno][(data_set_idx, alignment_idx)])
 
@@ -765,7 +793,7 @@ cdef class ArmAlignmentService:
                     # if debug_bone_name not in data_set.motion.bones:
                     #     data_set.motion.bones[debug_bone_name] = {}
                     
-                    # data_set.motion.bones[debug_bone_name][fno] = debug_bf
+                    # data_set.motion.set_bf(debug_bone_name, fno, debug_bf)
 
                     is_success = []
 
@@ -882,7 +910,7 @@ cdef class ArmAlignmentService:
                                 # if debug_bone_name not in data_set.motion.bones:
                                 #     data_set.motion.bones[debug_bone_name] = {}
                                 
-                                # data_set.motion.bones[debug_bone_name][fno] = debug_bf
+                                # data_set.motion.set_bf(debug_bone_name, fno, debug_bf)
                                 # # ----------
 
                                 # 大体同じ位置にあって、角度もそう大きくズレてない場合、OK(全部上書き)
@@ -920,7 +948,7 @@ cdef class ArmAlignmentService:
                                 # if debug_bone_name not in data_set.motion.bones:
                                 #     data_set.motion.bones[debug_bone_name] = {}
                                 
-                                # data_set.motion.bones[debug_bone_name][fno] = debug_bf
+                                # data_set.motion.set_bf(debug_bone_name, fno, debug_bf)
                                 # # ----------
 
                                 # ちょっと失敗初回か、前回より差が小さくなってる場合、org_bfを保持し直して、もう一周試す
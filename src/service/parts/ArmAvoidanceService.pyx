@@ -2,6 +2,7 @@
 #
 import os
 import numpy as np
+cimport numpy as np
 import math
 from libc.math cimport sin, cos, acos, atan2, asin, pi, sqrt
 
@@ -23,7 +24,7 @@ from mmd.VmdData cimport VmdMotion, VmdBoneFrame
 from module.MOptions import MOptions, MOptionsDataSet # noqa
 from module.MOptions cimport MOptions, MOptionsDataSet # noqa
 
-from utils import MServiceUtils
+from utils import MServiceUtils, MProcessUtils
 from utils cimport MServiceUtils
 
 from utils.MLogger import MLogger # noqa
@@ -82,18 +83,23 @@ cdef class ArmAvoidanceService:
                 self.avoidance_options[(data_set_idx, "左")] = self.prepare_avoidance(data_set_idx, "左")
                 self.avoidance_options[(data_set_idx, "右")] = self.prepare_avoidance(data_set_idx, "右")
 
-        futures = []
-        with ThreadPoolExecutor(thread_name_prefix="avoidance", max_workers=self.options.max_workers) as executor:
-            for data_set_idx, data_set in enumerate(self.options.data_set_list):
-                if data_set_idx in self.target_data_set_idxs:
-                    futures.append(executor.submit(self.execute_avoidance_pool, data_set_idx, "右"))
-                    futures.append(executor.submit(self.execute_avoidance_pool, data_set_idx, "左"))
+        if self.options.is_multi_process:
+            # データセット・左右単位でプロセス並列実行
+            if not self.execute_process():
+                return False
+        else:
+            futures = []
+            with ThreadPoolExecutor(thread_name_prefix="avoidance", max_workers=self.options.max_workers) as executor:
+                for data_set_idx, data_set in enumerate(self.options.data_set_list):
+                    if data_set_idx in self.target_data_set_idxs:
+                        futures.append(executor.submit(self.execute_avoidance_pool, data_set_idx, "右"))
+                        futures.append(executor.submit(self.execute_avoidance_pool, data_set_idx, "左"))
 
-        concurrent.futures.wait(futures, timeout=None, return_when=concurrent.futures.FIRST_EXCEPTION)
+            concurrent.futures.wait(futures, timeout=None, return_when=concurrent.futures.FIRST_EXCEPTION)
 
-        for f in futures:
-            if not f.result():
-                return False
+            for f in futures:
+                if not f.result():
+                    return False
 
         for data_set_idx, data_set in enumerate(self.options.data_set_list):
             if data_set_idx in self.target_data_set_idxs and self.options.now_process_ctrl:
@@ -105,6 +111,26 @@ cdef class ArmAvoidanceService:
 
         return True
     
+    # データセット・左右単位でプロセス並列実行
+    def execute_process(self):
+        tasks = []
+        for data_set_idx, data_set in enumerate(self.options.data_set_list):
+            if data_set_idx in self.target_data_set_idxs:
+                for direction in ["右", "左"]:
+                    tasks.append((execute_avoidance_process, [data_set_idx], (data_set_idx, direction, self.avoidance_options[(data_set_idx, direction)])))
+
+        futures = MProcessUtils.execute_process_pool(self.options, self.options.max_workers, tasks)
+
+        for f in futures:
+            result, data_set_idx, bones = f.result()
+            if not result:
+                return False
+
+            # 子プロセスで処理した側のボーンだけ反映
+            self.options.data_set_list[data_set_idx].motion.bones.update(bones)
+
+        return True
+
     # 接触回避
     cpdef bint execute_avoidance_pool(self, int data_set_idx, str direction):
         try:
@@ -180,9 +206,9 @@ cdef class ArmAvoidanceService:
         cdef int fno, ik_cnt, ik_max_count, now_ik_max_count, prev_block_fno
         cdef str arm_bone_name, avoidance_name, bone_name, elbow_bone_name, link_name, wrist_bone_name, axis
         cdef list fnos, ik_links_list, target_bone_names, is_success, failured_last_names
-        cdef dict dot_dict, dot_limit_dict, now_rep_global_3ds, org_bfs, rep_avbone_global_3ds, rep_avbone_global_mats, rep_global_3ds, avoidance_axis
+        cdef dict dot_dict, dot_limit_dict, now_rep_global_3ds, org_bfs, rep_avbone_global_3ds, rep_avbone_global_mats, rep_global_3ds, avoidance_axis, collision_radiuses
         cdef bint is_in_elbow
-        cdef MVector3D now_rep_effector_pos, rep_collision_vec, rep_diff, prev_rep_diff
+        cdef MVector3D now_rep_effector_pos, rep_collision_vec, rep_diff, prev_rep_diff, avoidance_origin
         cdef MOptionsDataSet data_set
         cdef BoneLinks arm_link, avodance_link, ik_links
         cdef VmdBoneFrame arm_bf, bf, elbow_bf, now_bf
@@ -210,12 +236,18 @@ cdef class ArmAvoidanceService:
         prev_block_fno = 0
         fnos = data_set.motion.get_bone_fnos(*target_bone_names)
 
+        # 剛体・腕リンク毎の外接球の半径（大まかな判定用）
+        collision_radiuses = {}
+        for avoidance_name, avoidance in avoidance_options.avoidances.items():
+            for arm_link in avoidance_options.arm_links:
+                collision_radiuses[(avoidance_name, arm_link.last_name())] = avoidance.get_collision_radius(avoidance_options.base_ratio_list[arm_link.last_name()])
+
         # 一度全部キーを追加する（キー自体は無効化のまま）
         for fno in fnos:
             for bone_name in [arm_bone_name, elbow_bone_name]:
                 if bone_name not in data_set.motion.bones:
                     data_set.motion.bones[bone_name] = {}
-                data_set.motion.bones[bone_name][fno] = data_set.motion.calc_bf(bone_name, fno)
+                data_set.motion.own_bone_frames(bone_name)[fno] = data_set.motion.calc_bf(bone_name, fno)
 
         while len(fnos) > 0:
             fno = fnos[0]
@@ -229,7 +261,9 @@ cdef class ArmAvoidanceService:
                 (rep_avbone_global_3ds, rep_avbone_global_mats) = \
                     MServiceUtils.c_calc_global_pos(data_set.rep_model, avodance_link, data_set.motion, fno, return_matrix=True, is_local_x=False, limit_links=None)
                 
-                obb = avoidance.get_obb(fno, avodance_link.get(avodance_link.last_name()).position, rep_avbone_global_mats, self.options.arm_options.alignment, direction == "左")
+                # 剛体の原点（OBBは精密判定が必要になった時に生成する）
+                avoidance_origin = rep_avbone_global_mats[avoidance.bone_name] * (avoidance.shape_position - avodance_link.get(avodance_link.last_name()).position)
+                obb = None
 
                 # # 剛体の原点 ---------------
                 # debug_bone_name = "原点"
@@ -242,7 +276,7 @@ cdef class ArmAvoidanceService:
                 # if debug_bone_name not in data_set.motion.bones:
                 #     data_set.motion.bones[debug_bone_name] = {}
                 
-                # data_set.motion.bones[debug_bone_name][fno] = debug_bf
+                # data_set.motion.set_bf(debug_bone_name, fno, debug_bf)
                 # # --------------
             
                 for arm_link in avoidance_options.arm_links:
@@ -251,6 +285,13 @@ cdef class ArmAvoidanceService:
                         MServiceUtils.c_calc_global_pos(data_set.rep_model, arm_link, data_set.motion, fno, return_matrix=False, is_local_x=False, limit_links=None)
                     # [logger.test("f: %s, k: %s, v: %s", fno, k, v) for k, v in rep_global_3ds.items()]
 
+                    if rep_global_3ds[arm_link.last_name()].distanceToPoint(avoidance_origin) > collision_radiuses[(avoidance_name, arm_link.last_name())]:
+                        # 剛体の外接球より離れている場合、衝突も近接もしないので精密判定しない
+                        continue
+
+                    if obb is None:
+                        obb = avoidance.get_obb(fno, avodance_link.get(avodance_link.last_name()).position, rep_avbone_global_mats, self.options.arm_options.alignment, direction == "左")
+
                     # 衝突情報を取る
                     (collision, near_collision, x_distance, z_plus_distance, z_minus_distance, rep_x_collision_vec, rep_z_plus_collision_vec, rep_z_minus_collision_vec) \
                         = obb.get_collistion(rep_global_3ds[arm_link.last_name()], rep_global_3ds[arm_bone_name], \
@@ -301,7 +342,7 @@ cdef class ArmAvoidanceService:
                         # if debug_bone_name not in data_set.motion.bones:
                         #     data_set.motion.bones[debug_bone_name] = {}
                         
-                        # data_set.motion.bones[debug_bone_name][fno] = debug_bf
+                        # data_set.motion.set_bf(debug_bone_name, fno, debug_bf)
                         # # ----------
 
                         # IK処理実行
@@ -359,7 +400,7 @@ cdef class ArmAvoidanceService:
                                     # if debug_bone_name not in data_set.motion.bones:
                                     #     data_set.motion.bones[debug_bone_name] = {}
                                     
-                                    # data_set.motion.bones[debug_bone_name][fno] = debug_bf
+                                    # data_set.motion.set_bf(debug_bone_name, fno, debug_bf)
                                     # # ----------
 
                                     # org_bfを保持し直し
@@ -369,11 +410,11 @@ cdef class ArmAvoidanceService:
                                     # 回避方向保持
                                     if wrist_bone_name in list(ik_links.all().keys()):
                                         # 手首が含まれる場合、ひじがIK対象
-                                        data_set.motion.bones[elbow_bone_name][fno].avoidance = axis
+                                        data_set.motion.own_bone_frames(elbow_bone_name)[fno].avoidance = axis
 
                                     if elbow_bone_name not in list(ik_links.all().keys()):
                                         # ひじが含まれない場合、腕ボーンのみIK対象なので、IK対象
-                                        data_set.motion.bones[arm_bone_name][fno].avoidance = axis
+                                        data_set.motion.own_bone_frames(arm_bone_name)[fno].avoidance = axis
 
                                     # 大体同じ位置にあって、角度もそう大きくズレてない場合、OK(全部上書き)
                                     is_success = [True]
@@ -408,7 +449,7 @@ cdef class ArmAvoidanceService:
                                     # if debug_bone_name not in data_set.motion.bones:
                                     #     data_set.motion.bones[debug_bone_name] = {}
                                     
-                                    # data_set.motion.bones[debug_bone_name][fno] = debug_bf
+                                    # data_set.motion.set_bf(debug_bone_name, fno, debug_bf)
                                     # # ----------
 
                                     # org_bfを保持し直し
@@ -418,11 +459,11 @@ cdef class ArmAvoidanceService:
                                     # 回避方向保持
                                     if wrist_bone_name in list(ik_links.all().keys()):
                                         # 手首が含まれる場合、ひじがIK対象
-                                        data_set.motion.bones[elbow_bone_name][fno].avoidance = axis
+                                        data_set.motion.own_bone_frames(elbow_bone_name)[fno].avoidance = axis
 
                                     if elbow_bone_name not in list(ik_links.all().keys()):
                                         # ひじが含まれない場合、腕ボーンのみIK対象なので、IK対象
-                                        data_set.motion.bones[arm_bone_name][fno].avoidance = axis
+                                        data_set.motion.own_bone_frames(arm_bone_name)[fno].avoidance = axis
 
                                     # 採用されたらOK
                                     is_success.append(True)
@@ -527,17 +568,16 @@ cdef class ArmAvoidanceService:
     cpdef dict prepare_avoidance_dataset(self, int data_set_idx, str direction):
         logger.info("准备接触回避【No.%s - %s】", (data_set_idx + 1), direction)
 
-        cdef int aidx, fno, from_fno, prev_block_fno, to_fno
+        cdef int aidx, fidx, fno, from_fno, lidx, prev_block_fno, to_fno
         cdef double block_x_distance, block_z_plus_distance, x_distance, z_plus_distance, block_z_minus_distance, z_minus_distance
         cdef list all_avoidance_list, fnos, prev_collisions
-        cdef dict all_avoidance_axis, rep_avbone_global_3ds, rep_avbone_global_mats, rep_global_3ds, rep_matrixs, avoidance_list
+        cdef dict all_avoidance_axis, all_collisions, avoidance_list
+        cdef tuple collisions
         cdef str avoidance_name, bone_name
         cdef bint collision, near_collision
-        cdef BoneLinks arm_link, avodance_link
+        cdef BoneLinks arm_link
         cdef ArmAvoidanceOption avoidance_options
         cdef MOptionsDataSet data_set
-        cdef OBB obb
-        cdef RigidBody avoidance
         cdef MVector3D rep_x_collision_vec, rep_z_plus_collision_vec, rep_z_minus_collision_vec
 
         logger.copy(self.options)
@@ -552,7 +592,11 @@ cdef class ArmAvoidanceService:
         prev_block_fno = 0
         fno = 0
         fnos = data_set.motion.get_bone_fnos("{0}腕".format(direction), "{0}腕捩".format(direction), "{0}ひじ".format(direction), "{0}手捩".format(direction), "{0}手首".format(direction))
-        for fno in fnos:
+
+        # 全フレーム一括で衝突判定する
+        all_collisions = self.calc_avoidance_collisions(data_set_idx, direction, fnos)
+
+        for fidx, fno in enumerate(fnos):
             
             # 衝突しておらず、かつ前回の衝突情報がある場合、追加
             if prev_collisions.count(True) == 0 and len(all_avoidance_list[-1].keys()) > 0:
@@ -561,26 +605,21 @@ cdef class ArmAvoidanceService:
             
             prev_collisions = []
 
-            for ((avoidance_name, avodance_link), avoidance) in zip(avoidance_options.avoidance_links.items(), avoidance_options.avoidances.values()):
-                # 剛体の現在位置をチェック
-                (rep_avbone_global_3ds, rep_avbone_global_mats) = \
-                    MServiceUtils.c_calc_global_pos(data_set.rep_model, avodance_link, data_set.motion, fno, return_matrix=True, is_local_x=False, limit_links=None)
-
-                obb = avoidance.get_obb(fno, avodance_link.get(avodance_link.last_name()).position, rep_avbone_global_mats, self.options.arm_options.alignment, direction == "左")
-            
-                for arm_link in avoidance_options.arm_links:
-                    # 先モデルのそれぞれのグローバル位置
-                    (rep_global_3ds, rep_matrixs) = \
-                        MServiceUtils.c_calc_global_pos(data_set.rep_model, arm_link, data_set.motion, fno, return_matrix=True, is_local_x=False, limit_links=None)
-                    # [logger.debug("f: %s, k: %s, v: %s", fno, k, v) for k, v in rep_global_3ds.items()]
-
+            for aidx, avoidance_name in enumerate(avoidance_options.avoidance_links.keys()):
+                for lidx, arm_link in enumerate(avoidance_options.arm_links):
                     # 衝突情報を取る
-                    (collision, near_collision, x_distance, z_plus_distance, z_minus_distance, rep_x_collision_vec, rep_z_plus_collision_vec, rep_z_minus_collision_vec) \
-                        = obb.get_collistion(rep_global_3ds[arm_link.last_name()], rep_global_3ds["{0}腕".format(direction)], \
-                                             data_set.rep_model.bones["{0}腕".format(direction)].position.distanceToPoint(data_set.rep_model.bones[arm_link.last_name()].position), \
-                                             avoidance_options.base_ratio_list[arm_link.last_name()])
+                    collisions = all_collisions[(aidx, lidx)]
+                    collision = collisions[0][fidx]
+                    near_collision = collisions[1][fidx]
 
                     if collision or near_collision:
+                        x_distance = collisions[2][fidx]
+                        z_plus_distance = collisions[3][fidx]
+                        z_minus_distance = collisions[4][fidx]
+                        rep_x_collision_vec = MVector3D(collisions[5][fidx])
+                        rep_z_plus_collision_vec = MVector3D(collisions[6][fidx])
+                        rep_z_minus_collision_vec = MVector3D(collisions[7][fidx])
+
                         logger.debug("f: %s(%s-%s:%s), c[%s], nc[%s], xd[%s], zdp[%s], zdm[%s], xv[%s], zvp[%s], zvm[%s]", \
                                      fno, (data_set_idx + 1), arm_link.last_name(), avoidance_name, collision, near_collision, \
                                      x_distance, z_plus_distance, z_minus_distance, rep_x_collision_vec.to_log(), rep_z_plus_collision_vec.to_log(), rep_z_minus_collision_vec.to_log())
@@ -639,6 +678,61 @@ cdef class ArmAvoidanceService:
 
         return all_avoidance_axis
 
+    # 衝突判定（全フレーム一括）
+    # 剛体の原点と腕リンク末端との距離が剛体の外接球の半径より大きいフレームは、衝突・近接ともにしないので除外し、
+    # 残ったフレームだけを剛体の形状毎にまとめて精密判定する
+    # 戻り値：{(剛体INDEX, 腕リンクINDEX): (衝突, 近接, X距離, Z+距離, Z-距離, X回避位置, Z+回避位置, Z-回避位置)}（それぞれフレーム数分の配列）
+    cpdef dict calc_avoidance_collisions(self, int data_set_idx, str direction, list fnos):
+        cdef int aidx, lidx, bone_idx, root_idx
+        cdef str avoidance_name, arm_bone_name
+        cdef dict all_collisions
+        cdef double max_length, radius
+        cdef MOptionsDataSet data_set
+        cdef ArmAvoidanceOption avoidance_options
+        cdef BoneLinks arm_link, avodance_link
+        cdef RigidBody avoidance
+        cdef tuple collisions
+        cdef list arm_global_3ds
+        cdef np.ndarray avbone_global_mats, distances, origins, shape_offset, candidate_idxs
+
+        data_set = self.options.data_set_list[data_set_idx]
+        avoidance_options = self.avoidance_options[(data_set_idx, direction)]
+        arm_bone_name = "{0}腕".format(direction)
+
+        # 腕リンクのグローバル位置（剛体に関係なく一度だけ求める）
+        arm_global_3ds = []
+        for arm_link in avoidance_options.arm_links:
+            arm_global_3ds.append(MServiceUtils.c_calc_global_pos_by_fnos(data_set.rep_model, arm_link, data_set.motion, fnos, None, False, False)[0])
+
+        all_collisions = {}
+        for aidx, ((avoidance_name, avodance_link), avoidance) in enumerate(zip(avoidance_options.avoidance_links.items(), avoidance_options.avoidances.values())):
+            # 剛体が追従するボーンの行列
+            (_, avbone_global_mats) = MServiceUtils.c_calc_global_pos_by_fnos(data_set.rep_model, avodance_link, data_set.motion, fnos, None, True, False)
+            bone_idx = list(avodance_link.all().keys()).index(avoidance.bone_name)
+
+            # 剛体の原点（OBBの原点と同じく、ボーンの行列に剛体のボーンからの相対位置を掛けたもの）
+            shape_offset = (avoidance.shape_position - avodance_link.get(avodance_link.last_name()).position).data()
+            origins = np.einsum('fij,j->fi', avbone_global_mats[:, bone_idx, :3, :3], shape_offset) + avbone_global_mats[:, bone_idx, :3, 3]
+
+            for lidx, arm_link in enumerate(avoidance_options.arm_links):
+                radius = avoidance.get_collision_radius(avoidance_options.base_ratio_list[arm_link.last_name()])
+                distances = np.sqrt(np.einsum('fi,fi->f', arm_global_3ds[lidx][:, -1] - origins, arm_global_3ds[lidx][:, -1] - origins))
+
+                # 外接球の中にあるフレームだけ精密判定する（NaNの場合は判定できないので精密判定に回す）
+                candidate_idxs = np.where(~(distances > radius))[0]
+                root_idx = list(arm_link.all().keys()).index(arm_bone_name)
+                max_length = data_set.rep_model.bones[arm_bone_name].position.distanceToPoint(data_set.rep_model.bones[arm_link.last_name()].position)
+
+                collisions = avoidance.get_collisions(avodance_link.get(avodance_link.last_name()).position, avbone_global_mats[candidate_idxs, bone_idx], \
+                                                      arm_global_3ds[lidx][candidate_idxs, -1], arm_global_3ds[lidx][candidate_idxs, root_idx], \
+                                                      max_length, avoidance_options.base_ratio_list[arm_link.last_name()], direction == "左")
+
+                all_collisions[(aidx, lidx)] = tuple([c_scatter_frames(values, candidate_idxs, len(fnos)) for values in collisions])
+
+                logger.debug("接触回避一括判定: %s-%s, 全体[%s], 精密判定[%s]", avoidance_name, arm_link.last_name(), len(fnos), len(candidate_idxs))
+
+        return all_collisions
+
     def calc_face_length(self, model: PmxModel):
         face_length = 1
 
@@ -846,3 +940,26 @@ cdef class ArmAvoidanceService:
 
         return target_data_set_idxs
 
+
+# 一部のフレーム(frame_idxs)分の値を、全フレーム分の配列に展開する（それ以外のフレームは0/False）
+cdef np.ndarray c_scatter_frames(np.ndarray values, np.ndarray frame_idxs, int fno_cnt):
+    cdef np.ndarray all_values = np.zeros((fno_cnt,) + np.shape(values)[1:], dtype=values.dtype)
+    all_values[frame_idxs] = values
+
+    return all_values
+
+
+# プロセス並列実行用（子プロセスでデータセットの片側分の接触回避を行う）
+def execute_avoidance_process(options: MOptions, data_set_idx: int, direction: str, avoidance_option: ArmAvoidanceOption):
+    cdef ArmAvoidanceService service
+    cdef MOptionsDataSet data_set
+
+    MProcessUtils.init_process(options)
+
+    service = ArmAvoidanceService(options)
+    service.target_data_set_idxs = [data_set_idx]
+    service.avoidance_options = {(data_set_idx, direction): avoidance_option}
+    result = service.execute_avoidance_pool(data_set_idx, direction)
+    data_set = options.data_set_list[data_set_idx]
+
+    return result, data_set_idx, {k: v for k, v in data_set.motion.bones.items() if k.startswith(direction)}
@@ -2,13 +2,15 @@
 #
 import numpy as np
 import math
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor
 
 from mmd.PmxData import PmxModel, Bone # noqa
 from mmd.VmdData import VmdMotion, VmdBoneFrame, VmdCameraFrame, VmdInfoIk, VmdLightFrame, VmdMorphFrame, VmdShadowFrame, VmdShowIkFrame # noqa
 from module.MMath import MRect, MVector2D, MVector3D, MVector4D, MQuaternion, MMatrix4x4 # noqa
 from module.MOptions import MOptions, MOptionsDataSet # noqa
 from module.MParams import BoneLinks # noqa
-from utils import MServiceUtils, MBezierUtils # noqa
+from utils import MServiceUtils, MBezierUtils, MProcessUtils # noqa
 from utils.MLogger import MLogger # noqa
 from utils.MException import SizingException, MKilledException
 
@@ -44,32 +46,61 @@ class CameraService():
             for data_set_idx in self.target_data_set_idxs:
                 self.prepare(data_set_idx)
             
+            fnos = sorted(self.options.camera_motion.cameras.keys())
+
+            # 全カメラキーフレのグローバル位置を一括で算出
+            self.prepare_global_poses(fnos)
+
+            # 前回と同じカメラ位置のキーフレは、前回のサイジング済みカメラ位置をコピーする
+            # （サイジング前の値だけで判定できるので、先にコピー元を決めておく）
+            copy_fnos = {}
+            calc_fnos = []
             prev_fno = -1
-            for fno in sorted(self.options.camera_motion.cameras.keys()):
-                past_cf = VmdCameraFrame()
+            for fno in fnos:
                 cf = self.options.camera_motion.cameras[fno]
-                # 1キーフレごとに見ていく（同一キーフレの可能性があるので、並列化不可）
                 if prev_fno >= 0:
-                    # 前回と同じカメラ位置の場合、前回のサイジング済みカメラ位置コピー
                     past_cf = self.options.camera_motion.cameras[prev_fno]
                     if past_cf.org_length == cf.length and past_cf.org_position == cf.position and past_cf.euler == cf.euler:
-                        logger.info("第%s帧 前位置・距离复制", fno)
-                        cf.position = past_cf.position.copy()
-                        cf.length = past_cf.length
+                        copy_fnos[fno] = prev_fno
                         continue
 
-                # 比率計算
-                org_inner_global_poses, org_inner_square_poses, rep_inner_global_poses, ratio, (nearest_data_set_idx, nearest_bone_name), \
-                    (left_data_set_idx, left_bone_name), (right_data_set_idx, right_bone_name), (top_data_set_idx, top_bone_name), (bottom_data_set_idx, bottom_bone_name) \
-                    = self.calc_camera_ratio(fno, cf)
-                
-                # カメラサイジング実行
-                self.execute_rep_camera(fno, cf, past_cf, org_inner_global_poses, org_inner_square_poses, rep_inner_global_poses, ratio, nearest_data_set_idx, nearest_bone_name, \
-                                        left_data_set_idx, left_bone_name, right_data_set_idx, right_bone_name, top_data_set_idx, top_bone_name, bottom_data_set_idx, bottom_bone_name, \
-                                        self.options.camera_length)
-
+                calc_fnos.append(fno)
                 prev_fno = fno
 
+            # キーフレ毎のサイジングは互いに独立しているので、キーフレの塊単位で並列に計算する
+            chunk_cnt = max(1, min(len(calc_fnos), self.options.max_workers))
+            fno_chunks = [calc_fnos[(cidx * len(calc_fnos)) // chunk_cnt:((cidx + 1) * len(calc_fnos)) // chunk_cnt] for cidx in range(chunk_cnt)]
+
+            if self.options.is_multi_process and chunk_cnt > 1:
+                # キーフレの塊単位でプロセス並列実行
+                rep_cfs = self.execute_process(fno_chunks)
+            else:
+                rep_cfs = {}
+                futures = []
+                with ThreadPoolExecutor(thread_name_prefix="camera", max_workers=self.options.max_workers) as executor:
+                    for chunk_fnos in fno_chunks:
+                        futures.append(executor.submit(self.calc_rep_cameras, [self.options.camera_motion.cameras[fno].copy() for fno in chunk_fnos]))
+
+                concurrent.futures.wait(futures, timeout=None, return_when=concurrent.futures.FIRST_EXCEPTION)
+
+                for f in futures:
+                    rep_cfs.update(f.result())
+
+            # キーフレ順にサイジング結果を反映する（コピー元は必ず前のキーフレなので、反映済み）
+            for fno in fnos:
+                cf = self.options.camera_motion.cameras[fno]
+                if fno in copy_fnos:
+                    past_cf = self.options.camera_motion.cameras[copy_fnos[fno]]
+                    logger.info("第%s帧 前位置・距离复制", fno)
+                    cf.position = past_cf.position.copy()
+                    cf.length = past_cf.length
+                else:
+                    rep_cf = rep_cfs[fno]
+                    cf.position = rep_cf.position
+                    cf.length = rep_cf.length
+                    cf.angle = rep_cf.angle
+                    cf.ratio = rep_cf.ratio
+
             if self.options.now_process_ctrl:
                 self.options.now_process += 1
                 self.options.now_process_ctrl.write(str(self.options.now_process))
@@ -87,8 +118,46 @@ class CameraService():
             logger.error("尺寸调整处理以意外错误结束。\n\n%s", traceback.format_exc())
             raise e
     
+    # キーフレの塊単位でプロセス並列実行
+    def execute_process(self, fno_chunks: list):
+        tasks = []
+        for chunk_fnos in fno_chunks:
+            # 子プロセスには塊のキーフレ分のグローバル位置だけ渡す
+            chunk_fidxs = [self.global_pos_fno_indexes[fno] for fno in chunk_fnos]
+            org_link_global_poses = {link_key: global_poses[chunk_fidxs] for link_key, global_poses in self.org_link_global_poses.items()}
+            rep_link_global_poses = {link_key: global_poses[chunk_fidxs] for link_key, global_poses in self.rep_link_global_poses.items()}
+
+            tasks.append((execute_camera_process, [], (self.camera_options, org_link_global_poses, rep_link_global_poses, \
+                                                       [self.options.camera_motion.cameras[fno].copy() for fno in chunk_fnos])))
+
+        futures = MProcessUtils.execute_process_pool(self.options, self.options.max_workers, tasks)
+
+        rep_cfs = {}
+        for f in futures:
+            rep_cfs.update(f.result())
+
+        return rep_cfs
+
+    # 渡されたカメラキーフレ（コピー）をサイジングして、キーフレ番号をキーにした辞書で返す
+    def calc_rep_cameras(self, cfs: list):
+        rep_cfs = {}
+        for cf in cfs:
+            # 比率計算
+            org_inner_global_poses, org_inner_square_poses, rep_inner_global_poses, ratio, (nearest_data_set_idx, nearest_bone_name), \
+                (left_data_set_idx, left_bone_name), (right_data_set_idx, right_bone_name), (top_data_set_idx, top_bone_name), (bottom_data_set_idx, bottom_bone_name) \
+                = self.calc_camera_ratio(cf.fno, cf)
+            
+            # カメラサイジング実行
+            self.execute_rep_camera(cf.fno, cf, org_inner_global_poses, org_inner_square_poses, rep_inner_global_poses, ratio, nearest_data_set_idx, nearest_bone_name, \
+                                    left_data_set_idx, left_bone_name, right_data_set_idx, right_bone_name, top_data_set_idx, top_bone_name, bottom_data_set_idx, bottom_bone_name, \
+                                    self.options.camera_length)
+
+            rep_cfs[cf.fno] = cf
+
+        return rep_cfs
+
     # 変換先モデル用カメラ作成
-    def execute_rep_camera(self, fno: int, cf: VmdCameraFrame, past_cf: VmdCameraFrame, org_inner_global_poses: dict, org_inner_square_poses: dict, rep_inner_global_poses: dict, \
+    def execute_rep_camera(self, fno: int, cf: VmdCameraFrame, org_inner_global_poses: dict, org_inner_square_poses: dict, rep_inner_global_poses: dict, \
                            ratio: float, nearest_data_set_idx: int, nearest_bone_name: str, left_data_set_idx: int, left_bone_name: str, right_data_set_idx: int, right_bone_name: str, \
                            top_data_set_idx: int, top_bone_name: str, bottom_data_set_idx: int, bottom_bone_name: str, camera_length: float):
 
@@ -486,7 +555,7 @@ class CameraService():
 
     def calc_org_project_square_poses(self, fno: int, cf: VmdCameraFrame, start_idx: int, end_idx: int, all_org_global_poses: dict, all_org_project_square_poses: dict):
         for data_set_idx, camera_option in self.camera_options.items():
-            for link_idx, org_link in enumerate(camera_option.org_links[start_idx:end_idx]):
+            for link_idx, org_link in enumerate(camera_option.org_links[start_idx:end_idx], start=start_idx):
                 if len(org_link.all().keys()) == 0:
                     # 処理対象がなければスルー
                     continue
@@ -495,43 +564,56 @@ class CameraService():
                 data_set = self.options.data_set_list[data_set_idx]
 
                 # 元モデルのそれぞれのグローバル位置
-                org_global_3ds = MServiceUtils.calc_global_pos(data_set.camera_org_model, org_link, data_set.org_motion, fno)
-                for bone_name, org_vec in org_global_3ds.items():
+                org_global_poses = self.org_link_global_poses[(data_set_idx, link_idx)][self.global_pos_fno_indexes[fno]]
+                for bone_name, org_pos in zip(org_link.all().keys(), org_global_poses):
                     if bone_name in camera_option.org_link_target.keys() and (data_set_idx, bone_name) not in all_org_project_square_poses:
                         # 処理対象ボーンである場合、データを保持
+                        org_vec = MVector3D(org_pos)
                         all_org_global_poses[(data_set_idx, bone_name)] = org_vec.data()
                         all_org_project_square_poses[(data_set_idx, bone_name)] = self.calc_project_square_vec(cf, org_vec).data()
 
         [logger.test("f: %s, k: %s, v: %s, s: %s", fno, k, v, sv) for (k, v), (sk, sv) in zip(all_org_global_poses.items(), all_org_project_square_poses.items())]
 
     def calc_rep_global_poses(self, fno: int, data_bone_name_list: list):
-        rep_links = []
-        for (data_set_idx, bone_name) in data_bone_name_list:
-            # 処理対象カメラオプション
-            camera_option = self.camera_options[data_set_idx]
-            # 処理対象のボーンを計算するためのリンク
-            rep_link = camera_option.rep_links[bone_name]
-            if (data_set_idx, rep_link) not in rep_links:
-                # まだ保持されていないリンクなら保持
-                rep_links.append((data_set_idx, rep_link))
-
         rep_global_poses = {}
-        for (data_set_idx, rep_link) in rep_links:
-            # 処理対象データセット
-            data_set = self.options.data_set_list[data_set_idx]
-            # 処理対象カメラオプション
-            camera_option = self.camera_options[data_set_idx]
-            
+        for (data_set_idx, link_bone_name) in data_bone_name_list:
+            # 処理対象のボーンを計算するためのリンク（ボーン毎に別のリンク）
+            rep_link = self.camera_options[data_set_idx].rep_links[link_bone_name]
+
             # 先モデルのそれぞれのグローバル位置
-            rep_global_3ds = MServiceUtils.calc_global_pos(data_set.rep_model, rep_link, data_set.motion, fno)
+            rep_link_global_poses = self.rep_link_global_poses[(data_set_idx, link_bone_name)][self.global_pos_fno_indexes[fno]]
 
-            for bone_name, rep_vec in rep_global_3ds.items():
+            for bone_name, rep_pos in zip(rep_link.all().keys(), rep_link_global_poses):
                 if (data_set_idx, bone_name) in data_bone_name_list:
                     # 処理対象ボーンである場合、データを保持
-                    rep_global_poses[(data_set_idx, bone_name)] = rep_vec.data()
+                    rep_global_poses[(data_set_idx, bone_name)] = MVector3D(rep_pos).data()
 
         return rep_global_poses
 
+    # 各リンクのグローバル位置を全カメラキーフレ分まとめて算出する
+    def prepare_global_poses(self, fnos: list):
+        self.global_pos_fno_indexes = {fno: fidx for fidx, fno in enumerate(fnos)}
+        self.org_link_global_poses = {}
+        self.rep_link_global_poses = {}
+
+        for data_set_idx, camera_option in self.camera_options.items():
+            # 処理対象データセット
+            data_set = self.options.data_set_list[data_set_idx]
+
+            # 子プロセスにも渡せるよう、元はリンクINDEX、先は判定対象ボーン名をキーにする
+            for link_idx, org_link in enumerate(camera_option.org_links):
+                if len(org_link.all().keys()) > 0:
+                    # 元モデルのそれぞれのグローバル位置
+                    self.org_link_global_poses[(data_set_idx, link_idx)] = \
+                        MServiceUtils.calc_global_pos_by_fnos(data_set.camera_org_model, org_link, data_set.org_motion, fnos)
+
+            for bone_name, rep_link in camera_option.rep_links.items():
+                # 先モデルのそれぞれのグローバル位置
+                self.rep_link_global_poses[(data_set_idx, bone_name)] = \
+                    MServiceUtils.calc_global_pos_by_fnos(data_set.rep_model, rep_link, data_set.motion, fnos)
+
+            logger.info("全键帧的全局位置计算完成【No.%s】", data_set_idx + 1)
+
     # プロジェクション座標からグローバル座標の位置際算出
     def calc_unproject_vec_from_square(self, cf: VmdCameraFrame, square_vec: MVector3D):
         # モデル座標系
@@ -761,6 +843,20 @@ class CameraService():
         return target_data_set_idxs
 
 
+# プロセス並列実行用（子プロセスでキーフレの塊分のカメラサイジングを行う）
+def execute_camera_process(options: MOptions, camera_options: dict, org_link_global_poses: dict, rep_link_global_poses: dict, cfs: list):
+    MProcessUtils.init_process(options)
+
+    service = CameraService(options)
+    service.camera_options = camera_options
+    # グローバル位置は渡されたキーフレ分だけ
+    service.global_pos_fno_indexes = {cf.fno: fidx for fidx, cf in enumerate(cfs)}
+    service.org_link_global_poses = org_link_global_poses
+    service.rep_link_global_poses = rep_link_global_poses
+
+    return service.calc_rep_cameras(cfs)
+
+
 # カメラオプション
 class CameraOption():
     def __init__(self, org_links: list, org_link_target: dict, rep_links: dict, org_total_height: float, org_face_length: float, org_heads: float, \
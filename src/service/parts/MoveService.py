@@ -66,21 +66,30 @@ class MoveService():
             fnos = data_set.motion.get_bone_fnos(bone_name)
             bone_link = data_set.rep_model.create_link_2_top_one(bone_name)
 
+            bone_frames = data_set.motion.own_bone_frames(bone_name)
+
             for fno in fnos:
-                bf = data_set.motion.bones[bone_name][fno]
+                bf = bone_frames[fno]
 
                 # 一旦IK比率をそのまま掛ける
                 bf.position.setX(bf.position.x() * data_set.xz_ratio)
                 bf.position.setY(bf.position.y() * data_set.y_ratio)
                 bf.position.setZ(bf.position.z() * data_set.xz_ratio)
 
-                _, rep_global_mats = MServiceUtils.calc_global_pos(data_set.rep_model, bone_link, data_set.motion, fno, return_matrix=True)
+            # 比率を掛けた後の全キーフレの行列を一括で求める
+            _, rep_global_mats = MServiceUtils.calc_global_pos_by_fnos(data_set.rep_model, bone_link, data_set.motion, fnos, return_matrix=True)
+            bone_link_idx = bone_link.index(bone_name)
+
+            for fidx, fno in enumerate(fnos):
+                bf = bone_frames[fno]
+                rep_global_mat = MMatrix4x4(rep_global_mats[fidx, bone_link_idx])
+
                 # 該当ボーンのローカル位置
-                local_pos = rep_global_mats[bone_name].inverted() * bf.position
+                local_pos = rep_global_mat.inverted() * bf.position
                 # ローカル位置にオフセット調整
                 local_pos += data_set.rep_model.bones[bone_name].local_offset
                 # 元に戻す
-                bf.position = rep_global_mats[bone_name] * local_pos
+                bf.position = rep_global_mat * local_pos
 
             if len(fnos) > 0:
                 logger.info("移动比例尺校正:完成【No.%s - %s】", data_set_idx + 1, bone_name)
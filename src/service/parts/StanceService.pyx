@@ -23,7 +23,7 @@ from mmd.VmdData cimport VmdMotion, VmdBoneFrame
 from module.MOptions import MOptions, MOptionsDataSet # noqa
 from module.MOptions cimport MOptions, MOptionsDataSet # noqa
 
-from utils import MServiceUtils, MBezierUtils
+from utils import MServiceUtils, MBezierUtils, MProcessUtils
 from utils cimport MServiceUtils
 
 from utils.MLogger import MLogger # noqa
@@ -56,6 +56,10 @@ cdef class StanceService():
         # for data_set_idx, data_set in enumerate(self.options.data_set_list):
         #     self.execute_pool(data_set_idx)
 
+        if self.options.is_multi_process:
+            # データセット単位でプロセス並列実行
+            return self.execute_process()
+
         futures = []
         with ThreadPoolExecutor(thread_name_prefix="stance", max_workers=min(5, self.options.max_workers)) as executor:
             for data_set_idx, data_set in enumerate(self.options.data_set_list):
@@ -72,6 +76,31 @@ cdef class StanceService():
                 return False
 
         return True
+
+    # データセット単位でプロセス並列実行
+    def execute_process(self):
+        tasks = []
+        for data_set_idx, data_set in enumerate(self.options.data_set_list):
+            if data_set.motion.motion_cnt <= 0:
+                # モーションデータが無い場合、処理スキップ
+                continue
+
+            tasks.append((execute_stance_process, [data_set_idx], (data_set_idx,)))
+
+        futures = MProcessUtils.execute_process_pool(self.options, min(5, self.options.max_workers), tasks)
+
+        for f in futures:
+            result, data_set_idx, bones, full_arms, tree_process_dict = f.result()
+            if result == PROCESS_ERROR:
+                return False
+
+            # 子プロセスの結果を反映
+            data_set = self.options.data_set_list[data_set_idx]
+            data_set.motion.bones = bones
+            data_set.full_arms = full_arms
+            MProcessUtils.merge_tree_process_dict(self.options.tree_process_dict, tree_process_dict)
+
+        return True
     
     cdef bint execute_pool(self, int data_set_idx):
         cdef MOptionsDataSet data_set
@@ -258,7 +287,7 @@ cdef class StanceService():
                         return PROCESS_ERROR
                 
                 # 捩り前のを保持
-                prev_twist_motion = data_set.motion.copy()
+                prev_twist_motion = data_set.motion.copy(is_snapshot=True)
 
                 futures = []
                 with ThreadPoolExecutor(thread_name_prefix="twist_regist{0}".format(data_set_idx), max_workers=self.options.max_workers) as executor:
@@ -709,17 +738,20 @@ cdef class StanceService():
             elbow_x_qq, elbow_y_qq, elbow_z_qq, elbow_yz_qq = MServiceUtils.separate_local_qq(fno, elbow_bone_name, elbow_bf.rotation, elbow_local_x_axis)
             wrist_x_qq, wrist_y_qq, wrist_z_qq, wrist_yz_qq = MServiceUtils.separate_local_qq(fno, wrist_bone_name, wrist_bf.rotation, wrist_twist_local_x_axis)
 
-            logger.test("f: %s, %s: total: %s", fno, arm_bone_name, arm_bf.rotation.toEulerAngles())
-            logger.test("f: %s, %s: x: %s", fno, arm_bone_name, arm_x_qq.toEulerAngles())
-            logger.test("f: %s, %s: y: %s", fno, arm_bone_name, arm_y_qq.toEulerAngles())
-            logger.test("f: %s, %s: z: %s", fno, arm_bone_name, arm_z_qq.toEulerAngles())
-            logger.test("f: %s, %s: yz: %s", fno, arm_bone_name, arm_yz_qq.toEulerAngles())
-            logger.debug("f: %s, %s: total: %s, x: %s, y: %s, z: %s, yz: %s", fno, elbow_bone_name, elbow_bf.rotation.toDegree(), elbow_x_qq.toDegree(), elbow_y_qq.toDegree(), elbow_z_qq.toDegree(), elbow_yz_qq)
-            logger.test("f: %s, %s: total: %s", fno, wrist_bone_name, wrist_bf.rotation.toEulerAngles())
-            logger.test("f: %s, %s: x: %s", fno, wrist_bone_name, wrist_x_qq.toEulerAngles())
-            logger.test("f: %s, %s: y: %s", fno, wrist_bone_name, wrist_y_qq.toEulerAngles())
-            logger.test("f: %s, %s: z: %s", fno, wrist_bone_name, wrist_z_qq.toEulerAngles())
-            logger.test("f: %s, %s: yz: %s", fno, wrist_bone_name, wrist_yz_qq.toEulerAngles())
+            if logger.is_enabled_for(MLogger.TEST):
+                logger.test("f: %s, %s: total: %s", fno, arm_bone_name, arm_bf.rotation.toEulerAngles())
+                logger.test("f: %s, %s: x: %s", fno, arm_bone_name, arm_x_qq.toEulerAngles())
+                logger.test("f: %s, %s: y: %s", fno, arm_bone_name, arm_y_qq.toEulerAngles())
+                logger.test("f: %s, %s: z: %s", fno, arm_bone_name, arm_z_qq.toEulerAngles())
+                logger.test("f: %s, %s: yz: %s", fno, arm_bone_name, arm_yz_qq.toEulerAngles())
+            if logger.is_enabled_for(MLogger.DEBUG):
+                logger.debug("f: %s, %s: total: %s, x: %s, y: %s, z: %s, yz: %s", fno, elbow_bone_name, elbow_bf.rotation.toDegree(), elbow_x_qq.toDegree(), elbow_y_qq.toDegree(), elbow_z_qq.toDegree(), elbow_yz_qq)
+            if logger.is_enabled_for(MLogger.TEST):
+                logger.test("f: %s, %s: total: %s", fno, wrist_bone_name, wrist_bf.rotation.toEulerAngles())
+                logger.test("f: %s, %s: x: %s", fno, wrist_bone_name, wrist_x_qq.toEulerAngles())
+                logger.test("f: %s, %s: y: %s", fno, wrist_bone_name, wrist_y_qq.toEulerAngles())
+                logger.test("f: %s, %s: z: %s", fno, wrist_bone_name, wrist_z_qq.toEulerAngles())
+                logger.test("f: %s, %s: yz: %s", fno, wrist_bone_name, wrist_yz_qq.toEulerAngles())
 
             # 腕Xを腕捩りに
             arm_twist_degree = arm_x_qq.toDegree() * np.sign(MVector3D.dotProduct(arm_twist_local_x_axis, arm_x_qq.vector()))
@@ -755,25 +787,25 @@ cdef class StanceService():
             # 全て登録
             arm_bf.rotation = arm_result_qq
             arm_bf.key = True
-            data_set.motion.bones[arm_bone_name][fno] = arm_bf
+            data_set.motion.own_bone_frames(arm_bone_name)[fno] = arm_bf
 
             arm_twist_bf.rotation = arm_twist_result_qq
             # 腕捩りの元の回転量として別保持
             arm_twist_bf.org_rotation = arm_twist_result_qq.copy()
             arm_twist_bf.key = True
-            data_set.motion.bones[arm_twist_bone_name][fno] = arm_twist_bf
+            data_set.motion.own_bone_frames(arm_twist_bone_name)[fno] = arm_twist_bf
 
             elbow_bf.rotation = elbow_result_qq
             elbow_bf.key = True
-            data_set.motion.bones[elbow_bone_name][fno] = elbow_bf
+            data_set.motion.own_bone_frames(elbow_bone_name)[fno] = elbow_bf
 
             wrist_twist_bf.rotation = wrist_twist_result_qq
             wrist_twist_bf.key = True
-            data_set.motion.bones[wrist_twist_bone_name][fno] = wrist_twist_bf
+            data_set.motion.own_bone_frames(wrist_twist_bone_name)[fno] = wrist_twist_bf
 
             wrist_bf.rotation = wrist_result_qq
             wrist_bf.key = True
-            data_set.motion.bones[wrist_bone_name][fno] = wrist_bf
+            data_set.motion.own_bone_frames(wrist_bone_name)[fno] = wrist_bf
 
             if fno in log_target_idxs and last_fno > 0:
                 logger.count("【No.{0} - 分散旋转骨 - {1}】".format(data_set_idx + 1, arm_twist_bone_name), fno, None, last_fno=last_fno)
@@ -2093,7 +2125,7 @@ cdef class StanceService():
             prev_fno = 0
             fnos = data_set.motion.get_bone_fnos("センター")
             for fno in fnos:
-                bf = data_set.motion.bones["センター"][fno]
+                bf = data_set.motion.own_bone_frames("センター")[fno]
                 if bf.key:
                     logger.debug("f: %s, 调整前: %s", bf.fno, bf.position)
                     bf.position += self.calc_center_offset_by_leg_ik(bf, data_set_idx, data_set, \
@@ -2846,7 +2878,7 @@ cdef class StanceService():
             prev_fno = 0
             fnos = data_set.motion.get_bone_fnos("下半身")
             for fno_idx, fno in enumerate(fnos):
-                lower_bf = data_set.motion.bones["下半身"][fno]
+                lower_bf = data_set.motion.own_bone_frames("下半身")[fno]
 
                 self.calc_rotation_stance_trunk(lower_bf, data_set_idx, data_set, \
                                                 org_lower_links, org_leg_center_links, org_leg_links, \
@@ -3688,7 +3720,7 @@ cdef class StanceService():
         cdef MQuaternion org_deformed_qq, rep_deformed_qq
 
         for fno in data_set.motion.get_bone_fnos(target_bone_name):
-            bf = data_set.motion.bones[target_bone_name][fno]
+            bf = data_set.motion.own_bone_frames(target_bone_name)[fno]
 
             # 元々の親bf
             org_parent_bf = data_set.org_motion.calc_bf(target_parent_name, fno)
@@ -3739,7 +3771,7 @@ cdef class StanceService():
                 # IKONの場合、計算不要
                 continue
 
-            bf = data_set.motion.bones[target_bone_name][fno]
+            bf = data_set.motion.own_bone_frames(target_bone_name)[fno]
 
             # 元々の親bf
             org_parent_bf = data_set.org_motion.calc_bf(target_parent_name, fno)
@@ -3830,7 +3862,7 @@ cdef class StanceService():
             if bone_name in data_set.motion.bones and bone_name in data_set.org_model.bones and bone_name in data_set.rep_model.bones:
                 axis = data_set.rep_model.get_local_x_axis(bone_name)
 
-                for bf in data_set.motion.bones[bone_name].values():
+                for bf in data_set.motion.own_bone_frames(bone_name).values():
                     if bf.key:
                         # 元モデルのモーションの回転量
                         degree = bf.rotation.toDegree()
@@ -3866,7 +3898,7 @@ cdef class StanceService():
 
             if bone_name in arm_diff_qq_dic and bone_name in data_set.motion.bones:
                 # 姿势校正値がある場合
-                for bf in data_set.motion.bones[bone_name].values():
+                for bf in data_set.motion.own_bone_frames(bone_name).values():
                     if bf.key:
                         if arm_diff_qq_dic[bone_name]["from"] == MQuaternion():
                             bf.rotation = bf.rotation * arm_diff_qq_dic[bone_name]["to"]
@@ -3957,3 +3989,16 @@ cdef class StanceService():
 
         
 
+
+# プロセス並列実行用（子プロセスで1データセット分の姿势校正を行う）
+def execute_stance_process(options: MOptions, data_set_idx: int):
+    cdef StanceService service
+    cdef MOptionsDataSet data_set
+
+    MProcessUtils.init_process(options)
+
+    service = StanceService(options)
+    result = service.execute_pool(data_set_idx)
+    data_set = options.data_set_list[data_set_idx]
+
+    return result, data_set_idx, data_set.motion.bones, data_set.full_arms, options.tree_process_dict
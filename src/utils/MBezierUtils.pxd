@@ -13,14 +13,34 @@ cdef bint fit_bezier_mmd(list bzs)
 
 cdef tuple c_join_value_2_bezier(int fno, str bone_name, list values, double offset, double diff_limit)
 
+cdef tuple c_fit_value_2_bezier(int fno, str bone_name, list values, double offset, double diff_limit)
+
+cdef double fit_bezier_by_lm(double* ps, np.ndarray[np.float64_t, ndim=1] xs, np.ndarray[np.float64_t, ndim=1] us)
+
+cdef double calc_bezier_fit_cost(double* ps, np.ndarray[np.float64_t, ndim=1] xs, np.ndarray[np.float64_t, ndim=1] us, np.ndarray[np.float64_t, ndim=1] ts)
+
+cdef double calc_fit_value_max_diff(int* bz_vs, np.ndarray[np.float64_t, ndim=1] vs)
+
 cdef tuple convert_catmullrom_2_bezier(np.ndarray xs, np.ndarray ys)
 
 cdef tuple c_evaluate(int x1v, int y1v, int x2v, int y2v, int start, int now, int end)
 
+cdef double c_evaluate_y(int x1v, int y1v, int x2v, int y2v, int start, int now, int end)
+
+cdef double c_evaluate_yt(int x1v, int y1v, int x2v, int y2v, int start, int now, int end, double* rt)
+
 cdef tuple c_evaluate_by_t(int x1v, int y1v, int x2v, int y2v, int start, int end, double t)
 
+cdef tuple c_evaluate_by_ts(int x1v, int y1v, int x2v, int y2v, int start, int end, np.ndarray ts)
+
+cdef tuple c_split_bezier_mmd(int x1v, int y1v, int x2v, int y2v, int start, int now, int end)
+
+cdef bint c_is_fit_bezier_mmd(list bz, double offset)
+
 cdef tuple split_bezier(int x1v, int y1v, int x2v, int y2v, int start, int now, int end)
 
+cdef MVector2D scale_round_bezier_point(double px, double py, double p1x, double p1y, double diffx, double diffy)
+
 cdef list scale_bezier(MVector2D p1, MVector2D p2, MVector2D p3, MVector2D p4)
 
 cdef MVector2D scale_bezier_point(MVector2D pn, MVector2D p1, MVector2D diff)
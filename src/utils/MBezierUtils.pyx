@@ -6,6 +6,7 @@ import numpy as np
 cimport numpy as np
 import bezier
 cimport bezier._curve
+from libc.math cimport fabs, isnan, isinf
 
 logger = MLogger(__name__, level=1)
 
@@ -43,6 +44,9 @@ BZ_TYPE_MY = "MY"
 BZ_TYPE_MZ = "MZ"
 BZ_TYPE_R = "R"
 
+# 最小二乗法で当てはめる際の制御点の初期値（x1, y1, x2, y2）
+FIT_INITIAL_BEZIERS = [(0.25, 0.25, 0.75, 0.75), (0.5, 0, 0.5, 1), (0, 0.5, 1, 0.5), (0.75, 0.25, 0.25, 0.75), (0.25, 0.75, 0.75, 0.25)]
+
 
 def from_bz_type(bz_type: str):
     if bz_type == BZ_TYPE_MX:
@@ -284,6 +288,244 @@ cdef tuple c_join_value_2_bezier(int fno, str bone_name, list values, double off
         return (None, [])
 
 
+# 指定したすべての値を最小二乗法で1つのMMD補間曲線に当てはめ、許容範囲内に収まった場合、その補間曲線を返す
+# 戻り値は join_value_2_bezier と同じ（補間曲線、差が大きいINDEXリスト）
+def fit_value_2_bezier(fno: int, bone_name: str, values: list, offset=0, diff_limit=0.01):
+    return_tuple = c_fit_value_2_bezier(fno, bone_name, values, offset, diff_limit)
+    return return_tuple[0], return_tuple[1]
+
+cdef tuple c_fit_value_2_bezier(int fno, str bone_name, list values, double offset, double diff_limit):
+    if len(values) <= 2:
+        # 次数が1の場合、線形補間
+        return (LINEAR_MMD_INTERPOLATION, [])
+
+    cdef int n = len(values)
+    cdef np.ndarray[np.float64_t, ndim=1] vs = np.array(values, dtype=np.float64)
+    cdef np.ndarray[np.float64_t, ndim=1] xs = np.linspace(0, 1, n)
+    cdef np.ndarray[np.float64_t, ndim=1] us = np.zeros(n, dtype=np.float64)
+    cdef np.ndarray[np.float64_t, ndim=1] diff_vs = np.zeros(n, dtype=np.float64)
+    cdef double limit = diff_limit * (offset + 1)
+    cdef double start_v = vs[0]
+    cdef double end_v = vs[n - 1]
+    cdef double diff_v = end_v - start_v
+    cdef double[4] ps
+    cdef int[4] bz_vs
+    cdef int[4] best_bz_vs
+    cdef double max_diff, next_diff
+    cdef double best_max_diff = -1
+    cdef int i, pidx, bz_idx, step, prev_v, x1v, y1v, x2v, y2v
+    cdef bint is_improved = True
+
+    # 線形補間で収まる場合、そのまま線形補間
+    for i in range(n):
+        diff_vs[i] = fabs(start_v + diff_v * xs[i] - vs[i])
+
+    if np.max(diff_vs) <= limit:
+        return (LINEAR_MMD_INTERPOLATION, [])
+
+    if fabs(diff_v) < 1e-10:
+        # 始点と終点が同じで線形補間に収まらない場合、補間曲線では表せない
+        return (None, np.where(diff_vs > limit)[0].tolist())
+
+    # 始点を0、終点を1とした値
+    for i in range(n):
+        us[i] = (vs[i] - start_v) / diff_v
+
+    # 初期値を変えて当てはめ、MMD用の数値に丸めた後の差が最も小さい制御点を採用する
+    for (ps[0], ps[1], ps[2], ps[3]) in FIT_INITIAL_BEZIERS:
+        fit_bezier_by_lm(ps, xs, us)
+        for pidx in range(4):
+            bz_vs[pidx] = round_integer(ps[pidx] * INTERPOLATION_MMD_MAX)
+
+        max_diff = calc_fit_value_max_diff(bz_vs, vs)
+        if best_max_diff < 0 or max_diff < best_max_diff:
+            best_max_diff = max_diff
+            for pidx in range(4):
+                best_bz_vs[pidx] = bz_vs[pidx]
+
+        if best_max_diff <= limit:
+            # 許容範囲内に収まった場合、終了
+            break
+
+    # 丸めた制御点の周辺で、MMDでの補間結果と元の値との差が最も小さくなる制御点を探す
+    for pidx in range(4):
+        bz_vs[pidx] = best_bz_vs[pidx]
+    max_diff = best_max_diff
+
+    while is_improved and max_diff > limit:
+        is_improved = False
+        for bz_idx in range(4):
+            for step in (-1, 1):
+                prev_v = bz_vs[bz_idx]
+                if not 0 <= prev_v + step <= INTERPOLATION_MMD_MAX:
+                    continue
+
+                bz_vs[bz_idx] = prev_v + step
+                next_diff = calc_fit_value_max_diff(bz_vs, vs)
+                if next_diff < max_diff:
+                    max_diff = next_diff
+                    is_improved = True
+                else:
+                    bz_vs[bz_idx] = prev_v
+
+    x1v, y1v, x2v, y2v = bz_vs[0], bz_vs[1], bz_vs[2], bz_vs[3]
+
+    if x1v == y1v == x2v == y2v == 0:
+        # 全部0なら不整合
+        return (None, [])
+
+    # MMDでの補間結果と元の値との差
+    for i in range(1, n - 1):
+        diff_vs[i] = fabs(start_v + diff_v * c_evaluate_y(x1v, y1v, x2v, y2v, 0, i, n - 1) - vs[i])
+    diff_vs[0] = diff_vs[n - 1] = 0
+
+    logger.debug("f: %s, %s, values: %s, fit: (%s, %s), (%s, %s), diff_vs: %s, limit: %s", fno, bone_name, values, x1v, y1v, x2v, y2v, diff_vs, limit)
+
+    if np.max(diff_vs) > limit:
+        # 差が大きい箇所がある場合、NG
+        return (None, np.where(diff_vs > limit)[0].tolist())
+
+    return ([MVector2D(0, 0), MVector2D(x1v, y1v), MVector2D(x2v, y2v), MVector2D(INTERPOLATION_MMD_MAX, INTERPOLATION_MMD_MAX)], [])
+
+
+# 3次ベジェ曲線の1成分（始点0、終点1）
+cdef inline double calc_bezier_value(double t, double p1, double p2):
+    cdef double s = 1 - t
+    return 3 * s * s * t * p1 + 3 * s * t * t * p2 + t * t * t
+
+# 3次ベジェ曲線の1成分の微分
+cdef inline double calc_bezier_derivative(double t, double p1, double p2):
+    cdef double s = 1 - t
+    return 3 * s * s * p1 + 6 * s * t * (p2 - p1) + 3 * t * t * (1 - p2)
+
+
+# MMD補間曲線（xからtを求めて、tからyを求める）を、レーベンバーグ・マーカート法で値に当てはめる
+# ps: 制御点（x1, y1, x2, y2）の初期値。当てはめ結果で上書きする
+# 戻り値は、当てはめ結果の二乗誤差
+cdef double fit_bezier_by_lm(double* ps, np.ndarray[np.float64_t, ndim=1] xs, np.ndarray[np.float64_t, ndim=1] us):
+    cdef int n = xs.shape[0]
+    cdef np.ndarray[np.float64_t, ndim=1] ts = xs.copy()
+    cdef double[4] next_ps
+    cdef double[4] jrow
+    cdef double[16] jtj
+    cdef double[4] jtr
+    cdef double[20] mat
+    cdef double cost = calc_bezier_fit_cost(ps, xs, us, ts)
+    cdef double next_cost, damping = 0.001
+    cdef double t, r, dx, dy, pivot, factor
+    cdef int iteration, i, a, b, c, row
+
+    for iteration in range(50):
+        for a in range(16):
+            jtj[a] = 0
+        for a in range(4):
+            jtr[a] = 0
+
+        # ヤコビアン（yはtを介してxの制御点にも依存する）
+        for i in range(1, n - 1):
+            t = ts[i]
+            r = calc_bezier_value(t, ps[1], ps[3]) - us[i]
+            dx = calc_bezier_derivative(t, ps[0], ps[2])
+            dy = calc_bezier_derivative(t, ps[1], ps[3])
+            jrow[1] = 3 * (1 - t) * (1 - t) * t
+            jrow[3] = 3 * (1 - t) * t * t
+            if dx > 1e-9:
+                jrow[0] = -dy * jrow[1] / dx
+                jrow[2] = -dy * jrow[3] / dx
+            else:
+                jrow[0] = jrow[2] = 0
+
+            for a in range(4):
+                jtr[a] += jrow[a] * r
+                for b in range(4):
+                    jtj[a * 4 + b] += jrow[a] * jrow[b]
+
+        # (JtJ + λdiag(JtJ)) δ = -Jtr をガウスの消去法で解く
+        for a in range(4):
+            for b in range(4):
+                mat[a * 5 + b] = jtj[a * 4 + b] + (damping * (jtj[a * 4 + a] + 1e-12) if a == b else 0)
+            mat[a * 5 + 4] = -jtr[a]
+
+        for c in range(4):
+            row = c
+            for a in range(c + 1, 4):
+                if fabs(mat[a * 5 + c]) > fabs(mat[row * 5 + c]):
+                    row = a
+            if row != c:
+                for b in range(5):
+                    mat[c * 5 + b], mat[row * 5 + b] = mat[row * 5 + b], mat[c * 5 + b]
+            pivot = mat[c * 5 + c]
+            if fabs(pivot) < 1e-15:
+                return cost
+            for a in range(c + 1, 4):
+                factor = mat[a * 5 + c] / pivot
+                for b in range(c, 5):
+                    mat[a * 5 + b] -= factor * mat[c * 5 + b]
+
+        for c in range(3, -1, -1):
+            next_ps[c] = mat[c * 5 + 4]
+            for b in range(c + 1, 4):
+                next_ps[c] -= mat[c * 5 + b] * next_ps[b]
+            next_ps[c] /= mat[c * 5 + c]
+
+        for a in range(4):
+            # MMD補間曲線の範囲内に収める
+            next_ps[a] = min(1, max(0, ps[a] + next_ps[a]))
+
+        next_cost = calc_bezier_fit_cost(next_ps, xs, us, ts)
+
+        if next_cost < cost:
+            for a in range(4):
+                ps[a] = next_ps[a]
+            if cost - next_cost < 1e-14:
+                cost = next_cost
+                break
+            cost = next_cost
+            damping = max(1e-7, damping * 0.3)
+        else:
+            # 戻して減衰を強める
+            calc_bezier_fit_cost(ps, xs, us, ts)
+            damping *= 10
+            if damping > 1e8:
+                break
+
+    return cost
+
+
+# 各xに対応するtを二分法で求めて（tsに保持）、yとの二乗誤差を返す
+cdef double calc_bezier_fit_cost(double* ps, np.ndarray[np.float64_t, ndim=1] xs, np.ndarray[np.float64_t, ndim=1] us, np.ndarray[np.float64_t, ndim=1] ts):
+    cdef int n = xs.shape[0]
+    cdef int i, j
+    cdef double low, high, t, cost = 0
+
+    for i in range(1, n - 1):
+        low = 0
+        high = 1
+        for j in range(24):
+            t = (low + high) / 2
+            if calc_bezier_value(t, ps[0], ps[2]) > xs[i]:
+                high = t
+            else:
+                low = t
+        t = (low + high) / 2
+        ts[i] = t
+        cost += (calc_bezier_value(t, ps[1], ps[3]) - us[i]) ** 2
+
+    return cost
+
+
+# MMDでの補間結果と元の値との差の最大値
+cdef double calc_fit_value_max_diff(int* bz_vs, np.ndarray[np.float64_t, ndim=1] vs):
+    cdef int n = vs.shape[0]
+    cdef int i
+    cdef double max_diff = 0
+
+    for i in range(1, n - 1):
+        max_diff = max(max_diff, fabs(vs[0] + (vs[n - 1] - vs[0]) * c_evaluate_y(bz_vs[0], bz_vs[1], bz_vs[2], bz_vs[3], 0, i, n - 1) - vs[i]))
+
+    return max_diff
+
+
 cdef bint fit_bezier_mmd(list bzs):
     for bz in bzs:
         bz.effective()
@@ -393,14 +635,53 @@ cdef tuple c_evaluate(int x1v, int y1v, int x2v, int y2v, int start, int now, in
     if (now - start) == 0 or (end - start) == 0:
         return (0, 0, 0)
     
+    cdef double x, y, t
+
+    x = (now - start) / (end - start)
+    y = c_evaluate_yt(x1v, y1v, x2v, y2v, start, now, end, &t)
+
+    return (x, y, t)
+
+
+# 補間曲線の評価結果のキャッシュ（直接マップ方式）
+# 制御点とフレーム差が同じであれば結果も同じなので、二分法の結果を使い回す
+DEF EVALUATE_CACHE_SIZE = 65536
+cdef unsigned long long evaluate_cache_keys[EVALUATE_CACHE_SIZE]
+cdef double evaluate_cache_ys[EVALUATE_CACHE_SIZE]
+cdef double evaluate_cache_ts[EVALUATE_CACHE_SIZE]
+
+# 補間曲線のyだけを求める
+cdef double c_evaluate_y(int x1v, int y1v, int x2v, int y2v, int start, int now, int end):
+    cdef double t
+    return c_evaluate_yt(x1v, y1v, x2v, y2v, start, now, end, &t)
+
+cdef double c_evaluate_yt(int x1v, int y1v, int x2v, int y2v, int start, int now, int end, double* rt):
+    if (now - start) == 0 or (end - start) == 0:
+        rt[0] = 0
+        return 0
+
     cdef double x, x1, x2, y1, y2, t, s, ft, y
     cdef int i
+    cdef unsigned long long key = 0
+    cdef unsigned int cache_idx = 0
+
+    if 0 <= x1v < 256 and 0 <= y1v < 256 and 0 <= x2v < 256 and 0 <= y2v < 256 and 0 < (now - start) < 32768 and 0 < (end - start) < 32768:
+        # 制御点(各8bit)とフレーム差(各15bit)をキーにする（最上位bitは有効フラグ）
+        key = (1ULL << 63) | (<unsigned long long>x1v << 54) | (<unsigned long long>y1v << 46) | (<unsigned long long>x2v << 38) \
+            | (<unsigned long long>y2v << 30) | (<unsigned long long>(now - start) << 15) | <unsigned long long>(end - start)
+        cache_idx = <unsigned int>((key * 11400714819323198485ULL) >> 48)
+
+        if evaluate_cache_keys[cache_idx] == key:
+            rt[0] = evaluate_cache_ts[cache_idx]
+            return evaluate_cache_ys[cache_idx]
         
+    cdef double interpolation_max = INTERPOLATION_MMD_MAX
+
     x = (now - start) / (end - start)
-    x1 = x1v / INTERPOLATION_MMD_MAX
-    x2 = x2v / INTERPOLATION_MMD_MAX
-    y1 = y1v / INTERPOLATION_MMD_MAX
-    y2 = y2v / INTERPOLATION_MMD_MAX
+    x1 = x1v / interpolation_max
+    x2 = x2v / interpolation_max
+    y1 = y1v / interpolation_max
+    y2 = y2v / interpolation_max
 
     t = 0.5
     s = 0.5
@@ -422,7 +703,13 @@ cdef tuple c_evaluate(int x1v, int y1v, int x2v, int y2v, int start, int now, in
 
     # logger.test("y: %s, t: %s, s: %s", y, t, s)
 
-    return (x, y, t)
+    if key:
+        evaluate_cache_keys[cache_idx] = key
+        evaluate_cache_ys[cache_idx] = y
+        evaluate_cache_ts[cache_idx] = t
+
+    rt[0] = t
+    return y
 
 
 # 指定されたtになるフレーム番号を取得する
@@ -435,45 +722,69 @@ cdef tuple c_evaluate_by_t(int x1v, int y1v, int x2v, int y2v, int start, int en
         # 差が1以内の場合、終了
         return (start, 0, t)
     
-    cdef double x1, x2, y1, y2
+    cdef double x, y
     cdef int fno
 
-    x1 = x1v / INTERPOLATION_MMD_MAX
-    x2 = x2v / INTERPOLATION_MMD_MAX
-    y1 = y1v / INTERPOLATION_MMD_MAX
-    y2 = y2v / INTERPOLATION_MMD_MAX
-
-    # 補間曲線
-    curve1 = bezier.Curve(np.asfortranarray([[0, x1, x2, 1], [0, y1, y2, 1]]), degree=3)
-
-    # 単一の評価(x, y)
-    es = curve1.evaluate(t)
+    # 補間曲線の単一の評価(x, y)
+    x = calc_bezier_value(t, x1v / INTERPOLATION_MMD_MAX, x2v / INTERPOLATION_MMD_MAX)
+    y = calc_bezier_value(t, y1v / INTERPOLATION_MMD_MAX, y2v / INTERPOLATION_MMD_MAX)
 
     # xに相当するフレーム番号
-    fno = int(round_integer(start + ((end - start) * es[0, 0])))
+    fno = int(round_integer(start + ((end - start) * x)))
     
-    return (fno, es[1, 0], t)
+    return (fno, y, t)
+
+
+# 指定された複数のtになるフレーム番号とyをまとめて取得する
+def evaluate_by_ts(x1v: int, y1v: int, x2v: int, y2v: int, start: int, end: int, ts):
+    return c_evaluate_by_ts(x1v, y1v, x2v, y2v, start, end, np.asarray(ts, dtype=np.float64))
+
+cdef tuple c_evaluate_by_ts(int x1v, int y1v, int x2v, int y2v, int start, int end, np.ndarray ts):
+    cdef np.ndarray[np.float64_t, ndim=1] c_ts = ts
+    cdef int n = c_ts.shape[0]
+    cdef np.ndarray[np.int_t, ndim=1] fnos = np.full(n, start, dtype=np.int)
+    cdef np.ndarray[np.float64_t, ndim=1] ys = np.zeros(n, dtype=np.float64)
+    cdef double x1 = x1v / INTERPOLATION_MMD_MAX
+    cdef double x2 = x2v / INTERPOLATION_MMD_MAX
+    cdef double y1 = y1v / INTERPOLATION_MMD_MAX
+    cdef double y2 = y2v / INTERPOLATION_MMD_MAX
+    cdef int i
+
+    if (end - start) <= 1:
+        # 差が1以内の場合、終了
+        return (fnos, ys)
+
+    for i in range(n):
+        fnos[i] = round_integer(start + ((end - start) * calc_bezier_value(c_ts[i], x1, x2)))
+        ys[i] = calc_bezier_value(c_ts[i], y1, y2)
+
+    return (fnos, ys)
 
 
 # 3次ベジェ曲線の分割
 def split_bezier_mmd(x1v: int, y1v: int, x2v: int, y2v: int, start: int, now: int, end: int):
+    return c_split_bezier_mmd(x1v, y1v, x2v, y2v, start, now, end)
+
+cdef tuple c_split_bezier_mmd(int x1v, int y1v, int x2v, int y2v, int start, int now, int end):
     if (now - start) == 0 or (end - start) == 0:
         return 0, 0, 0, False, False, LINEAR_MMD_INTERPOLATION, LINEAR_MMD_INTERPOLATION
 
     # 3次ベジェ曲線を分割する
-    return_tuple = split_bezier(x1v, y1v, x2v, y2v, start, now, end)
-    x = return_tuple[0]
-    y = return_tuple[1]
-    t = return_tuple[2]
-    before_bz = return_tuple[3]
-    after_bz = return_tuple[4]
+    cdef tuple return_tuple = split_bezier(x1v, y1v, x2v, y2v, start, now, end)
+    cdef list before_bz = return_tuple[3]
+    cdef list after_bz = return_tuple[4]
 
     # ベジェ曲線の値がMMD用に合っているかを加味して返す
-    return x, y, t, is_fit_bezier_mmd(before_bz), is_fit_bezier_mmd(after_bz), before_bz, after_bz
+    return return_tuple[0], return_tuple[1], return_tuple[2], c_is_fit_bezier_mmd(before_bz, 0), c_is_fit_bezier_mmd(after_bz, 0), before_bz, after_bz
 
 
 # ベジェ曲線の値がMMD用に合っているか
 def is_fit_bezier_mmd(bz: list, offset=0):
+    return c_is_fit_bezier_mmd(bz, offset)
+
+cdef bint c_is_fit_bezier_mmd(list bz, double offset):
+    cdef MVector2D b
+
     for b in bz:
         if not (0 - offset <= b.x() <= INTERPOLATION_MMD_MAX + offset) or not (0 - offset <= b.y() <= INTERPOLATION_MMD_MAX + offset):
             # MMD用の範囲内でなければNG
@@ -490,32 +801,62 @@ def is_fit_bezier_mmd(bz: list, offset=0):
 # http://geom.web.fc2.com/geometry/bezier/cut-cb.html
 cdef tuple split_bezier(int x1v, int y1v, int x2v, int y2v, int start, int now, int end):
     # 補間曲線の進んだ時間分を求める
-    return_tuple = c_evaluate(x1v, y1v, x2v, y2v, start, now, end)
-    cdef double x = return_tuple[0]
-    cdef double y = return_tuple[1]
-    cdef double t = return_tuple[2]
-
-    cdef MVector2D A = MVector2D(0.0, 0.0)
-    cdef MVector2D B = MVector2D(x1v / INTERPOLATION_MMD_MAX, y1v / INTERPOLATION_MMD_MAX)
-    cdef MVector2D C = MVector2D(x2v / INTERPOLATION_MMD_MAX, y2v / INTERPOLATION_MMD_MAX)
-    cdef MVector2D D = MVector2D(1.0, 1.0)
-
-    cdef MVector2D E = A * (1 - t) + B * t
-    cdef MVector2D F = B * (1 - t) + C * t
-    cdef MVector2D G = C * (1 - t) + D * t
-    cdef MVector2D H = E * (1 - t) + F * t
-    cdef MVector2D I = F * (1 - t) + G * t # noqa
-    cdef MVector2D J = H * (1 - t) + I * t
+    cdef double x = 0
+    cdef double y = 0
+    cdef double t = 0
+
+    if (now - start) != 0 and (end - start) != 0:
+        x = (now - start) / (end - start)
+        y = c_evaluate_yt(x1v, y1v, x2v, y2v, start, now, end, &t)
+
+    # ド・カステリョのアルゴリズムで、tの位置で分割する
+    cdef double interpolation_max = INTERPOLATION_MMD_MAX
+    cdef double ax = 0.0, ay = 0.0
+    cdef double bx = x1v / interpolation_max, by = y1v / interpolation_max
+    cdef double cx = x2v / interpolation_max, cy = y2v / interpolation_max
+    cdef double dx = 1.0, dy = 1.0
+
+    cdef double ex = ax * (1 - t) + bx * t, ey = ay * (1 - t) + by * t
+    cdef double fx = bx * (1 - t) + cx * t, fy = by * (1 - t) + cy * t
+    cdef double gx = cx * (1 - t) + dx * t, gy = cy * (1 - t) + dy * t
+    cdef double hx = ex * (1 - t) + fx * t, hy = ey * (1 - t) + fy * t
+    cdef double ix = fx * (1 - t) + gx * t, iy = fy * (1 - t) + gy * t
+    cdef double jx = hx * (1 - t) + ix * t, jy = hy * (1 - t) + iy * t
 
     # 新たな4つのベジェ曲線の制御点は、A側がAEHJ、C側がJIGDとなる。
 
     # スケーリング
-    cdef list beforeBz = scale_bezier(A, E, H, J)
-    cdef list afterBz = scale_bezier(J, I, G, D)
+    cdef list beforeBz = [scale_round_bezier_point(ax, ay, ax, ay, jx - ax, jy - ay), scale_round_bezier_point(ex, ey, ax, ay, jx - ax, jy - ay), \
+                          scale_round_bezier_point(hx, hy, ax, ay, jx - ax, jy - ay), scale_round_bezier_point(jx, jy, ax, ay, jx - ax, jy - ay)]
+    cdef list afterBz = [scale_round_bezier_point(jx, jy, jx, jy, dx - jx, dy - jy), scale_round_bezier_point(ix, iy, jx, jy, dx - jx, dy - jy), \
+                         scale_round_bezier_point(gx, gy, jx, jy, dx - jx, dy - jy), scale_round_bezier_point(dx, dy, jx, jy, dx - jx, dy - jy)]
 
     return (x, y, t, beforeBz, afterBz)
 
 
+# 分割したベジェの1点をスケーリングして、MMD用の数値に丸める（scale_bezier_point + round_bezier_mmd）
+cdef MVector2D scale_round_bezier_point(double px, double py, double p1x, double p1y, double diffx, double diffy):
+    cdef double sx = calc_scale_bezier_value(px, p1x, diffx)
+    cdef double sy = calc_scale_bezier_value(py, p1y, diffy)
+
+    cdef double interpolation_max = INTERPOLATION_MMD_MAX
+
+    return MVector2D(round_integer(sx * interpolation_max), round_integer(sy * interpolation_max))
+
+cdef inline double calc_scale_bezier_value(double pn, double p1, double diff):
+    cdef double s
+
+    if diff == 0:
+        # nanになったら0決め打ち
+        return 0
+
+    s = (pn - p1) / diff
+    if isnan(s) or isinf(s):
+        return 0
+
+    return s
+
+
 # 分割したベジェのスケーリング
 cdef list scale_bezier(MVector2D p1, MVector2D p2, MVector2D p3, MVector2D p4):
     cdef MVector2D diff = p4 - p1
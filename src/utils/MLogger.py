@@ -2,6 +2,7 @@
 #
 from datetime import datetime
 import logging
+import logging.handlers
 import traceback
 import threading
 import sys
@@ -30,9 +31,16 @@ class MLogger():
     ERROR = logging.ERROR
     CRITICAL = logging.CRITICAL
     
+    # ファイル出力をまとめて書き込む件数（警告以上は即時書き込み）
+    FILE_BUFFER_CAPACITY = 1000
+
     total_level = logging.INFO
     is_file = False
     outout_datetime = ""
+    # 停止命令が出たか（出ていない間は、スレッド毎の停止命令を確認しない）
+    is_killed = False
+    # 出力ログパス：ファイルハンドラ（出力ログ毎に一度だけ開く）
+    file_handlers = {}
     
     logger = None
 
@@ -61,6 +69,11 @@ class MLogger():
             if isinstance(f, logging.StreamHandler):
                 f.setStream(options.monitor)
 
+    # 指定レベルのログが出力対象であるか
+    # 出力しない場合にメッセージの材料を計算しないよう、呼び出し元で事前に確認する
+    def is_enabled_for(self, level):
+        return self.total_level <= level and self.default_level <= level
+
     def time(self, msg, *args, **kwargs):
         if not kwargs:
             kwargs = {}
@@ -150,26 +163,25 @@ class MLogger():
     # 実際に出力する実態
     def print_logger(self, msg, *args, **kwargs):
 
-        if "is_killed" in threading.current_thread()._kwargs and threading.current_thread()._kwargs["is_killed"]:
+        if MLogger.is_killed and is_killed_thread():
             # 停止命令が出ている場合、エラー
             raise MKilledException()
 
         target_level = kwargs.pop("level", logging.INFO)
         # if self.logger.isEnabledFor(target_level) and self.default_level <= target_level:
-        if self.total_level <= target_level and self.default_level <= target_level:
+        if self.is_enabled_for(target_level):
 
             if self.is_file:
-                for f in self.logger.handlers:
-                    if isinstance(f, logging.FileHandler):
-                        # 既存のファイルハンドラはすべて削除
-                        self.logger.removeHandler(f)
-
-                # ファイル出力ありの場合、ハンドラ紐付け
-                # ファイル出力ハンドラ
-                fh = logging.FileHandler("log/VmdSizing_{0}.log".format(self.outout_datetime))
-                fh.setLevel(self.default_level)
-                fh.setFormatter(logging.Formatter(self.DEFAULT_FORMAT))
-                self.logger.addHandler(fh)
+                # ファイル出力ありの場合、出力ログのハンドラ紐付け
+                fh = MLogger.get_file_handler(self.outout_datetime)
+
+                if fh not in self.logger.handlers:
+                    for f in list(self.logger.handlers):
+                        if isinstance(f, logging.handlers.MemoryHandler):
+                            # 別の出力ログのハンドラは削除
+                            self.logger.removeHandler(f)
+
+                    self.logger.addHandler(fh)
 
             # モジュール名を出力するよう追加
             extra_args = {}
@@ -264,6 +276,30 @@ class MLogger():
         
         return "\n".join(msg_block)
 
+    # 出力ログのファイルハンドラ
+    # ファイルは最初の書き込み時に一度だけ開き、バッファに溜めてまとめて書き込む
+    @classmethod
+    def get_file_handler(cls, outout_datetime):
+        file_path = "log/VmdSizing_{0}.log".format(outout_datetime)
+
+        if file_path not in cls.file_handlers:
+            fh = logging.FileHandler(file_path, delay=True)
+            fh.setFormatter(logging.Formatter(cls.DEFAULT_FORMAT))
+            cls.file_handlers[file_path] = logging.handlers.MemoryHandler(cls.FILE_BUFFER_CAPACITY, flushLevel=logging.WARNING, target=fh)
+
+        return cls.file_handlers[file_path]
+
+    # バッファに溜まっているログをファイルに書き込む
+    @classmethod
+    def flush(cls):
+        for fh in cls.file_handlers.values():
+            fh.flush()
+
+    # 停止命令を出す（各スレッドへの停止命令と合わせて呼び出す）
+    @classmethod
+    def kill(cls):
+        cls.is_killed = True
+
     @classmethod
     def initialize(cls, level=logging.INFO, is_file=False):
         # logging.basicConfig(level=level)
@@ -273,6 +309,11 @@ class MLogger():
         cls.outout_datetime = "{0:%Y%m%d_%H%M%S}".format(datetime.now())
 
 
+# 現在のスレッドに停止命令が出ているか
+def is_killed_thread():
+    return "is_killed" in threading.current_thread()._kwargs and threading.current_thread()._kwargs["is_killed"]
+
+
 @cython.ccall
 def print_message(msg: str, target_level: int):
     sys.stdout.write(msg + "\n", (target_level < MLogger.INFO))
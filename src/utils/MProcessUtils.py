@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+#
+import sys
+import copy
+import queue
+import threading
+import multiprocessing
+import concurrent.futures
+from concurrent.futures import ProcessPoolExecutor
+
+from module.MOptions import MOptions
+from utils.MLogger import MLogger # noqa
+from utils.MException import MKilledException
+
+logger = MLogger(__name__)
+
+
+# 子プロセスの出力を親プロセスに中継するストリーム
+class MProcessStream():
+
+    def __init__(self, process_queue, kind):
+        self.process_queue = process_queue
+        self.kind = kind
+
+    def write(self, text, *args):
+        self.process_queue.put((self.kind, text))
+
+    def flush(self):
+        pass
+
+
+# 処理をプロセスプールで実行する
+# tasks: (関数, 処理対象データセットINDEXリスト, 追加引数) のリスト
+# 関数には、処理対象データセットのみを持つオプションと追加引数が渡される
+def execute_process_pool(options: MOptions, max_workers: int, tasks: list):
+    with multiprocessing.Manager() as manager:
+        process_queue = manager.Queue()
+
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = []
+            for func, data_set_idxs, args in tasks:
+                futures.append(executor.submit(execute_process_task, func, create_process_options(options, data_set_idxs, process_queue), *args))
+
+            wait_process_futures(options, executor, futures, process_queue)
+
+        # 残っている出力を中継
+        relay_process_queue(options, process_queue)
+
+    return futures
+
+
+# 子プロセスで処理を実行する
+def execute_process_task(func, options: MOptions, *args):
+    try:
+        return func(options, *args)
+    finally:
+        # 子プロセスは後処理なしで終了するので、バッファに溜まっているログをここで書き込む
+        MLogger.flush()
+
+
+# 子プロセス用のオプションを生成する（処理対象データセット以外は渡さない）
+def create_process_options(options: MOptions, data_set_idxs: list, process_queue):
+    data_set_list = [(data_set if data_set_idx in data_set_idxs else None) for data_set_idx, data_set in enumerate(options.data_set_list)]
+
+    return MOptions(\
+        version_name=options.version_name, \
+        logging_level=options.logging_level, \
+        max_workers=options.max_workers, \
+        data_set_list=data_set_list, \
+        arm_options=options.arm_options, \
+        camera_motion=None, \
+        camera_output_vmd_path=options.camera_output_vmd_path, \
+        is_sizing_camera_only=options.is_sizing_camera_only, \
+        camera_length=options.camera_length, \
+        monitor=MProcessStream(process_queue, "log"), \
+        is_file=options.is_file, \
+        outout_datetime=options.outout_datetime, \
+        total_process=options.total_process, \
+        now_process=options.now_process, \
+        total_process_ctrl=None, \
+        now_process_ctrl=MProcessStream(process_queue, "process"), \
+        tree_process_dict=copy.deepcopy(options.tree_process_dict), \
+        leg_options=options.leg_options, \
+        is_multi_process=False)
+
+
+# 子プロセスの初期化（ログ出力を親プロセスに中継する）
+def init_process(options: MOptions):
+    sys.stdout = options.monitor
+    MLogger.total_level = options.logging_level
+    MLogger.is_file = options.is_file
+    MLogger.outout_datetime = options.outout_datetime
+
+
+# ログと進捗を中継しながら、全プロセスの終了を待つ
+def wait_process_futures(options: MOptions, executor: ProcessPoolExecutor, futures: list, process_queue):
+    while True:
+        done, not_done = concurrent.futures.wait(futures, timeout=0.1, return_when=concurrent.futures.FIRST_EXCEPTION)
+
+        relay_process_queue(options, process_queue)
+
+        if "is_killed" in threading.current_thread()._kwargs and threading.current_thread()._kwargs["is_killed"]:
+            # 停止命令が出ている場合、子プロセスも止める
+            for f in futures:
+                f.cancel()
+
+            for p in executor._processes.values():
+                p.terminate()
+
+            raise MKilledException()
+
+        if not not_done or [f for f in done if f.exception()]:
+            # 全部終わったか、どこかでエラーが起きたら終了
+            break
+
+
+# 子プロセスからのログと進捗を中継する
+def relay_process_queue(options: MOptions, process_queue):
+    while True:
+        try:
+            kind, text = process_queue.get_nowait()
+        except queue.Empty:
+            break
+
+        if kind == "process":
+            # 進捗は親プロセスで数え直す
+            if options.now_process_ctrl:
+                options.now_process += 1
+                options.now_process_ctrl.write(str(options.now_process))
+        elif options.monitor:
+            options.monitor.write(text)
+
+
+# 子プロセスで完了した処理を、親プロセスの処理状況に反映する
+def merge_tree_process_dict(tree_process_dict: dict, process_tree_process_dict: dict):
+    for key, value in process_tree_process_dict.items():
+        if isinstance(value, dict) and isinstance(tree_process_dict.get(key, None), dict):
+            merge_tree_process_dict(tree_process_dict[key], value)
+        elif value is True:
+            tree_process_dict[key] = True
@@ -7,12 +7,24 @@ from mmd.VmdData cimport VmdMotion, VmdBoneFrame
 from module.MParams cimport BoneLinks # noqa
 from module.MMath cimport MRect, MVector2D, MVector3D, MVector4D, MQuaternion, MMatrix4x4 # noqa
 
-cdef c_calc_IK(PmxModel model, BoneLinks links, VmdMotion motion, int fno, MVector3D target_pos, BoneLinks ik_links, int max_count)
+cdef c_calc_IK(PmxModel model, BoneLinks links, VmdMotion motion, int fno, MVector3D target_pos, BoneLinks ik_links, int max_count, double tolerance=*)
+
+cdef c_calc_ik_global_pos(list link_names, list trans_vs, list add_qs, dict global_3ds_dic, dict total_mats, int start_idx)
+
+cdef set c_get_effect_bone_names(PmxModel model, str bone_name)
 
 cdef tuple c_separate_local_qq(int fno, str bone_name, MQuaternion qq, MVector3D global_x_axis)
 
 cdef tuple c_calc_global_pos(PmxModel model, BoneLinks links, VmdMotion motion, int fno, BoneLinks limit_links, bint return_matrix, bint is_local_x)
 
+cdef tuple c_copy_global_pos(dict global_3ds_dic, dict total_mats)
+
+cdef tuple c_calc_global_pos_by_fk(PmxModel model, BoneLinks links, VmdMotion motion, int fno, BoneLinks limit_links, bint is_local_x)
+
+cdef MMatrix4x4 c_calc_local_x_matrix(PmxModel model, BoneLinks links, str lname)
+
+cdef tuple c_calc_global_pos_by_fnos(PmxModel model, BoneLinks links, VmdMotion motion, list fnos, BoneLinks limit_links, bint return_matrix, bint is_local_x)
+
 cpdef dict calc_global_pos_by_direction(MQuaternion direction_qq, dict target_pos_3ds_dic)
 
 cdef list c_calc_relative_position(PmxModel model, BoneLinks links, VmdMotion motion, int fno, BoneLinks limit_links)
@@ -16,14 +16,18 @@ from utils.MLogger import MLogger # noqa
 
 logger = MLogger(__name__, level=MLogger.DEBUG)
 
+# モーション毎のFKキャッシュの上限件数
+FK_CACHE_SIZE = 10000
+
 
 # IK計算
 # target_pos: IKリンクの目的位置
 # ik_links: IKリンク
-def calc_IK(model: PmxModel, links: BoneLinks, motion: VmdMotion, fno: int, target_pos: MVector3D, ik_links: BoneLinks, max_count=10):
-    c_calc_IK(model, links, motion, fno, target_pos, ik_links, max_count)
+# tolerance: エフェクタと目的位置の距離（二乗）がこれ未満になったら終了する
+def calc_IK(model: PmxModel, links: BoneLinks, motion: VmdMotion, fno: int, target_pos: MVector3D, ik_links: BoneLinks, max_count=10, tolerance=0.0001):
+    c_calc_IK(model, links, motion, fno, target_pos, ik_links, max_count, tolerance)
 
-cdef c_calc_IK(PmxModel model, BoneLinks links, VmdMotion motion, int fno, MVector3D target_pos, BoneLinks ik_links, int max_count):
+cdef c_calc_IK(PmxModel model, BoneLinks links, VmdMotion motion, int fno, MVector3D target_pos, BoneLinks ik_links, int max_count, double tolerance=0.0001):
     cdef list bone_name_list = list(ik_links.all().keys())[1:]
     cdef str bone_name
     cdef VmdBoneFrame bf
@@ -38,6 +42,18 @@ cdef c_calc_IK(PmxModel model, BoneLinks links, VmdMotion motion, int fno, MVect
         local_z_axis = MVector3D(0, 0, -1)
         local_y_axis = MVector3D.crossProduct(local_x_axis, local_z_axis).normalized()
         bone_axis_dict[bone_name] = {"x": local_x_axis, "y": local_y_axis, "z": local_z_axis}
+
+    # IK中に変わるのは関節の回転だけなので、各リンクの相対位置・回転は最初に一度だけ求める
+    cdef list link_names = list(links.all().keys())
+    cdef list trans_vs = c_calc_relative_position(model, links, motion, fno, None)
+    cdef list add_qs = c_calc_relative_rotation(model, links, motion, fno, None)
+    # 各リンクの回転量が参照しているボーン名（自身と付与親）
+    cdef list link_effect_names = [c_get_effect_bone_names(model, links.get(bone_name).name) for bone_name in link_names]
+    cdef dict global_3ds_dic = {}
+    cdef dict total_mats = {}
+    # 行列を計算し直す必要がある最初のリンクINDEX
+    cdef int dirty_idx = 0
+    cdef int link_idx
     
     cdef MVector3D local_effector_pos
     cdef MVector3D local_target_pos
@@ -49,8 +65,6 @@ cdef c_calc_IK(PmxModel model, BoneLinks links, VmdMotion motion, int fno, MVect
     cdef int ik_idx
     cdef str joint_name
     cdef Bone ik_bone
-    cdef dict global_3ds_dic
-    cdef dict total_mats
     cdef MVector3D global_effector_pos
     cdef MMatrix4x4 joint_mat
     cdef MMatrix4x4 inv_coord
@@ -71,8 +85,9 @@ cdef c_calc_IK(PmxModel model, BoneLinks links, VmdMotion motion, int fno, MVect
             # 処理対象IKボーン
             ik_bone = ik_links.get(joint_name)
 
-            # 現在のボーングローバル位置と行列を取得
-            global_3ds_dic, total_mats = c_calc_global_pos(model, links, motion, fno, limit_links=None, return_matrix=True, is_local_x=False)
+            # 現在のボーングローバル位置と行列を取得（前回回転させた関節より子のリンクのみ計算し直す）
+            c_calc_ik_global_pos(link_names, trans_vs, add_qs, global_3ds_dic, total_mats, dirty_idx)
+            dirty_idx = len(link_names)
 
             # エフェクタ（末端）
             global_effector_pos = global_3ds_dic[ik_links.first_name()]
@@ -131,7 +146,8 @@ cdef c_calc_IK(PmxModel model, BoneLinks links, VmdMotion motion, int fno, MVect
                     y_degree = y_qq.toDegree()
                     z_degree = z_qq.toDegree()
 
-                    logger.debug("new_ik_qq: %s, x_qq: %s, y_qq: %s, z_qq: %s", new_ik_qq.toEulerAngles4MMD(), x_degree, y_degree, z_degree)
+                    if logger.is_enabled_for(MLogger.DEBUG):
+                        logger.debug("new_ik_qq: %s, x_qq: %s, y_qq: %s, z_qq: %s", new_ik_qq.toEulerAngles4MMD(), x_degree, y_degree, z_degree)
 
                     new_x_degree = min(ik_bone.ik_limit_max.x(), max(ik_bone.ik_limit_min.x(), x_degree))
                     new_y_degree = min(ik_bone.ik_limit_max.y(), max(ik_bone.ik_limit_min.y(), y_degree))
@@ -143,20 +159,76 @@ cdef c_calc_IK(PmxModel model, BoneLinks links, VmdMotion motion, int fno, MVect
 
                     new_ik_qq = y_qq * x_qq * z_qq
 
-                    logger.debug(f"yxz: {(y_qq * z_qq * x_qq).toEulerAngles4MMD()}")
+                    if logger.is_enabled_for(MLogger.DEBUG):
+                        logger.debug(f"yxz: {(y_qq * z_qq * x_qq).toEulerAngles4MMD()}")
 
-                    diff = "○" if (x_degree != new_x_degree or y_degree != new_y_degree or z_degree != new_z_degree) else "－"
-                    logger.debug(f"limit_degree: {diff}: {x_degree}, {y_degree}, {z_degree} -> {new_x_degree}, {new_y_degree}, {new_z_degree}")
-                    logger.debug(f"limit_qq: {new_ik_qq.toEulerAngles4MMD()}")
+                        diff = "○" if (x_degree != new_x_degree or y_degree != new_y_degree or z_degree != new_z_degree) else "－"
+                        logger.debug(f"limit_degree: {diff}: {x_degree}, {y_degree}, {z_degree} -> {new_x_degree}, {new_y_degree}, {new_z_degree}")
+                        logger.debug(f"limit_qq: {new_ik_qq.toEulerAngles4MMD()}")
                 
                 bf.rotation = new_ik_qq
 
+                # 関節の回転を参照しているリンクの回転量を求め直す
+                for link_idx in range(len(link_names)):
+                    if joint_name in link_effect_names[link_idx]:
+                        bf = motion.c_calc_bf(links.get(link_names[link_idx]).name, fno, is_key=False, is_read=False, is_reset_interpolation=False)
+                        add_qs[link_idx] = deform_rotation(model, motion, bf)
+                        dirty_idx = min(dirty_idx, link_idx)
+
         # 位置の差がほとんどない場合、終了
-        if (local_effector_pos - local_target_pos).lengthSquared() < 0.0001:
+        if (local_effector_pos - local_target_pos).lengthSquared() < tolerance:
             return
         
     return
 
+# IK計算用のグローバル位置と行列
+# start_idx より親のリンクは、前回の計算結果をそのまま使う
+cdef c_calc_ik_global_pos(list link_names, list trans_vs, list add_qs, dict global_3ds_dic, dict total_mats, int start_idx):
+    cdef int n
+    cdef MVector3D v
+    cdef MMatrix4x4 mat
+    cdef MMatrix4x4 mm
+
+    # 親から順に累積した行列
+    if start_idx == 0:
+        mm = MMatrix4x4()
+        mm.setToIdentity()
+    else:
+        mm = total_mats[link_names[start_idx - 1]]
+
+    for n in range(start_idx, len(link_names)):
+        v = trans_vs[n]
+
+        # 行列を生成
+        mat = MMatrix4x4()
+        mat.setToIdentity()
+        mat.translate(v)
+        mat.rotate(add_qs[n])
+
+        # 自分は、位置だけ掛ける
+        global_3ds_dic[link_names[n]] = mm * v
+
+        # 最後の行列をかけ算する
+        mm = mm * mat
+        total_mats[link_names[n]] = mm
+
+# 指定ボーンの回転量が参照しているボーン名（自身と付与親）
+cdef set c_get_effect_bone_names(PmxModel model, str bone_name):
+    cdef set bone_names = {bone_name}
+    cdef Bone bone
+    cdef int cnt = 0
+
+    if bone_name not in model.bones:
+        return bone_names
+
+    bone = model.bones[bone_name]
+    while cnt < 100 and bone.getExternalRotationFlag() and bone.effect_index in model.bone_indexes:
+        bone = model.bones[model.bone_indexes[bone.effect_index]]
+        bone_names.add(bone.name)
+        cnt += 1
+
+    return bone_names
+
 
 # クォータニオンをローカル軸の回転量に分離
 def separate_local_qq(fno: int, bone_name: str, qq: MQuaternion, global_x_axis: MVector3D):
@@ -286,81 +358,185 @@ def calc_global_pos(model: PmxModel, links: BoneLinks, motion: VmdMotion, fno: i
         return return_tuple[0], return_tuple[1]
 
 cdef tuple c_calc_global_pos(PmxModel model, BoneLinks links, VmdMotion motion, int fno, BoneLinks limit_links, bint return_matrix, bint is_local_x):
+    cdef tuple cache_key = None
+    cdef tuple cache_value
+    cdef dict global_3ds_dic
+    cdef dict total_mats
+
+    if motion.fk_cache is not None:
+        # FKキャッシュが有効な場合、同じモデル・リンク・フレームの計算結果を再利用する
+        cache_key = (id(model), tuple(links.all().keys()), fno, (tuple(limit_links.all().keys()) if limit_links else None), is_local_x)
+        cache_value = motion.fk_cache.get(cache_key, None)
+
+        # idは解放後に別のモデルで再利用されるので、キャッシュ時のモデルそのものであるかも確認する
+        # （子プロセスに渡ったキャッシュも、別オブジェクトなのでここで外れる）
+        if cache_value is not None and cache_value[2] is model:
+            # 呼び出し元で書き換えられても良いよう、コピーを返す
+            return c_copy_global_pos(cache_value[0], cache_value[1])
+
+    (global_3ds_dic, total_mats) = c_calc_global_pos_by_fk(model, links, motion, fno, limit_links, is_local_x)
+
+    if cache_key is not None:
+        if len(motion.fk_cache) >= FK_CACHE_SIZE:
+            # 上限に達した場合、一番古い結果を捨てる
+            del motion.fk_cache[next(iter(motion.fk_cache))]
+
+        # モデルを保持しておくことで、キャッシュが残っている間はidが再利用されない
+        motion.fk_cache[cache_key] = c_copy_global_pos(global_3ds_dic, total_mats) + (model,)
+
+    return (global_3ds_dic, total_mats)
+
+cdef tuple c_copy_global_pos(dict global_3ds_dic, dict total_mats):
+    cdef str lname
+
+    return ({lname: global_3ds_dic[lname].copy() for lname in global_3ds_dic.keys()}, {lname: total_mats[lname].copy() for lname in total_mats.keys()})
+
+cdef tuple c_calc_global_pos_by_fk(PmxModel model, BoneLinks links, VmdMotion motion, int fno, BoneLinks limit_links, bint is_local_x):
     # pfun = profile(c_calc_relative_position)
     # cdef list trans_vs = pfun(model, links, motion, fno, limit_links)
     cdef list trans_vs = c_calc_relative_position(model, links, motion, fno, limit_links)
     cdef list add_qs = c_calc_relative_rotation(model, links, motion, fno, limit_links)
 
-    # 行列
-    cdef list matrixs = [MMatrix4x4() for i in range(links.size())]
     cdef int n
     cdef str lname
     cdef MVector3D v
     cdef MQuaternion q
+    cdef MMatrix4x4 mat
     cdef MMatrix4x4 mm
 
+    cdef dict total_mats = {}
+    cdef dict global_3ds_dic = {}
+
+    # 親から順に累積した行列（自分より前の行列結果を掛け算したもの）
+    mm = MMatrix4x4()
+    mm.setToIdentity()
+
     for n, (lname, v, q) in enumerate(zip(links.all().keys(), trans_vs, add_qs)):
         # 行列を生成
-        mm = MMatrix4x4()
+        mat = MMatrix4x4()
         # 初期化
-        mm.setToIdentity()
+        mat.setToIdentity()
         # 移動
-        mm.translate(v)
+        mat.translate(v)
         # 回転
-        mm.rotate(q)
-        # 設定
-        matrixs[n] = mm
+        mat.rotate(q)
 
-    cdef dict total_mats = {}
-    cdef dict global_3ds_dic = {}
-
-    cdef MMatrix4x4 local_x_matrix
-    cdef MVector3D local_axis
-    cdef MQuaternion local_axis_qq
-
-    for n, (lname, v) in enumerate(zip(links.all().keys(), trans_vs)):
-        if n == 0:
-            mm = MMatrix4x4()
-            mm.setToIdentity()
-
-        for m in range(n):
-            # 最後のひとつ手前までループ
-            if m == 0:
-                # 0番目の位置を初期値とする
-                mm = matrixs[0].copy()
-            else:
-                # 自分より前の行列結果を掛け算する
-                mm *= matrixs[m]
-        
         # 自分は、位置だけ掛ける
         global_3ds_dic[lname] = mm * v
 
         # 最後の行列をかけ算する
-        total_mats[lname] = mm * matrixs[n]
+        total_mats[lname] = mm * mat
+
+        # 累積行列を自分まで進める（ローカル軸調整前の行列）
+        mm = total_mats[lname].copy()
 
         # ローカル軸の向きを調整する
         if n > 0 and is_local_x:
-            # ボーン自身にローカル軸が設定されているか
-            local_x_matrix = MMatrix4x4()
-            local_x_matrix.setToIdentity()
+            total_mats[lname] *= c_calc_local_x_matrix(model, links, lname)
 
-            local_axis_qq = MQuaternion()
+    return (global_3ds_dic, total_mats)
 
-            if model.bones[lname].local_x_vector == MVector3D():
-                # ローカル軸が設定されていない場合、計算
+# ローカル軸の向きを調整する行列
+cdef MMatrix4x4 c_calc_local_x_matrix(PmxModel model, BoneLinks links, str lname):
+    # ボーン自身にローカル軸が設定されているか
+    cdef MMatrix4x4 local_x_matrix = MMatrix4x4()
+    local_x_matrix.setToIdentity()
 
-                # 自身から親を引いた軸の向き
-                local_axis = model.bones[lname].position - links.get(lname, offset=-1).position
-                local_axis_qq = MQuaternion.fromDirection(local_axis.normalized(), MVector3D(0, 0, 1))
-            else:
-                # ローカル軸が設定されている場合、その値を採用
-                local_axis_qq = MQuaternion.fromDirection(model.bones[lname].local_x_vector.normalized(), MVector3D(0, 0, 1))
-            
-            local_x_matrix.rotate(local_axis_qq)
+    cdef MVector3D local_axis
+    cdef MQuaternion local_axis_qq = MQuaternion()
 
-            total_mats[lname] *= local_x_matrix
+    if model.bones[lname].local_x_vector == MVector3D():
+        # ローカル軸が設定されていない場合、計算
 
-    return (global_3ds_dic, total_mats)
+        # 自身から親を引いた軸の向き
+        local_axis = model.bones[lname].position - links.get(lname, offset=-1).position
+        local_axis_qq = MQuaternion.fromDirection(local_axis.normalized(), MVector3D(0, 0, 1))
+    else:
+        # ローカル軸が設定されている場合、その値を採用
+        local_axis_qq = MQuaternion.fromDirection(model.bones[lname].local_x_vector.normalized(), MVector3D(0, 0, 1))
+    
+    local_x_matrix.rotate(local_axis_qq)
+
+    return local_x_matrix
+
+
+# 複数フレームのグローバル位置一括算出
+# 戻り値：グローバル位置(フレーム数×リンク数×3)、行列(フレーム数×リンク数×4×4、return_matrix=Falseの場合None)
+# リンクの並びは links.all() の順番
+def calc_global_pos_by_fnos(model: PmxModel, links: BoneLinks, motion: VmdMotion, fnos: list, limit_links=None, return_matrix=False, is_local_x=False):
+    return_tuple = c_calc_global_pos_by_fnos(model, links, motion, list(fnos), limit_links, return_matrix, is_local_x)
+    if not return_matrix:
+        return return_tuple[0]
+    else:
+        # 行列も返す場合
+        return return_tuple[0], return_tuple[1]
+
+cdef tuple c_calc_global_pos_by_fnos(PmxModel model, BoneLinks links, VmdMotion motion, list fnos, BoneLinks limit_links, bint return_matrix, bint is_local_x):
+    cdef int fno_cnt = len(fnos)
+    cdef int link_cnt = links.size()
+    cdef int fidx, n, fno
+    cdef str lname
+    cdef MVector3D v
+    cdef MQuaternion q
+
+    # 各フレーム・各リンクの相対位置と相対回転(w, x, y, z)
+    cdef np.ndarray trans_vs = np.zeros((fno_cnt, link_cnt, 3), dtype=np.float64)
+    cdef np.ndarray add_qs = np.zeros((fno_cnt, link_cnt, 4), dtype=np.float64)
+    cdef double[:, :, :] trans_view = trans_vs
+    cdef double[:, :, :] qs_view = add_qs
+
+    for fidx, fno in enumerate(fnos):
+        for n, v in enumerate(c_calc_relative_position(model, links, motion, fno, limit_links)):
+            trans_view[fidx, n, 0] = v.x()
+            trans_view[fidx, n, 1] = v.y()
+            trans_view[fidx, n, 2] = v.z()
+
+        for n, q in enumerate(c_calc_relative_rotation(model, links, motion, fno, limit_links)):
+            qs_view[fidx, n, 0] = q.scalar()
+            qs_view[fidx, n, 1] = q.x()
+            qs_view[fidx, n, 2] = q.y()
+            qs_view[fidx, n, 3] = q.z()
+
+    # 各リンクのローカル行列（移動してから回転）
+    cdef np.ndarray w = add_qs[:, :, 0]
+    cdef np.ndarray x = add_qs[:, :, 1]
+    cdef np.ndarray y = add_qs[:, :, 2]
+    cdef np.ndarray z = add_qs[:, :, 3]
+    cdef np.ndarray qq_length = w * w + x * x + y * y + z * z
+
+    cdef np.ndarray local_mats = np.zeros((fno_cnt, link_cnt, 4, 4), dtype=np.float64)
+    local_mats[:, :, 0, 0] = (w * w + x * x - y * y - z * z) / qq_length
+    local_mats[:, :, 0, 1] = (2.0 * x * y - 2.0 * w * z) / qq_length
+    local_mats[:, :, 0, 2] = (2.0 * x * z + 2.0 * w * y) / qq_length
+    local_mats[:, :, 1, 0] = (2.0 * x * y + 2.0 * w * z) / qq_length
+    local_mats[:, :, 1, 1] = (w * w - x * x + y * y - z * z) / qq_length
+    local_mats[:, :, 1, 2] = (2.0 * y * z - 2.0 * w * x) / qq_length
+    local_mats[:, :, 2, 0] = (2.0 * x * z - 2.0 * w * y) / qq_length
+    local_mats[:, :, 2, 1] = (2.0 * y * z + 2.0 * w * x) / qq_length
+    local_mats[:, :, 2, 2] = (w * w - x * x - y * y + z * z) / qq_length
+    local_mats[:, :, :3, 3] = trans_vs
+    local_mats[:, :, 3, 3] = 1.0
+
+    # 親から順に全フレーム分まとめて行列を掛け合わせる
+    cdef np.ndarray total_mats = np.empty((fno_cnt, link_cnt, 4, 4), dtype=np.float64)
+    if link_cnt > 0:
+        total_mats[:, 0] = local_mats[:, 0]
+    for n in range(1, link_cnt):
+        total_mats[:, n] = np.matmul(total_mats[:, n - 1], local_mats[:, n])
+
+    # 自分の位置は、親までの行列に自分の相対位置を掛けたもの（＝自分の行列の移動成分）
+    cdef np.ndarray global_3ds = total_mats[:, :, :3, 3].copy()
+
+    if not return_matrix:
+        return (global_3ds, None)
+
+    if is_local_x:
+        # ローカル軸の向きを調整する
+        for n, lname in enumerate(links.all().keys()):
+            if n > 0:
+                total_mats[:, n] = np.matmul(total_mats[:, n], c_calc_local_x_matrix(model, links, lname).data())
+
+    return (global_3ds, total_mats)
 
 
 # 指定された方向に向いた場合の位置情報を返す
@@ -433,6 +609,8 @@ cdef list c_calc_relative_rotation(PmxModel model, BoneLinks links, VmdMotion mo
     cdef Bone link_bone
     cdef VmdBoneFrame fill_bf
     cdef MQuaternion rot
+    # デバッグログを出力するか（出力しない場合、ログ用のキーフレ計算を行わない）
+    cdef bint is_debug = logger.is_enabled_for(MLogger.DEBUG)
 
     for link_idx, link_bone_name in enumerate(links.all()):
         link_bone = links.get(link_bone_name)
@@ -445,12 +623,14 @@ cdef list c_calc_relative_rotation(PmxModel model, BoneLinks links, VmdMotion mo
             fill_bf = VmdBoneFrame(fno=fno)
             fill_bf.set_name(link_bone_name)
 
-        logger.debug(f"c_calc_relative_rotation 1 bone_name={fill_bf.name} fno={fill_bf.fno} rot={motion.calc_bf(fill_bf.name, fill_bf.fno).rotation.toEulerAngles().to_log()}")
+        if is_debug:
+            logger.debug(f"c_calc_relative_rotation 1 bone_name={fill_bf.name} fno={fill_bf.fno} rot={motion.calc_bf(fill_bf.name, fill_bf.fno).rotation.toEulerAngles().to_log()}")
 
         # 実際の回転量を計算
         rot = deform_rotation(model, motion, fill_bf)
 
-        logger.debug(f"c_calc_relative_rotation 2 bone_name={fill_bf.name} fno={fill_bf.fno} rot={motion.calc_bf(fill_bf.name, fill_bf.fno).rotation.toEulerAngles().to_log()}")
+        if is_debug:
+            logger.debug(f"c_calc_relative_rotation 2 bone_name={fill_bf.name} fno={fill_bf.fno} rot={motion.calc_bf(fill_bf.name, fill_bf.fno).rotation.toEulerAngles().to_log()}")
 
         add_qs.append(rot)
 
@@ -462,16 +642,22 @@ cpdef MQuaternion deform_rotation(PmxModel model, VmdMotion motion, VmdBoneFrame
     if bf.name not in model.bones:
         return MQuaternion()
 
-    logger.debug(f"deform_rotation 0 bone_name={bf.name} fno={bf.fno} rot={motion.calc_bf(bf.name, bf.fno).rotation.toEulerAngles().to_log()}")
+    # デバッグログを出力するか（出力しない場合、ログ用のキーフレ計算を行わない）
+    cdef bint is_debug = logger.is_enabled_for(MLogger.DEBUG)
+
+    if is_debug:
+        logger.debug(f"deform_rotation 0 bone_name={bf.name} fno={bf.fno} rot={motion.calc_bf(bf.name, bf.fno).rotation.toEulerAngles().to_log()}")
 
     cdef Bone bone = model.bones[bf.name]
     cdef MQuaternion rot = bf.rotation.normalized().copy()
 
-    logger.debug(f"deform_rotation 1 bone_name={bf.name} fno={bf.fno} rot={motion.calc_bf(bf.name, bf.fno).rotation.toEulerAngles().to_log()}")
+    if is_debug:
+        logger.debug(f"deform_rotation 1 bone_name={bf.name} fno={bf.fno} rot={motion.calc_bf(bf.name, bf.fno).rotation.toEulerAngles().to_log()}")
 
     rot = deform_fix_rotation(bf.name, bone.fixed_axis, rot)
 
-    logger.debug(f"deform_rotation 2 bone_name={bf.name} fno={bf.fno} rot={motion.calc_bf(bf.name, bf.fno).rotation.toEulerAngles().to_log()}")
+    if is_debug:
+        logger.debug(f"deform_rotation 2 bone_name={bf.name} fno={bf.fno} rot={motion.calc_bf(bf.name, bf.fno).rotation.toEulerAngles().to_log()}")
 
     cdef Bone effect_parent_bone
     cdef Bone effect_bone
@@ -509,7 +695,8 @@ cpdef MQuaternion deform_rotation(PmxModel model, VmdMotion motion, VmdBoneFrame
 
             cnt += 1
 
-    logger.debug(f"deform_rotation 3 bone_name={bf.name} fno={bf.fno} rot={motion.calc_bf(bf.name, bf.fno).rotation.toEulerAngles().to_log()}")
+    if is_debug:
+        logger.debug(f"deform_rotation 3 bone_name={bf.name} fno={bf.fno} rot={motion.calc_bf(bf.name, bf.fno).rotation.toEulerAngles().to_log()}")
 
     return rot
 
@@ -16,8 +16,9 @@ sys.path.append(str(current_dir) + '/../src/')
 from mmd.PmxReader import PmxReader # noqa
 from mmd.VmdReader import VmdReader # noqa
 from mmd.VmdWriter import VmdWriter # noqa
-from mmd.PmxData import PmxModel, Vertex, Material, Bone, Morph, DisplaySlot, RigidBody, Joint, Sdef # noqa
-from mmd.VmdData import VmdMotion, VmdBoneFrame, VmdCameraFrame, VmdInfoIk, VmdLightFrame, VmdMorphFrame, VmdShadowFrame, VmdShowIkFrame # noqa
+from mmd.PmxData import PmxModel, Vertex, Material, Bone, Morph, DisplaySlot, RigidBody, Joint, Bdef1, Sdef # noqa
+from mmd.VmdData import VmdMotion, VmdBoneFrame, VmdCameraFrame, VmdInfoIk, VmdLightFrame, VmdMorphFrame, VmdShadowFrame, VmdShowIkFrame, OneEuroFilter # noqa
+from mmd import VmdData # noqa
 from module.MMath import MRect, MVector2D, MVector3D, MVector4D, MQuaternion, MMatrix4x4 # noqa
 from module.MOptions import MOptionsDataSet # noqa
 from module.MParams import BoneLinks # noqa
@@ -428,6 +429,112 @@ class PmxDataTest(unittest.TestCase):
         print(right_wrist_vertex)
         self.assertIsNotNone(right_wrist_vertex)
 
+    def test_read_vertex_array(self):
+        pmx_path = "D:/MMD/MikuMikuDance_v926x64/UserFile/Model/_VMDサイジング/8頭身審神者 猫のしもべ/8頭身審神者3_軸制限無し.pmx"
+        model = PmxReader(pmx_path).read_data()
+        array_model = PmxReader(pmx_path, is_vertex_array=True).read_data()
+
+        # 頂点配列から生成した頂点が、頂点オブジェクトとして読み込んだ頂点と一致する
+        self.assertEqual(len(model.vertex_dict), len(array_model.vertex_positions))
+        for vertex_idx, vertex in model.vertex_dict.items():
+            self.assertEqual(str(vertex), str(array_model.get_vertex(vertex_idx)))
+
+        # ウェイトボーン毎・材質毎の頂点INDEX、面データが一致する
+        self.assertEqual(sorted(model.vertices.keys()), sorted(array_model.bone_vertex_indices.keys()))
+        for bone_idx, vertices in model.vertices.items():
+            self.assertEqual(sorted(set([v.index for v in vertices])), array_model.bone_vertex_indices[bone_idx].tolist())
+        for material_name, vertex_idxs in model.material_vertices.items():
+            self.assertEqual(sorted(set(vertex_idxs)), array_model.material_vertex_indices[material_name].tolist())
+        self.assertEqual([model.indices[iidx] for iidx in range(len(model.indices))], array_model.face_indices.tolist())
+
+        # サイジング用の頂点も一致する
+        self.assertEqual(str(model.head_top_vertex), str(array_model.head_top_vertex))
+        self.assertEqual(str(model.wrist_entity_vertex), str(array_model.wrist_entity_vertex))
+
+    def test_get_bone_end_vertex(self):
+        pmx_data = PmxModel()
+        pmx_data.bones["右手首"] = Bone("右手首", None, MVector3D(1, 0, 0), -1, 0, 0)
+        pmx_data.bones["右手首"].index = 0
+        pmx_data.bone_indexes[0] = "右手首"
+        positions = [(1, 2, 3), (1.05, -1, 2), (3, -1, 0), (1, -1, -1), (0.95, -0.95, -2), (1, 2, 3)]
+        pmx_data.vertices[0] = [Vertex(vidx, MVector3D(*pos), MVector3D(), MVector2D(), [], Bdef1(0), 1) for vidx, pos in enumerate(positions)]
+
+        up_max_pos, up_max_vertex, down_max_pos, down_max_vertex, right_max_pos, right_max_vertex, left_max_pos, left_max_vertex, \
+            back_max_pos, back_max_vertex, front_max_pos, front_max_vertex, multi_max_pos, multi_max_vertex \
+            = pmx_data.get_bone_end_vertex(["右手首"], pmx_data.def_calc_vertex_pos_original, def_is_target=pmx_data.def_is_target_x_limit, \
+                                           def_is_multi_target=pmx_data.def_is_multi_target_down_front, multi_target_default_val=MVector3D(0, 99999, 99999))
+
+        # 同じ値の場合は先の頂点、X制限外の頂点は対象外
+        self.assertEqual(0, up_max_vertex.index)
+        self.assertEqual(1, down_max_vertex.index)
+        self.assertEqual(4, right_max_vertex.index)
+        self.assertEqual(1, left_max_vertex.index)
+        self.assertEqual(0, back_max_vertex.index)
+        self.assertEqual(4, front_max_vertex.index)
+        self.assertEqual([1.05, -1, 2], left_max_pos.data().tolist())
+        # 底面かつ前面の頂点は、順に判定して最後に条件を満たした頂点
+        self.assertEqual(4, multi_max_vertex.index)
+
+    def test_get_collision_radius(self):
+        np.random.seed(7)
+
+        for shape_type in [0, 1, 2]:
+            rigidbody = RigidBody("剛体", None, 0, 0, 0, shape_type, MVector3D(1.2, 2.5, 0.8), MVector3D(0.5, 12, 1), MVector3D(0.3, -0.6, 0.9), 1, 0, 0, 0, 0, 0)
+            rigidbody.bone_name = "上半身"
+
+            bone_matrix = MMatrix4x4()
+            bone_matrix.setToIdentity()
+            bone_matrix.translate(MVector3D(0, 10, 0))
+            bone_matrix.rotate(MQuaternion.fromEulerAngles(20, -45, 10))
+
+            for base_size in [0.95, 1.2]:
+                obb = rigidbody.get_obb(0, MVector3D(0, 10, 0), {"上半身": bone_matrix}, False, True)
+                radius = rigidbody.get_collision_radius(base_size)
+
+                for _ in range(300):
+                    point = obb.origin + MVector3D(*np.random.uniform(-radius, radius, 3))
+                    (collision, near_collision, *_) = obb.get_collistion(point, MVector3D(3, 14, 0), 10, base_size)
+
+                    if collision or near_collision:
+                        # 衝突・近接している点は、必ず外接球の中にある
+                        self.assertLessEqual(point.distanceToPoint(obb.origin), radius)
+
+    def test_get_collisions(self):
+        np.random.seed(11)
+
+        for shape_type in [0, 1, 2]:
+            rigidbody = RigidBody("剛体", None, 0, 0, 0, shape_type, MVector3D(1.2, 2.5, 0.8), MVector3D(0.5, 12, 1), MVector3D(0.3, -0.6, 0.9), 1, 0, 0, 0, 0, 0)
+            rigidbody.bone_name = "上半身"
+            bone_pos = MVector3D(0, 10, 0)
+
+            bone_matrixes = []
+            points = []
+            root_global_poses = []
+            for _ in range(100):
+                bone_matrix = MMatrix4x4()
+                bone_matrix.setToIdentity()
+                bone_matrix.translate(bone_pos + MVector3D(*np.random.uniform(-1, 1, 3)))
+                bone_matrix.rotate(MQuaternion.fromEulerAngles(*np.random.uniform(-60, 60, 3)))
+                bone_matrixes.append(bone_matrix)
+
+                obb = rigidbody.get_obb(0, bone_pos, {"上半身": bone_matrix}, False, True)
+                points.append(obb.origin + MVector3D(*np.random.uniform(-3, 3, 3)))
+                root_global_poses.append(MVector3D(*np.random.uniform(-3, 3, 3)) + MVector3D(0, 13, 0))
+
+            collisions = rigidbody.get_collisions(bone_pos, np.array([m.data() for m in bone_matrixes]), np.array([p.data() for p in points]), \
+                                                  np.array([p.data() for p in root_global_poses]), 5.5, 0.95, True)
+
+            for n, (bone_matrix, point, root_global_pos) in enumerate(zip(bone_matrixes, points, root_global_poses)):
+                obb = rigidbody.get_obb(0, bone_pos, {"上半身": bone_matrix}, False, True)
+                expected = obb.get_collistion(point, root_global_pos, 5.5, 0.95)
+
+                self.assertEqual(expected[0], collisions[0][n])
+                self.assertEqual(expected[1], collisions[1][n])
+                for i in range(2, 5):
+                    self.assertAlmostEqual(expected[i], collisions[i][n], delta=1e-8)
+                for i in range(5, 8):
+                    self.assertTrue(np.allclose(expected[i].data(), collisions[i][n], atol=1e-8))
+
     def test_create_link_2_top_one_01(self):
         pmx_data = PmxModel()
         pmx_data.bones["SIZING_ROOT_BONE"] = Bone("SIZING_ROOT_BONE", "SIZING_ROOT_BONE", MVector3D(), -1, 0, 0)
@@ -722,6 +829,200 @@ class VmdDataTest(unittest.TestCase):
         self.assertAlmostEqual(bf.rotation.toEulerAngles4MMD().y(), 18.53442383, delta=0.1)
         self.assertAlmostEqual(bf.rotation.toEulerAngles4MMD().z(), 24.47537041, delta=0.1)
     
+    def test_get_bone_prev_next_fno(self):
+        motion = VmdMotion()
+        motion.last_motion_frame = 100
+        motion.bones["右腕"] = {}
+
+        for fno in [30, 0, 20, 10]:
+            bf = VmdBoneFrame(fno)
+            bf.set_name("右腕")
+            bf.key = (fno != 20)
+            motion.append_bone_frame(bf)
+
+        self.assertEqual([0, 10, 20, 30], motion.get_bone_fnos("右腕"))
+        self.assertEqual([0, 10, 30], motion.get_bone_fnos("右腕", is_key=True))
+        self.assertEqual([10, 20], motion.get_bone_fnos("右腕", start_fno=5, end_fno=25))
+        self.assertEqual((10, 30), motion.get_bone_prev_next_fno("右腕", fno=20, is_key=True))
+        self.assertEqual((10, 20), motion.get_bone_prev_next_fno("右腕", fno=15))
+        self.assertEqual((20, 101), motion.get_bone_prev_next_fno("右腕", fno=30))
+
+        # 登録・削除したキーも前後検索に反映される
+        motion.regist_bf(motion.calc_bf("右腕", 25), "右腕", 25)
+        self.assertEqual((20, 30), motion.get_bone_prev_next_fno("右腕", fno=25))
+        motion.remove_unkey_bf(0, "右腕")
+        self.assertEqual([0, 10, 25, 30], motion.get_bone_fnos("右腕"))
+
+        # 件数が変わらない追加・削除も前後検索に反映される
+        motion.set_bf("右腕", 40, motion.calc_bf("右腕", 40))
+        motion.delete_bf("右腕", 10)
+        self.assertEqual([0, 25, 30, 40], motion.get_bone_fnos("右腕"))
+        self.assertEqual((0, 25), motion.get_bone_prev_next_fno("右腕", fno=10))
+        self.assertEqual((30, 40), motion.get_bone_prev_next_fno("右腕", fno=35))
+
+        # キーフレ辞書ごと差し替えても前後検索に反映される
+        motion.bones["右腕"] = {fno: motion.bones["右腕"][fno] for fno in [0, 30]}
+        self.assertEqual((0, 30), motion.get_bone_prev_next_fno("右腕", fno=25))
+
+    def test_bone_track(self):
+        motion = VmdReader(u"test/data/補間曲線テスト01.vmd").read_data()
+        track = motion.get_bone_track("ﾎﾞｰﾝ01")
+
+        self.assertEqual(motion.get_bone_fnos("ﾎﾞｰﾝ01"), track.get_bone_fnos())
+
+        # 配列でまとめて求めた値が、キーフレ毎に求めた値と一致する
+        fnos = list(range(0, motion.last_motion_frame + 10))
+        positions, rotations = track.calc_values(fnos)
+        for fidx, fno in enumerate(fnos):
+            bf = motion.calc_bf("ﾎﾞｰﾝ01", fno)
+            self.assertEqual(bf.position.data().tolist(), positions[fidx].tolist())
+            self.assertEqual(bf.rotation.data().components.tolist(), rotations[fidx].tolist())
+            self.assertEqual(bf.interpolation, track.calc_bf(fno).interpolation)
+
+        # 補間曲線の分割も含めて、モーションへの登録と同じ結果になる
+        bf = motion.calc_bf("ﾎﾞｰﾝ01", 13)
+        bf.position.setX(3)
+        motion.regist_bf(bf.copy(), "ﾎﾞｰﾝ01", 13)
+        track.regist_bf(bf.copy(), 13)
+
+        bone_frames = track.to_frames()
+        self.assertEqual(motion.get_bone_fnos("ﾎﾞｰﾝ01"), sorted(bone_frames.keys()))
+        for fno, bf in motion.bones["ﾎﾞｰﾝ01"].items():
+            self.assertEqual(bf.position.data().tolist(), bone_frames[fno].position.data().tolist())
+            self.assertEqual(bf.interpolation, bone_frames[fno].interpolation)
+            self.assertEqual(bf.key, bone_frames[fno].key)
+
+    def test_calc_bone_values(self):
+        motion = VmdReader(u"test/data/補間曲線テスト01.vmd").read_data()
+        bone_fnos = motion.get_bone_fnos("ﾎﾞｰﾝ01")
+
+        # フレーム範囲でまとめて求めた値が、フレーム毎に求めた値と一致し、キーフレは増えない
+        fnos, positions, rotations = motion.calc_bone_values("ﾎﾞｰﾝ01", start_fno=0, end_fno=motion.last_motion_frame + 10)
+        self.assertEqual(list(range(0, motion.last_motion_frame + 11)), fnos.tolist())
+        self.assertEqual(bone_fnos, motion.get_bone_fnos("ﾎﾞｰﾝ01"))
+        for fidx, fno in enumerate(fnos):
+            bf = motion.calc_bf("ﾎﾞｰﾝ01", int(fno))
+            self.assertEqual(bf.position.data().tolist(), positions[fidx].tolist())
+            self.assertEqual(bf.rotation.data().components.tolist(), rotations[fidx].tolist())
+
+        # フレーム番号リスト指定の場合、指定順で求める
+        fnos, positions, rotations = motion.calc_bone_values("ﾎﾞｰﾝ01", fnos=[5, 3])
+        self.assertEqual([5, 3], fnos.tolist())
+        self.assertEqual(motion.calc_bf("ﾎﾞｰﾝ01", 3).position.data().tolist(), positions[1].tolist())
+
+    def test_calc_bone_values_int32(self):
+        np.random.seed(5)
+        motion = VmdMotion()
+        for fno in [0, 7, 15, 30]:
+            bf = VmdBoneFrame(fno)
+            bf.set_name("ﾎﾞｰﾝ01")
+            bf.position = MVector3D(*np.random.uniform(-5, 5, 3))
+            bf.rotation = MQuaternion.fromEulerAngles(*np.random.uniform(-90, 90, 3))
+            bf.key = True
+            bf.read = True
+            motion.regist_bf(bf, "ﾎﾞｰﾝ01", fno)
+
+        # フレーム番号がint32の配列でも求められる（INDEXはintpで扱う）
+        fnos = np.arange(0, 35, dtype=np.int32)
+        _, positions, rotations = motion.calc_bone_values("ﾎﾞｰﾝ01", fnos=fnos)
+        track_positions, track_rotations = motion.get_bone_track("ﾎﾞｰﾝ01").calc_values(fnos)
+        for fidx, fno in enumerate(fnos.tolist()):
+            bf = motion.calc_bf("ﾎﾞｰﾝ01", fno)
+            self.assertEqual(bf.position.data().tolist(), positions[fidx].tolist())
+            self.assertEqual(bf.rotation.data().components.tolist(), rotations[fidx].tolist())
+            self.assertEqual(positions[fidx].tolist(), track_positions[fidx].tolist())
+            self.assertEqual(rotations[fidx].tolist(), track_rotations[fidx].tolist())
+
+    def test_get_differ_fnos(self):
+        motion = VmdReader(u"test/data/補間曲線テスト01.vmd").read_data()
+        bone_fnos = motion.get_bone_fnos("ﾎﾞｰﾝ01", is_key=True)
+
+        for limit_degrees, limit_length in [(70, 0), (20, 1.5), (0, 0.3)]:
+            # フレーム毎に前後の値を求めて判定した結果と一致する
+            fnos = [0]
+            rot_diff = mov_diff = 0
+            for fno in range(1, bone_fnos[-1] + 2):
+                prev_bf = motion.calc_bf("ﾎﾞｰﾝ01", fno - 1)
+                bf = motion.calc_bf("ﾎﾞｰﾝ01", fno)
+                if bf.read:
+                    fnos.append(fno)
+                    rot_diff = mov_diff = 0
+                elif fno - 1 not in fnos:
+                    rot_diff += abs(prev_bf.rotation.toDegree() - bf.rotation.toDegree())
+                    if rot_diff > limit_degrees and limit_degrees > 0:
+                        fnos.append(fno)
+                        rot_diff = 0
+                    elif limit_length > 0:
+                        mov_diff += prev_bf.position.distanceToPoint(bf.position)
+                        if mov_diff > limit_length:
+                            fnos.append(fno)
+                            mov_diff = 0
+
+            self.assertEqual(sorted(set(fnos)), motion.get_differ_fnos(0, ["ﾎﾞｰﾝ01"], limit_degrees, limit_length))
+
+    def test_get_infections(self):
+        np.random.seed(3)
+        motion = VmdMotion()
+        # 先頭キーフレは単位回転ではない（先頭の次もキーフレ）
+        for fno in range(0, 30):
+            bf = VmdBoneFrame(fno)
+            bf.set_name("ﾎﾞｰﾝ01")
+            bf.position = MVector3D(*np.random.uniform(-5, 5, 3))
+            bf.rotation = MQuaternion.fromEulerAngles(*np.random.uniform(-90, 90, 3))
+            bf.key = True
+            bf.read = True
+            motion.regist_bf(bf, "ﾎﾞｰﾝ01", fno)
+
+        active_fnos = motion.get_bone_fnos("ﾎﾞｰﾝ01")
+        fnos = np.array(list(range(active_fnos[0], active_fnos[-1] + 1)), dtype=np.int)
+
+        # フレーム毎に変化量を求めた結果と一致する（先頭の次は、単位回転との差）
+        rot_diffs = []
+        mov_diffs = []
+        prev_bf = None
+        prev_rot = MQuaternion()
+        for fidx, fno in enumerate(fnos):
+            bf = motion.calc_bf("ﾎﾞｰﾝ01", int(fno))
+            if fidx == 0:
+                rot_diffs.append(0)
+                mov_diffs.append([0, 0, 0])
+            else:
+                rot_diffs.append(bf.rotation.calcTheata(prev_rot))
+                prev_rot = bf.rotation
+                mov_diffs.append((bf.position - prev_bf.position).data().tolist())
+            prev_bf = bf
+
+        value_infections = []
+        for diff_values, diff_limit in [(np.array(rot_diffs), 0.001)] + [(np.array(mov_diffs)[:, axis_idx], 0.003) for axis_idx in range(3)]:
+            indices = np.where(np.diff(np.sign(np.gradient(diff_values))))[0]
+            diff_indices = np.where(np.abs(np.diff(diff_values[indices])) > diff_limit)
+            value_infections.append(set((fnos[1:][indices])[diff_indices].tolist()))
+
+        # 回転のみ
+        infections = set([active_fnos[0], active_fnos[-1]]) | value_infections[0]
+        self.assertEqual(sorted(infections & set(active_fnos)), motion.get_infections(0, "ﾎﾞｰﾝ01", True, False, fnos, active_fnos)[0])
+
+        # 回転と移動
+        infections = infections.union(*value_infections[1:])
+        self.assertEqual(sorted(infections & set(active_fnos)), motion.get_infections(0, "ﾎﾞｰﾝ01", True, True, fnos, active_fnos)[0])
+
+    def test_filter_values(self):
+        config = {"freq": 30, "mincutoff": 0.3, "beta": 0.01, "dcutoff": 0.25}
+        values = np.random.randn(300, 3)
+        # 同じ値が続く区間（スキップ処理）も含める
+        values[100:110] = values[99]
+
+        # トラック単位でまとめてフィルタにかけた結果が、1値ずつフィルタにかけた結果と一致する
+        filtered_values = VmdData.filter_values(values, config)
+        for ci in range(3):
+            efilter = OneEuroFilter(**config)
+            self.assertEqual([efilter(v) for v in values[:, ci]], filtered_values[:, ci].tolist())
+
+        # タイムスタンプ指定ありの場合も一致する
+        fnos = np.arange(0, 600, 2)
+        efilter = OneEuroFilter(**config)
+        self.assertEqual([efilter(v, fno) for v, fno in zip(values[:, 0], fnos)], OneEuroFilter(**config).filter_values(values[:, 0], fnos).tolist())
+
     def test_vmd_output(self):
         motion = VmdReader(u"test/data/補間曲線テスト01.vmd").read_data()
         model = PmxReader("D:/MMD/MikuMikuDance_v926x64/UserFile/Model/ダミーボーン頂点追加2.pmx").read_data()
@@ -412,7 +412,32 @@ class MServiceUtilsTest(unittest.TestCase):
         self.assertAlmostEqual(pos_dic["右手首"].x(), 0.56, delta=0.1)
         self.assertAlmostEqual(pos_dic["右手首"].y(), 13.83, delta=0.1)
         self.assertAlmostEqual(pos_dic["右手首"].z(), 0.23, delta=0.1)
-                
+
+    def test_calc_global_pos_fk_cache(self):
+        def create_model(center_y):
+            model = PmxModel()
+            for bone_name, position, parent_name in [("全ての親", MVector3D(), None), ("センター", MVector3D(0, center_y, 0), "全ての親")]:
+                bone = Bone(bone_name, "", position, model.bones[parent_name].index if parent_name else -1, 0, 0x0001 | 0x0002 | 0x0008 | 0x0010)
+                bone.index = len(model.bones)
+                model.bones[bone_name] = bone
+                model.bone_indexes[bone.index] = bone_name
+            return model
+
+        motion = VmdMotion()
+        motion.start_fk_cache()
+
+        model = create_model(8)
+        self.assertEqual(8, MServiceUtils.calc_global_pos(model, model.create_link_2_top_one("センター"), motion, 0)["センター"].y())
+
+        # 解放されたモデルのidが別のモデルで再利用された状態にする
+        other_model = create_model(10)
+        for cache_key in list(motion.fk_cache.keys()):
+            motion.fk_cache[(id(other_model),) + cache_key[1:]] = motion.fk_cache.pop(cache_key)
+
+        # 別のモデルのキャッシュは使わない
+        self.assertEqual(10, MServiceUtils.calc_global_pos(other_model, other_model.create_link_2_top_one("センター"), motion, 0)["センター"].y())
+        self.assertEqual(8, MServiceUtils.calc_global_pos(model, model.create_link_2_top_one("センター"), motion, 0)["センター"].y())
+
 
 class MBezierUtilsTest(unittest.TestCase):
 
@@ -466,6 +491,35 @@ class MBezierUtilsTest(unittest.TestCase):
         self.assertAlmostEqual(y, 0.34, delta=0.01)
         self.assertAlmostEqual(t, 0.16, delta=0.01)
     
+    def test_fit_value_2_bezier(self):
+        # MMD補間曲線で補間した値は、許容範囲内の補間曲線で表せる
+        values = [2 + 5 * MBezierUtils.evaluate(104, 63, 13, 111, 0, f, 20)[1] for f in range(21)]
+        bz, inflection = MBezierUtils.fit_value_2_bezier(20, "ボーン", values, offset=0, diff_limit=0.01)
+        print("bz: %s" % bz)
+
+        self.assertIsNotNone(bz)
+        self.assertEqual([], inflection)
+        for f in range(21):
+            self.assertAlmostEqual(values[f], 2 + 5 * MBezierUtils.evaluate(int(bz[1].x()), int(bz[1].y()), int(bz[2].x()), int(bz[2].y()), 0, f, 20)[1], delta=0.01)
+
+        # 途中で跳ねている場合は表せない
+        values[10] += 1
+        bz, inflection = MBezierUtils.fit_value_2_bezier(20, "ボーン", values, offset=0, diff_limit=0.01)
+        print("inflection: %s" % inflection)
+
+        self.assertIsNone(bz)
+        self.assertIn(10, inflection)
+
+    def test_evaluate_by_ts(self):
+        ts = [0, 0.1, 0.25, 0.5, 0.75, 1]
+        fnos, ys = MBezierUtils.evaluate_by_ts(104, 63, 13, 111, 10, 40, ts)
+        print("fnos: %s" % fnos)
+        print("ys: %s" % ys)
+
+        # まとめて求めた結果は、1つずつ求めた結果と一致する
+        for t, fno, y in zip(ts, fnos, ys):
+            self.assertEqual((fno, y, t), MBezierUtils.evaluate_by_t(104, 63, 13, 111, 10, 40, t))
+
     def test_round_integer(self):
         self.assertEqual(MBezierUtils.round_integer(3.56), 4)
         self.assertEqual(MBezierUtils.round_integer(3.52), 4)